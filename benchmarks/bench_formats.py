@@ -0,0 +1,78 @@
+"""compares the size and encode/decode time of the response formats in hgvs_dataproviders_rest.formats
+
+Payloads are built from recorded /tx_exons and /tx_for_gene responses in
+tests/cassettes, repeated to the given number of rows, so that no server or
+database is needed. (The recorded /tx_for_region responses are empty;
+/tx_for_gene rows have the same shape.)
+
+    $ python benchmarks/bench_formats.py --rows 10 1000 --repeat 50
+
+"""
+
+import argparse
+import json
+import os
+import timeit
+
+import yaml
+
+from hgvs_dataproviders_rest import formats
+
+CASSETTES = os.path.join(os.path.dirname(__file__), os.pardir, "tests", "cassettes")
+
+
+def recorded_rows(cassette: str, endpoint: str) -> list:
+    """returns the rows of the first recorded response from endpoint in a test cassette"""
+    with open(os.path.join(CASSETTES, cassette)) as f:
+        interactions = yaml.safe_load(f)["interactions"]
+    for interaction in interactions:
+        if "/{}/".format(endpoint) in interaction["request"]["uri"]:
+            return json.loads(interaction["response"]["body"]["string"])
+    raise ValueError("No {} response in {}".format(endpoint, cassette))
+
+
+def payload(rows: list, n: int) -> list:
+    """returns n rows, cycling through rows"""
+    return [dict(rows[i % len(rows)]) for i in range(n)]
+
+
+def bench(value, media_type: str, repeat: int) -> dict:
+    body = formats.encode(value, media_type)
+    encode_s = min(timeit.repeat(lambda: formats.encode(value, media_type), number=1, repeat=repeat))
+    decode_s = min(timeit.repeat(lambda: formats.decode(body, media_type), number=1, repeat=repeat))
+    return {"bytes": len(body), "encode_ms": encode_s * 1e3, "decode_ms": decode_s * 1e3}
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--rows", type=int, nargs="+", default=[10, 100, 1000, 10000], help="rows per payload")
+    ap.add_argument("--repeat", type=int, default=20, help="timing repetitions (best is reported)")
+    args = ap.parse_args()
+
+    sources = {
+        "tx_exons": recorded_rows("test_tx_exons_e.yaml", "tx_exons"),
+        "tx_for_gene": recorded_rows("test_tx_for_gene_e.yaml", "tx_for_gene"),
+    }
+    header = ("endpoint", "rows", "format", "bytes", "size", "encode_ms", "decode_ms")
+    print("{:<14} {:>6}  {:<40} {:>10} {:>7} {:>10} {:>10}".format(*header))
+    for endpoint, rows in sources.items():
+        for n in args.rows:
+            value = payload(rows, n)
+            baseline = bench(value, formats.JSON, args.repeat)
+            for media_type in formats.MEDIA_TYPES[::-1]:
+                r = baseline if media_type == formats.JSON else bench(value, media_type, args.repeat)
+                print(
+                    "{:<14} {:>6}  {:<40} {:>10} {:>6.0%} {:>10.3f} {:>10.3f}".format(
+                        endpoint,
+                        n,
+                        media_type,
+                        r["bytes"],
+                        r["bytes"] / baseline["bytes"],
+                        r["encode_ms"],
+                        r["decode_ms"],
+                    )
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+"""end-to-end hgvs mapping throughput through UTAREST, compared with hgvs.dataproviders.uta
+
+Runs a fixed set of variants through hgvs, in three phases: c. to g. and g.
+to c. with an AssemblyMapper, and normalization of the c. variants with a
+Normalizer. Each provider is run cold (a new provider, with empty caches)
+and then warm (the same provider again). Reports wall time and variants per
+second for each phase, and for UTAREST the number of HTTP requests per
+variant, so that the overhead of the REST layer can be tracked.
+
+The REST client uses --url (or UTAREST_URL); if neither is given, the api is
+started against the stand-in for UTA in standin.py. The default variants,
+on the recorded transcript NM_199425.2, state no reference bases, so that
+they also map on the stand-in's synthetic sequences; --variants reads
+variants, one per line, from a file. hgvs.dataproviders.uta uses
+UTA_DB_URL, and is skipped if it cannot connect.
+
+    $ python benchmarks/bench_hgvs.py --providers rest uta --repeat 3
+
+"""
+
+import argparse
+import os
+import time
+from typing import Callable, Dict, List, Optional
+
+import hgvs.dataproviders.uta
+import hgvs.normalizer
+import hgvs.parser
+from hgvs.assemblymapper import AssemblyMapper
+from hgvs.exceptions import HGVSError
+from standin import start_server
+
+from hgvs_dataproviders_rest.restclient import UTAREST
+
+VARIANTS = [
+    "NM_199425.2:c.-20del",
+    "NM_199425.2:c.-5_-4insT",
+    "NM_199425.2:c.1dup",
+    "NM_199425.2:c.13del",
+    "NM_199425.2:c.40_42del",
+    "NM_199425.2:c.85_86insGA",
+    "NM_199425.2:c.120delinsTT",
+    "NM_199425.2:c.150dup",
+    "NM_199425.2:c.201_204del",
+    "NM_199425.2:c.250_251insC",
+    "NM_199425.2:c.300del",
+    "NM_199425.2:c.333_335dup",
+    "NM_199425.2:c.402delinsA",
+    "NM_199425.2:c.450_451insTTT",
+    "NM_199425.2:c.512del",
+    "NM_199425.2:c.560dup",
+    "NM_199425.2:c.611_613del",
+    "NM_199425.2:c.650_651insG",
+    "NM_199425.2:c.700delinsCC",
+    "NM_199425.2:c.*10del",
+]
+
+
+class RequestCounter:
+    """counts the HTTP requests sent through a UTAREST client's connection pool"""
+
+    def __init__(self, hdp: UTAREST):
+        self.count = 0
+        send = hdp._adapter.send
+
+        def counting_send(*args, **kwargs):
+            self.count += 1
+            return send(*args, **kwargs)
+
+        hdp._adapter.send = counting_send
+
+
+def run_phases(hdp, variants: list, assembly: str, alt_aln_method: str, counter: Optional[RequestCounter]) -> list:
+    """maps variants c. to g. and back, and normalizes them; returns a result row per phase"""
+    am = AssemblyMapper(hdp, assembly_name=assembly, alt_aln_method=alt_aln_method, replace_reference=True)
+    hn = hgvs.normalizer.Normalizer(hdp)
+    mapped = {}
+
+    def c_to_g(v):
+        mapped[str(v)] = am.c_to_g(v)
+
+    def g_to_c(v):
+        if str(v) in mapped:
+            am.g_to_c(mapped[str(v)], v.ac)
+
+    phases: Dict[str, Callable] = {"c_to_g": c_to_g, "g_to_c": g_to_c, "normalize": hn.normalize}
+    rows = []
+    for phase, func in phases.items():
+        requests_before = counter.count if counter is not None else None
+        errors = 0
+        t0 = time.perf_counter()
+        for v in variants:
+            try:
+                func(v)
+            except HGVSError:
+                errors += 1
+        seconds = time.perf_counter() - t0
+        rows.append(
+            {
+                "phase": phase,
+                "variants": len(variants),
+                "errors": errors,
+                "seconds": seconds,
+                "requests": counter.count - requests_before if counter is not None else None,
+            }
+        )
+    return rows
+
+
+def bench(name: str, connect: Callable, variants: list, args) -> List[dict]:
+    """runs the phases for a provider, cold and then warm, repeat times; returns the best of each"""
+    best: Dict[tuple, dict] = {}
+    for _ in range(args.repeat):
+        hdp = connect()
+        counter = RequestCounter(hdp) if isinstance(hdp, UTAREST) else None
+        for caches in ("cold", "warm"):
+            for row in run_phases(hdp, variants, args.assembly, args.alt_aln_method, counter):
+                row = dict(row, provider=name, caches=caches)
+                key = (caches, row["phase"])
+                if key not in best or row["seconds"] < best[key]["seconds"]:
+                    best[key] = row
+        hdp.close()
+    return list(best.values())
+
+
+def report(rows: List[dict]) -> None:
+    line = "{:<6} {:<6} {:<10} {:>8} {:>6} {:>10} {:>12} {:>9} {:>12}"
+    print(
+        line.format("hdp", "caches", "phase", "variants", "errors", "seconds", "variants/s", "requests", "req/variant")
+    )
+    for r in rows:
+        requests_ = "-" if r["requests"] is None else r["requests"]
+        per_variant = "-" if r["requests"] is None else "{:.2f}".format(r["requests"] / r["variants"])
+        print(
+            line.format(
+                r["provider"],
+                r["caches"],
+                r["phase"],
+                r["variants"],
+                r["errors"],
+                "{:.3f}".format(r["seconds"]),
+                "{:.0f}".format(r["variants"] / r["seconds"]),
+                requests_,
+                per_variant,
+            )
+        )
+    seconds = {(r["provider"], r["caches"], r["phase"]): r["seconds"] for r in rows}
+    for (provider, caches, phase), s in seconds.items():
+        if provider == "rest" and ("uta", caches, phase) in seconds:
+            print("rest/uta time, {} {}: {:.2f}x".format(caches, phase, s / seconds[("uta", caches, phase)]))
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--providers", nargs="+", choices=["rest", "uta"], default=["rest", "uta"])
+    ap.add_argument("--url", default=os.environ.get("UTAREST_URL"), help="api url; default: start the stand-in")
+    ap.add_argument("--port", type=int, default=8765, help="port on which the stand-in api is started")
+    ap.add_argument("--variants", help="file of c. variants, one per line (default: built-in set)")
+    ap.add_argument("--assembly", default="GRCh37", help="assembly of the AssemblyMapper")
+    ap.add_argument("--alt-aln-method", default="splign", help="alignment method of the AssemblyMapper")
+    ap.add_argument("--repeat", type=int, default=1, help="repetitions of each (cold, warm) run; best is reported")
+    args = ap.parse_args()
+
+    hp = hgvs.parser.Parser()
+    if args.variants:
+        with open(args.variants) as f:
+            lines = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+    else:
+        lines = VARIANTS
+    variants = [hp.parse_hgvs_variant(line) for line in lines]
+
+    server = None
+    rows = []
+    try:
+        if "rest" in args.providers:
+            url = args.url
+            if url is None:
+                server = start_server(args.port)
+                url = "http://127.0.0.1:{}".format(args.port)
+            rows += bench("rest", lambda: UTAREST(url), variants, args)
+        if "uta" in args.providers:
+            try:
+                hgvs.dataproviders.uta.connect().close()
+            except Exception as e:
+                print("Skipping hgvs.dataproviders.uta: {}".format(e))
+            else:
+                rows += bench("uta", hgvs.dataproviders.uta.connect, variants, args)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.join()
+    report(rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""load test of the REST api, driven by UTAREST clients, against a stand-in for UTA (see standin.py)
+
+Starts the api in a child process, answering from the responses recorded in
+tests/cassettes (or from UTA itself, with --uta), and replays a mix of
+queries from --concurrency threads. Each thread has its own UTAREST client
+without a response cache, as independent hgvs processes would, so that
+every query is a request. The default mix is that of mapping variants
+between transcripts and the genome: tx_info and tx_exons for the
+transcript, and a window of sequence for normalization. Queries spread
+over --transcripts copies of the recorded transcripts.
+
+Reports, for each concurrency, throughput and latency percentiles over all
+queries and per UTAREST method, as seen by the clients.
+
+    $ python benchmarks/bench_load.py --concurrency 1 8 32 --queries 5000 --db-latency 0.002
+    $ python benchmarks/bench_load.py --mix tx_info=1 --result-cache-size 0 --json baseline.json
+
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+
+from standin import LOOKUPS, CassetteUTA, copy_ac, start_server
+
+from hgvs_dataproviders_rest.restclient import UTAREST
+
+DEFAULT_MIX = "tx_info=2,tx_exons=2,seq=1"
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    """parses "tx_info=2,seq=1" as {"tx_info": 2.0, "seq": 1.0}"""
+    return {name: float(weight) for name, weight in (item.split("=") for item in mix.split(","))}
+
+
+def workload(mix: Dict[str, float], n: int, transcripts: int, seq_window: int, seed: int) -> List[Tuple[str, tuple]]:
+    """returns n (method, args) queries, drawn by weight from mix, with keys from the cassettes"""
+    rng = random.Random(seed)
+    stand_in = CassetteUTA.from_cassettes()
+    keys = {}
+    for name in mix:
+        if name == "seq":
+            # windows of recorded sequences, at random offsets within 1 Mb of the recorded spans
+            keys[name] = [(ac, start_i) for ac, spans in stand_in.seqs.items() for start_i, _ in spans]
+            continue
+        recorded = stand_in.keys("get_" + name)
+        if not recorded:
+            raise ValueError("No recorded {} responses in the cassettes".format(name))
+        keys[name] = recorded
+    queries = []
+    for name in rng.choices(list(mix), weights=list(mix.values()), k=n):
+        if name == "seq":
+            ac, start_i = rng.choice(keys[name])
+            start_i += rng.randrange(2**20)
+            queries.append((name, (ac, start_i, start_i + seq_window)))
+        else:
+            args = rng.choice(keys[name])
+            if LOOKUPS["get_" + name][1][0] == "tx_ac":
+                # spread over copies of the recorded transcripts
+                args = (copy_ac(args[0], rng.randrange(transcripts)),) + args[1:]
+            queries.append((name, args))
+    return queries
+
+
+def run(url: str, queries: List[Tuple[str, tuple]], concurrency: int) -> dict:
+    """runs queries from concurrency threads; returns throughput, errors, and latencies by method"""
+    local = threading.local()
+    clients = []
+    lock = threading.Lock()
+
+    def query(q: Tuple[str, tuple]) -> Tuple[str, float, bool]:
+        client = getattr(local, "client", None)
+        if client is None:
+            client = local.client = UTAREST(url, cache_size=0, seq_prefetch=False)
+            with lock:
+                clients.append(client)
+        name, args = q
+        # bypass the hgvs lru_cache, so that every query is sent
+        method = getattr(client, "get_" + name).__wrapped__
+        t0 = time.perf_counter()
+        result = method(*args)
+        return name, time.perf_counter() - t0, isinstance(result, dict) and "detail" in result
+
+    with ThreadPoolExecutor(concurrency) as executor:
+        t0 = time.perf_counter()
+        results = list(executor.map(query, queries))
+        elapsed = time.perf_counter() - t0
+    for client in clients:
+        client.close()
+
+    by_method: Dict[str, List[float]] = {}
+    for name, seconds, _ in results:
+        by_method.setdefault(name, []).append(seconds)
+    return {
+        "concurrency": concurrency,
+        "queries": len(results),
+        "errors": sum(error for _, _, error in results),
+        "seconds": elapsed,
+        "throughput": len(results) / elapsed,
+        "latency": summarize([s for _, s, _ in results]),
+        "methods": {name: summarize(seconds) for name, seconds in sorted(by_method.items())},
+    }
+
+
+def summarize(seconds: List[float]) -> dict:
+    """returns the count, mean, total and p50/p95/p99 of latencies, in milliseconds"""
+    ordered = sorted(seconds)
+
+    def percentile(p: float) -> float:
+        return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))] * 1e3
+
+    return {
+        "count": len(ordered),
+        "mean_ms": sum(ordered) / len(ordered) * 1e3,
+        "total_ms": sum(ordered) * 1e3,
+        "p50_ms": percentile(50),
+        "p95_ms": percentile(95),
+        "p99_ms": percentile(99),
+    }
+
+
+def report(r: dict) -> None:
+    summary = "concurrency {concurrency}: {queries} queries in {seconds:.2f}s, {throughput:.0f}/s, {errors} errors"
+    print(summary.format(**r))
+    row = "  {:<22} {:>7} {:>9} {:>9} {:>9} {:>9} {:>11}"
+    print(row.format("method", "count", "mean_ms", "p50_ms", "p95_ms", "p99_ms", "total_ms"))
+    for name, s in [("all", r["latency"])] + [("get_" + name, s) for name, s in r["methods"].items()]:
+        print(
+            row.format(
+                name,
+                s["count"],
+                *("{:.3f}".format(s[k]) for k in ("mean_ms", "p50_ms", "p95_ms", "p99_ms")),
+                "{:.1f}".format(s["total_ms"]),
+            )
+        )
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32], help="client threads, one run each")
+    ap.add_argument("--queries", type=int, default=2000, help="queries per run")
+    ap.add_argument("--warmup", type=int, default=200, help="queries run, unmeasured, before each run")
+    ap.add_argument("--mix", default=DEFAULT_MIX, help="relative weights of queries (default: %(default)s)")
+    ap.add_argument("--transcripts", type=int, default=1000, help="copies of the recorded transcripts queried")
+    ap.add_argument("--seq-window", type=int, default=100, help="bases per sequence query")
+    ap.add_argument("--db-latency", type=float, default=0.0, help="seconds slept by each stand-in UTA lookup")
+    ap.add_argument("--result-cache-size", type=int, help="the api's result cache size (UTAREST_RESULT_CACHE_SIZE)")
+    ap.add_argument("--uta", action="store_true", help="serve from UTA (UTA_DB_URL) instead of the stand-in")
+    ap.add_argument("--port", type=int, default=8765, help="port on which the api is started")
+    ap.add_argument("--seed", type=int, default=0, help="seed of the random workload")
+    ap.add_argument("--json", help="also write the results to this file, for comparison between versions")
+    args = ap.parse_args()
+
+    mix = parse_mix(args.mix)
+    server = start_server(args.port, latency=args.db_latency, result_cache_size=args.result_cache_size, uta=args.uta)
+    url = "http://127.0.0.1:{}".format(args.port)
+    try:
+        results = []
+        for i, concurrency in enumerate(args.concurrency):
+            seed = args.seed + i
+            run(url, workload(mix, args.warmup, args.transcripts, args.seq_window, seed + 1000), concurrency)
+            queries = workload(mix, args.queries, args.transcripts, args.seq_window, seed)
+            results.append(run(url, queries, concurrency))
+            report(results[-1])
+    finally:
+        server.terminate()
+        server.join()
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""compares the api's direct serialization of UTA rows with the FastAPI path it replaces
+
+Rows are built as psycopg2 DictRows, as the api receives them from UTA, from
+recorded /tx_exons and /tx_for_gene responses in tests/cassettes, repeated
+to the given number of rows, so that no server or database is needed. Each
+path is timed for an uncached lookup (rows to response body, including the
+conversion that is cached) and for a cached one (cached value to response
+body):
+
+* fastapi: rows copied with dict() and passed through jsonable_encoder;
+  the value then validated against the route's return type and serialized
+  by pydantic, as FastAPI does for routes that return values, and encoded
+  with the json module
+* direct: rows converted by restapi.dicts from their column names and
+  values, and encoded by formats.encode, as routes that return their own
+  responses (see restapi.negotiated_route) are; with the json module, and
+  with orjson if it is installed
+
+    $ python benchmarks/bench_serialize.py --rows 10 100 1000 --repeat 50
+
+"""
+
+import argparse
+import json
+import timeit
+from collections import OrderedDict
+from types import SimpleNamespace
+from typing import Callable, Dict, List
+
+from bench_formats import payload, recorded_rows
+from fastapi.encoders import jsonable_encoder
+from psycopg2.extras import DictRow
+from pydantic import TypeAdapter
+
+from hgvs_dataproviders_rest import formats, restapi
+
+# the return type of the row routes, which FastAPI validates and serializes results against
+RESPONSE_TYPE = TypeAdapter(List)
+
+
+def dict_rows(rows: List[dict]) -> List[DictRow]:
+    """returns rows as the DictRows that a psycopg2 DictCursor would fetch"""
+    columns = list(rows[0])
+    cursor = SimpleNamespace(index=OrderedDict((c, i) for i, c in enumerate(columns)), description=columns)
+    result = []
+    for r in rows:
+        row = DictRow(cursor)
+        row[:] = [r[c] for c in columns]
+        result.append(row)
+    return result
+
+
+def json_dumps(value) -> bytes:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def fastapi_path(value) -> bytes:
+    return json_dumps(RESPONSE_TYPE.dump_python(RESPONSE_TYPE.validate_python(value), mode="json"))
+
+
+def paths() -> Dict[str, tuple]:
+    """returns the (convert, encode) functions of each path"""
+    result = {
+        "fastapi": (lambda rows: jsonable_encoder([dict(r) for r in rows]), fastapi_path),
+        "direct, json": (restapi.dicts, json_dumps),
+    }
+    if formats.orjson is not None:
+        result["direct, orjson"] = (restapi.dicts, formats.dumps)
+    return result
+
+
+def best(func: Callable, repeat: int) -> float:
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--rows", type=int, nargs="+", default=[10, 100, 1000], help="rows per response")
+    ap.add_argument("--repeat", type=int, default=20, help="timing repetitions (best is reported)")
+    args = ap.parse_args()
+
+    sources = {
+        "tx_exons": recorded_rows("test_tx_exons_e.yaml", "tx_exons"),
+        "tx_for_gene": recorded_rows("test_tx_for_gene_e.yaml", "tx_for_gene"),
+    }
+    header = ("endpoint", "rows", "path", "miss_ms", "speedup", "hit_ms", "speedup")
+    print("{:<14} {:>6}  {:<16} {:>10} {:>8} {:>10} {:>8}".format(*header))
+    for endpoint, recorded in sources.items():
+        for n in args.rows:
+            rows = dict_rows(payload(recorded, n))
+            baseline = None
+            for name, (convert, encode) in paths().items():
+                value = convert(rows)
+                if encode(value) != fastapi_path(value):
+                    raise AssertionError("{} encodes {} differently".format(name, endpoint))
+                miss = best(lambda: encode(convert(rows)), args.repeat)
+                hit = best(lambda: encode(value), args.repeat)
+                baseline = baseline or (miss, hit)
+                print(
+                    "{:<14} {:>6}  {:<16} {:>10.3f} {:>7.1f}x {:>10.3f} {:>7.1f}x".format(
+                        endpoint, n, name, miss * 1e3, baseline[0] / miss, hit * 1e3, baseline[1] / hit
+                    )
+                )
+
+
+if __name__ == "__main__":
+    main()
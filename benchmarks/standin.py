@@ -0,0 +1,237 @@
+"""a stand-in for the api's UTA connection, seeded from the recorded responses in tests/cassettes
+
+CassetteUTA answers the lookups that restapi makes of its UTA connection
+with the successful responses recorded in the test cassettes (single and
+/batch), so that the api can be driven, e.g. by bench_load.py and
+bench_hgvs.py, without a database. Since the cassettes hold few transcripts,
+a transcript accession with a copy suffix (e.g., "NM_199425.2~7") is
+answered as the recorded accession, so that workloads can spread over many
+distinct keys. Slices of a sequence outside its recorded spans are answered
+with its recorded bases tiled by position, so that responses have realistic
+sizes and overlapping slices agree; slices of sequences not recorded at all,
+with the bases of the first recorded sequence. Assembly maps come from
+bioutils, as they do for UTA. Alignments on a reference sequence are
+answered from recorded /alignments responses; lookups of anything not
+recorded raise HGVSDataNotAvailableError, which the api answers with 404.
+
+An optional latency, slept by every lookup, stands in for database round trips.
+
+"""
+
+import gzip
+import json
+import multiprocessing
+import os
+import re
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+import requests
+import yaml
+from hgvs.dataproviders.uta import UTABase
+from hgvs.exceptions import HGVSDataNotAvailableError
+
+from hgvs_dataproviders_rest import formats
+
+CASSETTES = os.path.join(os.path.dirname(__file__), os.pardir, "tests", "cassettes")
+
+# UTA lookups made by the api: method -> (endpoint, argument names, in the order the api passes them)
+LOOKUPS = {
+    "get_gene_info": ("gene_info", ("gene",)),
+    "get_tx_exons": ("tx_exons", ("tx_ac", "alt_ac", "alt_aln_method")),
+    "get_tx_for_gene": ("tx_for_gene", ("gene",)),
+    "get_tx_for_region": ("tx_for_region", ("alt_ac", "alt_aln_method", "start_i", "end_i")),
+    "get_alignments_for_region": ("alignments_for_region", ("alt_ac", "start_i", "end_i", "alt_aln_method")),
+    "get_tx_identity_info": ("tx_identity_info", ("tx_ac",)),
+    "get_tx_info": ("tx_info", ("tx_ac", "alt_ac", "alt_aln_method")),
+    "get_tx_mapping_options": ("tx_mapping_options", ("tx_ac",)),
+    "get_similar_transcripts": ("similar_transcripts", ("tx_ac",)),
+    "get_pro_ac_for_tx_ac": ("pro_ac_for_tx_ac", ("tx_ac",)),
+    "get_acs_for_protein_seq": ("acs_for_protein_seq", ("seq",)),
+    "get_acs_for_protein_md5": ("acs_for_protein_md5", ("md5",)),
+}
+_ENDPOINTS = {endpoint: (method, names) for method, (endpoint, names) in LOOKUPS.items()}
+_COPY_RE = re.compile(r"~\d+$")
+
+
+def copy_ac(ac: str, k: int) -> str:
+    """returns the k-th copy of accession ac (ac itself for k=0), answered by CassetteUTA as ac"""
+    return ac if k == 0 else "{}~{}".format(ac, k)
+
+
+class CassetteUTA:
+    """answers the api's UTA lookups from recorded responses"""
+
+    def __init__(self, versions: dict, responses: Dict[tuple, object], seqs: Dict[str, List[Tuple[int, str]]]):
+        """
+        :param versions: the recorded /ping response
+        :param responses: recorded results, by (method, (str(arg), ...))
+        :param seqs: recorded sequence slices, as (start_i, seq), by accession
+        """
+        self.versions = versions
+        self.responses = responses
+        self.seqs = seqs
+        self.latency = 0.0
+
+    @classmethod
+    def from_cassettes(cls, directory: str = CASSETTES) -> "CassetteUTA":
+        versions = None
+        responses: Dict[tuple, object] = {}
+        seqs: Dict[str, List[Tuple[int, str]]] = {}
+        for name in sorted(os.listdir(directory)):
+            with open(os.path.join(directory, name)) as f:
+                interactions = yaml.safe_load(f)["interactions"]
+            for interaction in interactions:
+                request, response = interaction["request"], interaction["response"]
+                if response["status"]["code"] != 200:
+                    continue
+                url = urlsplit(request["uri"])
+                endpoint, *path = url.path.strip("/").split("/")
+                params = dict(parse_qsl(url.query))
+                value = _body(response)
+                if endpoint == "ping":
+                    versions = value
+                elif endpoint == "seq" and path:
+                    seqs.setdefault(path[0], []).append((int(params.get("start_i", 0)), value))
+                elif endpoint == "alignments" and path and "alt_aln_method" not in params:
+                    responses[("get_alignments_for_ac", (path[0],))] = value
+                elif endpoint == "batch" and path[0] in _ENDPOINTS:
+                    method, names = _ENDPOINTS[path[0]]
+                    for key, result in zip(json.loads(request["body"]), value):
+                        if result["status_code"] == 200:
+                            args = [key[n] for n in names] if isinstance(key, dict) else [key]
+                            responses[(method, tuple(map(str, args)))] = result["body"]
+                elif endpoint in _ENDPOINTS:
+                    method, names = _ENDPOINTS[endpoint]
+                    args = path + [params.get(n) for n in names[len(path) :]]
+                    responses[(method, tuple(map(str, args)))] = value
+        return cls(versions, responses, seqs)
+
+    def keys(self, method: str) -> List[tuple]:
+        """returns the recorded argument tuples of a lookup"""
+        return [args for m, args in self.responses if m == method]
+
+    def data_version(self) -> str:
+        return self.versions["data_version"]
+
+    def schema_version(self) -> str:
+        return self.versions["schema_version"]
+
+    def pool_stats(self) -> dict:
+        return {}
+
+    def close(self) -> None:
+        pass
+
+    def get_seq(self, ac: str, start_i: Optional[int] = None, end_i: Optional[int] = None) -> str:
+        self._wait()
+        spans = self.seqs.get(_COPY_RE.sub("", ac), [])
+        start_i = start_i or 0
+        for offset, seq in spans:
+            if offset <= start_i and end_i is not None and end_i <= offset + len(seq):
+                return seq[start_i - offset : end_i - offset]
+        if end_i is None:
+            raise HGVSDataNotAvailableError("No whole sequence of {} in cassettes".format(ac))
+        # tiled by position, so that overlapping slices agree
+        bases = (spans or next(iter(self.seqs.values())))[0][1]
+        bases = bases[start_i % len(bases) :] + bases[: start_i % len(bases)]
+        return (bases * ((end_i - start_i) // len(bases) + 1))[: end_i - start_i]
+
+    def get_assembly_map(self, assembly_name: str) -> dict:
+        return UTABase.get_assembly_map(self, assembly_name)
+
+    def get_all_gene_info(self) -> List[dict]:
+        self._wait()
+        return [value for (method, _), value in self.responses.items() if method == "get_gene_info"]
+
+    def get_alignments_for_ac(self, alt_ac: str, alt_aln_method: Optional[str] = None) -> List[dict]:
+        alignments = self._lookup("get_alignments_for_ac", (alt_ac,))
+        return [a for a in alignments if alt_aln_method is None or a["alt_aln_method"] == alt_aln_method]
+
+    def iter_alignments_for_ac(
+        self, alt_ac: str, alt_aln_method: Optional[str] = None, batch_size: int = 2000
+    ) -> Iterator[List[dict]]:
+        """
+        returns a generator of the recorded alignments on alt_ac, in order of start, in batches as
+        UTA.iter_alignments_for_ac yields them; raises HGVSDataNotAvailableError at once if none were
+        recorded. the latency is slept when the first batch is read, on the api's worker thread.
+        """
+        if ("get_alignments_for_ac", (_COPY_RE.sub("", alt_ac),)) not in self.responses:
+            raise HGVSDataNotAvailableError("No get_alignments_for_ac('{}',) in cassettes".format(alt_ac))
+        return self._alignment_batches(alt_ac, alt_aln_method, batch_size)
+
+    def _alignment_batches(self, alt_ac: str, alt_aln_method: Optional[str], batch_size: int) -> Iterator[List[dict]]:
+        alignments = sorted(self.get_alignments_for_ac(alt_ac, alt_aln_method), key=lambda a: a["start_i"])
+        for i in range(0, len(alignments), batch_size):
+            yield alignments[i : i + batch_size]
+
+    def _lookup(self, method: str, args: tuple):
+        self._wait()
+        key = (method, tuple(_COPY_RE.sub("", str(arg)) for arg in args))
+        try:
+            return self.responses[key]
+        except KeyError:
+            raise HGVSDataNotAvailableError("No {}{} in cassettes".format(method, args)) from None
+
+    def _wait(self) -> None:
+        if self.latency:
+            time.sleep(self.latency)
+
+
+def _make_lookup(method: str):
+    def lookup(self, *args):
+        return self._lookup(method, args)
+
+    lookup.__name__ = method
+    return lookup
+
+
+for _method in LOOKUPS:
+    setattr(CassetteUTA, _method, _make_lookup(_method))
+
+
+def _body(response: dict):
+    """returns the decoded body of a recorded response"""
+    headers = {k.lower(): v[0] for k, v in response["headers"].items()}
+    body = response["body"]["string"]
+    if isinstance(body, str):
+        body = body.encode()
+    if headers.get("content-encoding") == "gzip":
+        body = gzip.decompress(body)
+    content_type = headers.get("content-type", formats.JSON)
+    if content_type.startswith("text/plain"):
+        return body.decode()
+    if content_type.startswith(formats.NDJSON):
+        return [json.loads(line) for line in body.splitlines() if line]
+    return formats.decode(body, content_type)
+
+
+def serve(port: int, latency: float = 0.0, result_cache_size: Optional[int] = None, uta: bool = False) -> None:
+    """runs the api on port, answering from CassetteUTA (or from UTA_DB_URL, if uta)"""
+    import uvicorn
+
+    if result_cache_size is not None:
+        os.environ["UTAREST_RESULT_CACHE_SIZE"] = str(result_cache_size)
+    from hgvs_dataproviders_rest import restapi
+
+    if not uta:
+        restapi.conn = CassetteUTA.from_cassettes()
+        restapi.conn.latency = latency
+    uvicorn.run(restapi.app, host="127.0.0.1", port=port, log_level="warning")
+
+
+def start_server(port: int, timeout: float = 60, **kwargs) -> multiprocessing.Process:
+    """starts serve(port, **kwargs) in a child process, and returns once the api answers /ping"""
+    server = multiprocessing.get_context("spawn").Process(target=serve, args=(port,), kwargs=kwargs, daemon=True)
+    server.start()
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            requests.get("http://127.0.0.1:{}/ping".format(port), timeout=1).raise_for_status()
+            return server
+        except requests.RequestException:
+            if not server.is_alive() or time.monotonic() > deadline:
+                server.terminate()
+                raise RuntimeError("The api did not start on port {}".format(port))
+            time.sleep(0.1)
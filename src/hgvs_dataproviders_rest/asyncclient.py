@@ -0,0 +1,529 @@
+"""asyncio client for the hgvs dataprovider REST api
+
+AsyncUTAREST offers the query methods of restclient.UTAREST as coroutines,
+over a pooled httpx.AsyncClient, so that asyncio services can look up data
+without blocking their event loop or handing each lookup to a thread. It
+returns what UTAREST returns for the same query, and shares its response
+caches' layout, so one persistent cache file can serve both.
+
+httpx is an optional dependency of this package; it is needed only here.
+
+"""
+
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import time
+from typing import (
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Collection,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from bioutils.digests import seq_md5
+
+from hgvs_dataproviders_rest import formats
+from hgvs_dataproviders_rest.cache import LRUCache, SQLiteCache
+from hgvs_dataproviders_rest.regionindex import RegionIndex
+from hgvs_dataproviders_rest.restclient import (
+    _MISSING,
+    DEFAULT_BATCH_SIZE,
+    DEFAULT_TIMEOUT,
+    DEFAULT_TIMEOUTS,
+    NO_REGION_INDEX_STATUSES,
+    RETRY_STATUSES,
+    SEQ_CHUNK_SIZE,
+    ResponseCacheMixin,
+    _persistent_cache_from_env,
+    _ping_ttl_from_env,
+    _rows,
+    _slice_size,
+)
+from hgvs_dataproviders_rest.singleflight import AsyncSingleFlight
+from hgvs_dataproviders_rest.tracing import annotate, traced
+
+try:
+    import httpx
+except ImportError:  # pragma: no cover
+    httpx = None
+
+_logger = logging.getLogger(__name__)
+
+
+def connect(**kwargs) -> "AsyncUTAREST":
+    """returns an AsyncUTAREST client for UTAREST_URL, configured from the environment as restclient.connect() is"""
+    url = os.environ.get("UTAREST_URL", "https://api.biocommons.org/utarest/0")
+    kwargs.setdefault("persistent_cache", _persistent_cache_from_env())
+    kwargs.setdefault("ping_ttl", _ping_ttl_from_env())
+    return AsyncUTAREST(url, **kwargs)
+
+
+async def _read_text(resp: "httpx.Response", size: Optional[int] = None) -> str:
+    """async counterpart of restclient._read_text"""
+    length = resp.headers.get("Content-Length") if "Content-Encoding" not in resp.headers else None
+    if length is not None:
+        size = int(length)
+    if size is None:
+        return b"".join([chunk async for chunk in resp.aiter_bytes(SEQ_CHUNK_SIZE)]).decode(resp.encoding or "ascii")
+    buf = bytearray(size)
+    n = 0
+    with memoryview(buf) as view:
+        async for chunk in resp.aiter_bytes(SEQ_CHUNK_SIZE):
+            if n + len(chunk) > size:
+                raise httpx.DecodingError(f"Response is longer than {size} bytes")
+            view[n : n + len(chunk)] = chunk
+            n += len(chunk)
+    if length is not None and n < size:
+        raise httpx.RemoteProtocolError(f"Response ended after {n} of {size} bytes")
+    del buf[n:]
+    return buf.decode(resp.encoding or "ascii")
+
+
+async def _decode(resp: "httpx.Response", size: Optional[int] = None) -> Tuple[object, Optional[bytes], int]:
+    """async counterpart of restclient._decode"""
+    content_type = resp.headers.get("Content-Type", "")
+    if content_type.startswith("text/plain"):
+        value = await _read_text(resp, size)
+        return value, None, len(value)
+    content = await resp.aread()
+    value = formats.decode(content, content_type)
+    body = content if content_type.startswith(formats.JSON) or not content_type else None
+    return value, body, len(content)
+
+
+class AsyncUTAREST(ResponseCacheMixin):
+    """asyncio client for the hgvs dataprovider REST api
+
+    Use as an async context manager, or call ping() before the first query and
+    aclose() when done:
+
+        async with AsyncUTAREST("http://localhost:8000") as hdp:
+            tx_info, tx_exons = await asyncio.gather(
+                hdp.get_tx_info("NM_199425.2", "NC_000020.10", "splign"),
+                hdp.get_tx_exons("NM_199425.2", "NC_000020.10", "splign"),
+            )
+
+    At most max_concurrency requests are in flight at once; further lookups
+    wait for a free slot, so callers may gather any number of them.
+    """
+
+    def __init__(
+        self,
+        server_url: str,
+        pool_size: int = 10,
+        max_concurrency: Optional[int] = None,
+        max_retries: int = 3,
+        backoff_factor: float = 0.5,
+        timeouts: Optional[Dict[str, float]] = None,
+        cache_size: int = 10000,
+        cache_bytes: int = 256 * 2**20,
+        cache_ttl: Optional[float] = None,
+        persistent_cache: Optional[SQLiteCache] = None,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        response_format: Optional[str] = None,
+        region_index: bool = False,
+        ping_ttl: Optional[float] = None,
+    ):
+        """
+        :param server_url: base url of the hgvs dataprovider REST api
+        :param pool_size: maximum number of connections kept open to the server
+        :param max_concurrency: maximum number of requests in flight; defaults to pool_size
+        :param max_retries: number of retries for failed connections and 502/503/504 responses
+        :param backoff_factor: retry backoff factor; retries sleep backoff_factor * 2**(retry - 1) seconds
+        :param timeouts: per-endpoint timeouts in seconds (e.g., {"seq": 300}), merged over DEFAULT_TIMEOUTS
+        :param cache_size: maximum number of responses held in the in-memory response cache; 0 disables it
+        :param cache_bytes: maximum total size, in bytes of response body, of the in-memory response cache
+        :param cache_ttl: seconds after which cached responses expire, or None for no expiry
+        :param persistent_cache: optional on-disk cache consulted after the in-memory cache
+        :param batch_size: maximum number of keys sent in one request by the get_*_many methods
+        :param response_format: media type to ask the server for (see formats)
+        :param region_index: answer region queries from a RegionIndex per reference sequence (see UTAREST)
+        :param ping_ttl: seconds after which the server's versions are fetched again (see UTAREST)
+        """
+        if httpx is None:
+            raise ImportError("AsyncUTAREST requires the httpx package")
+        self.server = server_url
+        self.timeouts = dict(DEFAULT_TIMEOUTS, **(timeouts or {}))
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+        # the transport retries failed connections; retries of 502/503/504 responses are in _stream
+        transport = httpx.AsyncHTTPTransport(retries=max_retries, limits=limits)
+        self._client = httpx.AsyncClient(transport=transport)
+        # created on first use, so that they belong to the event loop that uses the client (on Python < 3.10,
+        # asyncio primitives bind to the current loop when created)
+        self._max_concurrency = max_concurrency or pool_size
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._ping_lock: Optional[asyncio.Lock] = None
+        self.response_cache = LRUCache(cache_size, cache_bytes, cache_ttl) if cache_size > 0 else None
+        self.persistent_cache = persistent_cache
+        self.batch_size = batch_size
+        self.flights = AsyncSingleFlight()
+        self.accept = formats.accept_header(response_format or formats.MEDIA_TYPES[0])
+        self.region_index = region_index
+        self._region_indexes: Dict[str, Optional[RegionIndex]] = {}
+        self.ping_ttl = ping_ttl
+        self.pingresponse = None
+        self._ping_expires: Optional[float] = None
+
+    async def __aenter__(self) -> "AsyncUTAREST":
+        await self.ping()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        """closes all pooled connections to the server"""
+        await self._client.aclose()
+
+    async def ping(self) -> dict:
+        """returns the server's data_version, schema_version, and sequence_source, fetched on first use and
+        again once older than ping_ttl (see UTAREST.ping)"""
+        if self._ping_expired():
+            if self._ping_lock is None:
+                self._ping_lock = asyncio.Lock()
+            async with self._ping_lock:
+                if self._ping_expired():
+                    await self._refresh_ping()
+        return self.pingresponse
+
+    def _ping_expired(self) -> bool:
+        return self.pingresponse is None or (self._ping_expires is not None and time.monotonic() >= self._ping_expires)
+
+    async def _refresh_ping(self) -> None:
+        ttl = self.ping_ttl
+        stored = None
+        if self.pingresponse is None and self.persistent_cache is not None:
+            stored = await asyncio.to_thread(self._stored_ping)
+        if stored is not None:
+            ping, ttl = stored
+        else:
+            url = "/".join([self.server, "ping"])
+            try:
+                async with self._stream("GET", url, timeout=self.timeouts.get("ping", DEFAULT_TIMEOUT)) as resp:
+                    resp.raise_for_status()
+                    ping = (await _decode(resp))[0]
+            except httpx.HTTPError as e:
+                if self.pingresponse is None:
+                    raise
+                _logger.warning("Could not ping {}; keeping versions from the previous ping: {}".format(url, e))
+                ping = self.pingresponse
+            else:
+                if self.persistent_cache is not None:
+                    await asyncio.to_thread(self._store_ping, ping)
+        if self.pingresponse is not None and ping != self.pingresponse:
+            # the region indexes are of the previous release
+            self._region_indexes = {}
+        self.pingresponse = ping
+        self._ping_expires = time.monotonic() + ttl if ttl is not None else None
+
+    @contextlib.asynccontextmanager
+    async def _stream(self, method: str, url: str, **kwargs) -> AsyncIterator["httpx.Response"]:
+        """sends a request within the concurrency limit, retrying 502/503/504 responses with backoff,
+        and yields the (streamed) response"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._max_concurrency)
+        async with self._semaphore:
+            for attempt in range(self.max_retries + 1):
+                if attempt:
+                    await asyncio.sleep(self.backoff_factor * 2 ** (attempt - 1))
+                async with self._client.stream(method, url, **kwargs) as resp:
+                    if resp.status_code in RETRY_STATUSES and attempt < self.max_retries:
+                        continue
+                    yield resp
+                    return
+
+    async def _acache_get(self, key: tuple):
+        """
+        _cache_get for the event loop: SQLite calls block, so the persistent cache is read on a worker
+        thread (SQLiteCache keeps a connection per thread)
+        """
+        value = self._memory_get(key)
+        if value is _MISSING and self.persistent_cache is not None:
+            value = await asyncio.to_thread(self._disk_get, key)
+        return value
+
+    async def _acache_set(
+        self, key: tuple, value, body: Optional[bytes] = None, etag: Optional[str] = None, size: Optional[int] = None
+    ) -> None:
+        """_cache_set for the event loop: the persistent cache is written on a worker thread"""
+        body = self._memory_set(key, value, body, etag, size)
+        if self.persistent_cache is not None:
+            await asyncio.to_thread(self._persist, [(key, body)])
+
+    def _persist(self, entries: List[Tuple[tuple, bytes]]) -> None:
+        """stores (key, body) pairs in the persistent cache; called on a worker thread"""
+        for key, body in entries:
+            self.persistent_cache.set(key, body, size=len(body))
+
+    async def _get(self, endpoint: str, *path: str, params: Optional[dict] = None, accept: Optional[str] = None):
+        """async counterpart of UTAREST._get, with the same caching, ETag revalidation, and coalescing"""
+        await self.ping()
+        url = "/".join([self.server, endpoint, *path])
+        if params:
+            params = {k: v for k, v in params.items() if v is not None}
+        key = self._cache_key(endpoint, *path, params=params)
+        value = await self._acache_get(key)
+        annotate(cache="miss" if value is _MISSING else "hit")
+        if value is not _MISSING:
+            return value
+        timeout = self.timeouts.get(endpoint, DEFAULT_TIMEOUT)
+        return await self.flights.do(key, self._fetch, key, url, params, accept or self.accept, timeout)
+
+    async def _fetch(self, key: tuple, url: str, params: Optional[dict], accept: str, timeout: float):
+        """async counterpart of UTAREST._fetch"""
+        headers = {"Accept": accept}
+        stale = self.response_cache.peek(key) if self.response_cache is not None else None
+        if stale is not None and stale[1] is not None:
+            headers["If-None-Match"] = stale[1]
+        async with self._stream("GET", url, params=params, headers=headers, timeout=timeout) as resp:
+            if resp.status_code == 304:
+                self.response_cache.renew(key)
+                return stale[0]
+            value, body, size = await _decode(resp, _slice_size(params))
+            if resp.status_code == 200:
+                await self._acache_set(key, value, body, etag=resp.headers.get("ETag"), size=size)
+        return value
+
+    async def _get_many(self, endpoint: str, queries: Sequence[Tuple[tuple, dict]], keys: Sequence) -> List:
+        """async counterpart of UTAREST._get_many; batches are sent concurrently"""
+        await self.ping()
+        cache_keys = [self._cache_key(endpoint, *path, params=params) for path, params in queries]
+        results = [self._memory_get(cache_key) for cache_key in cache_keys]
+        if self.persistent_cache is not None:
+            # read on one worker thread for all the keys missed in memory, rather than one per key
+            missed = [i for i, result in enumerate(results) if result is _MISSING]
+            found = await asyncio.to_thread(lambda: [self._disk_get(cache_keys[i]) for i in missed])
+            for i, result in zip(missed, found):
+                results[i] = result
+        misses = [i for i, result in enumerate(results) if result is _MISSING]
+        annotate(cache_hits=len(queries) - len(misses), cache_misses=len(misses))
+
+        url = "/".join([self.server, "batch", endpoint])
+        timeout = self.timeouts.get("batch", DEFAULT_TIMEOUT)
+
+        async def fetch(chunk: List[int]) -> None:
+            headers = {"Accept": self.accept}
+            entries = []
+            async with self._stream(
+                "POST", url, json=[keys[i] for i in chunk], headers=headers, timeout=timeout
+            ) as resp:
+                await resp.aread()
+                resp.raise_for_status()
+                for i, result in zip(chunk, (await _decode(resp))[0]):
+                    results[i] = result["body"]
+                    if result["status_code"] == 200:
+                        entries.append((cache_keys[i], self._memory_set(cache_keys[i], result["body"])))
+            if self.persistent_cache is not None and entries:
+                await asyncio.to_thread(self._persist, entries)
+
+        chunks = [misses[start : start + self.batch_size] for start in range(0, len(misses), self.batch_size)]
+        await asyncio.gather(*(fetch(chunk) for chunk in chunks))
+        return results
+
+    ############################################################################
+    # Fan-out
+
+    async def map(self, method: Callable[..., Awaitable], keys: Iterable[tuple]) -> List:
+        """
+        returns [await method(*key) for key in keys], with the lookups run concurrently (within the
+        client's concurrency limit). if any lookup raises, the exception propagates.
+        e.g., await hdp.map(hdp.get_tx_info, [(tx_ac, alt_ac, "splign"), ...])
+        """
+        return await asyncio.gather(*(method(*key) for key in keys))
+
+    async def _region_index(self, alt_ac: str) -> Optional[RegionIndex]:
+        """async counterpart of UTAREST._region_index"""
+        if not self.region_index:
+            return None
+        if alt_ac not in self._region_indexes:
+            index = await self.flights.do(("alignments", alt_ac), self._load_region_index, alt_ac)
+            self._region_indexes[alt_ac] = index
+        return self._region_indexes[alt_ac]
+
+    async def _load_region_index(self, alt_ac: str) -> Optional[RegionIndex]:
+        """async counterpart of UTAREST._load_region_index"""
+        await self.ping()
+        url = "/".join([self.server, "alignments", alt_ac])
+        headers = {"Accept": "{}, {};q=0.5".format(formats.NDJSON, formats.JSON)}
+        timeout = self.timeouts.get("alignments", DEFAULT_TIMEOUT)
+        async with self._stream("GET", url, headers=headers, timeout=timeout) as resp:
+            if resp.status_code in NO_REGION_INDEX_STATUSES:
+                return None
+            resp.raise_for_status()
+            if resp.headers.get("Content-Type", "").startswith(formats.NDJSON):
+                index = RegionIndex()
+                async for line in resp.aiter_lines():
+                    if line:
+                        index.add(json.loads(line))
+                return index
+            rows = (await _decode(resp))[0]
+            return RegionIndex(rows) if isinstance(rows, list) else None
+
+    ############################################################################
+    # Queries; see UTAREST for descriptions of the results
+
+    async def data_version(self) -> str:
+        return (await self.ping())["data_version"]
+
+    async def schema_version(self) -> str:
+        return (await self.ping())["schema_version"]
+
+    async def sequence_source(self) -> str:
+        return (await self.ping())["sequence_source"]
+
+    @traced
+    async def get_seq(self, ac: str, start_i: Optional[int] = None, end_i: Optional[int] = None) -> str:
+        params = {"start_i": start_i, "end_i": end_i}
+        return await self._get("seq", ac, params=params, accept="text/plain, application/json")
+
+    @traced
+    async def get_acs_for_protein_seq(self, seq: str) -> List:
+        try:
+            md5 = seq_md5(seq)
+        except RuntimeError as e:
+            return {"detail": str(e)}
+        acs = await self._get("acs_for_protein_md5", md5)
+        if isinstance(acs, dict):
+            return await self._get("acs_for_protein_seq", seq)
+        return acs
+
+    @traced
+    async def get_gene_info(self, gene: str) -> Optional[dict]:
+        return await self._get("gene_info", gene)
+
+    @traced
+    async def get_tx_exons(self, tx_ac: str, alt_ac: str, alt_aln_method: str) -> List[dict]:
+        return await self._get("tx_exons", tx_ac, alt_ac, params={"alt_aln_method": alt_aln_method})
+
+    @traced
+    async def get_tx_for_gene(self, gene: str) -> Optional[List[dict]]:
+        return await self._get("tx_for_gene", gene)
+
+    @traced
+    async def get_tx_for_region(
+        self, alt_ac: str, alt_aln_method: str, start_i: int, end_i: int
+    ) -> Optional[List[dict]]:
+        index = await self._region_index(alt_ac)
+        if index is not None:
+            return index.alignments_for_region(start_i, end_i, alt_aln_method)
+        params = {"alt_aln_method": alt_aln_method, "start_i": start_i, "end_i": end_i}
+        return await self._get("tx_for_region", alt_ac, params=params)
+
+    @traced
+    async def get_alignments_for_region(
+        self, alt_ac: str, start_i: int, end_i: int, alt_aln_method: Optional[str] = None
+    ) -> List:
+        index = await self._region_index(alt_ac)
+        if index is not None:
+            return index.alignments_for_region(start_i, end_i, alt_aln_method)
+        params = {"start_i": start_i, "end_i": end_i, "alt_aln_method": alt_aln_method}
+        return await self._get("alignments_for_region", alt_ac, params=params)
+
+    @traced
+    async def get_tx_identity_info(self, tx_ac: str) -> dict:
+        return await self._get("tx_identity_info", tx_ac)
+
+    @traced
+    async def get_tx_info(self, tx_ac: str, alt_ac: str, alt_aln_method: str) -> dict:
+        return await self._get("tx_info", tx_ac, alt_ac, params={"alt_aln_method": alt_aln_method})
+
+    @traced
+    async def get_tx_mapping_options(self, tx_ac: str) -> Optional[List[dict]]:
+        return await self._get("tx_mapping_options", tx_ac)
+
+    @traced
+    async def get_similar_transcripts(self, tx_ac: str) -> Optional[List[dict]]:
+        return await self._get("similar_transcripts", tx_ac)
+
+    @traced
+    async def get_pro_ac_for_tx_ac(self, tx_ac: str) -> Optional[str]:
+        return await self._get("pro_ac_for_tx_ac", tx_ac)
+
+    @traced
+    async def get_assembly_map(self, assembly_name: str) -> dict:
+        return await self._get("assembly_map", assembly_name)
+
+    ############################################################################
+    # Bulk queries; see UTAREST
+
+    @traced
+    async def get_acs_for_protein_seq_many(self, seqs: Sequence[str]) -> List:
+        results = []
+        md5s = {}
+        for i, seq in enumerate(seqs):
+            try:
+                md5s[i] = seq_md5(seq)
+                results.append(None)
+            except RuntimeError as e:
+                results.append({"detail": str(e)})
+        queries = [((md5,), {}) for md5 in md5s.values()]
+        for i, acs in zip(md5s, await self._get_many("acs_for_protein_md5", queries, list(md5s.values()))):
+            results[i] = acs
+        return results
+
+    @traced
+    async def get_seq_many(self, keys: Sequence[Tuple[str, Optional[int], Optional[int]]]) -> List:
+        queries = [((ac,), {"start_i": s, "end_i": e}) for ac, s, e in keys]
+        bodies = [{"ac": ac, "start_i": s, "end_i": e} for ac, s, e in keys]
+        return await self._get_many("seq", queries, bodies)
+
+    @traced
+    async def get_tx_exons_many(self, keys: Sequence[Tuple[str, str, str]]) -> List:
+        queries = [((tx_ac, alt_ac), {"alt_aln_method": m}) for tx_ac, alt_ac, m in keys]
+        bodies = [{"tx_ac": tx_ac, "alt_ac": alt_ac, "alt_aln_method": m} for tx_ac, alt_ac, m in keys]
+        return await self._get_many("tx_exons", queries, bodies)
+
+    @traced
+    async def get_tx_for_gene_many(self, genes: Sequence[str]) -> List:
+        return await self._get_many("tx_for_gene", [((gene,), {}) for gene in genes], list(genes))
+
+    @traced
+    async def get_tx_identity_info_many(self, tx_acs: Sequence[str]) -> List:
+        return await self._get_many("tx_identity_info", [((tx_ac,), {}) for tx_ac in tx_acs], list(tx_acs))
+
+    @traced
+    async def get_tx_info_many(self, keys: Sequence[Tuple[str, str, str]]) -> List:
+        queries = [((tx_ac, alt_ac), {"alt_aln_method": m}) for tx_ac, alt_ac, m in keys]
+        bodies = [{"tx_ac": tx_ac, "alt_ac": alt_ac, "alt_aln_method": m} for tx_ac, alt_ac, m in keys]
+        return await self._get_many("tx_info", queries, bodies)
+
+    @traced
+    async def get_tx_mapping_options_many(self, tx_acs: Sequence[str]) -> List:
+        return await self._get_many("tx_mapping_options", [((tx_ac,), {}) for tx_ac in tx_acs], list(tx_acs))
+
+    async def prefetch(
+        self,
+        genes: Sequence[str] = (),
+        tx_acs: Sequence[str] = (),
+        alt_aln_method: Optional[str] = None,
+        alt_acs: Optional[Collection[str]] = None,
+    ) -> List[Tuple[str, str, str]]:
+        """async counterpart of UTAREST.prefetch"""
+        tx_acs = dict.fromkeys(tx_acs)
+        for rows in await self.get_tx_for_gene_many(list(dict.fromkeys(genes))):
+            tx_acs.update(dict.fromkeys(r["tx_ac"] for r in _rows(rows)))
+        tx_acs = list(tx_acs)
+
+        async def alignments() -> List[Tuple[str, str, str]]:
+            alignments = [
+                (r["tx_ac"], r["alt_ac"], r["alt_aln_method"])
+                for rows in await self.get_tx_mapping_options_many(tx_acs)
+                for r in _rows(rows)
+                if alt_aln_method is None or r["alt_aln_method"] == alt_aln_method
+                if alt_acs is None or r["alt_ac"] in alt_acs
+            ]
+            await asyncio.gather(self.get_tx_info_many(alignments), self.get_tx_exons_many(alignments))
+            return alignments
+
+        return (await asyncio.gather(alignments(), self.get_tx_identity_info_many(tx_acs)))[0]
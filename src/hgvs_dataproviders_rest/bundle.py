@@ -0,0 +1,232 @@
+"""offline data bundles for the hgvs dataprovider REST client
+
+A bundle is a single SQLite file, built by crawling the REST api, from
+which UTAREST answers queries without a server (see UTAREST's bundle
+parameter). It holds:
+
+* responses, exactly as in a SQLiteCache, under the server's data and
+  schema versions
+* the server's /ping response
+* sequences: whole transcript sequences, and the spans of reference
+  sequences covered by the crawled alignments
+
+Bundles are built with the utarest-bundle command, e.g.:
+
+    $ utarest-bundle --url http://localhost:8000 --genes BRCA1 BRCA2 --assembly GRCh38 \\
+        --alt-aln-method splign panel.utarest
+
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from hgvs_dataproviders_rest.cache import SQLiteCache
+
+_logger = logging.getLogger(__name__)
+
+# bases of reference sequence kept on each side of an alignment, for normalization near its ends
+DEFAULT_FLANK = 1000
+
+
+# tables of a bundle, in addition to those of SQLiteCache
+_DDL = """
+    create table if not exists meta (
+        key text primary key,
+        value text not null
+    );
+    create table if not exists seqs (
+        ac text not null,
+        start_i integer not null,
+        end_i integer not null,
+        whole integer not null,
+        seq text not null,
+        primary key (ac, start_i, end_i)
+    );
+    """
+
+
+class Bundle(SQLiteCache):
+    """
+    SQLite file of responses (as in SQLiteCache), server metadata, and sequences.
+    entries are never evicted. read-only bundles are read through a memory map.
+
+    >>> import os, tempfile
+    >>> tmpdir = tempfile.TemporaryDirectory()
+    >>> b = Bundle(os.path.join(tmpdir.name, "bundle.utarest"))
+    >>> b.add_seq("NC_1", "ACGTACGTAC", start_i=100)
+    >>> b.get_seq("NC_1", 102, 106)
+    'GTAC'
+    >>> b.get_seq("NC_1", 105, 120) is None
+    True
+    >>> b.close()
+    >>> tmpdir.cleanup()
+
+    """
+
+    _ddl = SQLiteCache._ddl + _DDL
+
+    def __init__(self, path: str, readonly: bool = False, mmap_size: int = 2**40):
+        """
+        :param path: path of the bundle file; created if it does not exist (unless readonly)
+        :param readonly: open the file read-only, as for serving queries
+        :param mmap_size: maximum number of bytes of a read-only bundle read through a memory map
+        """
+        super().__init__(path, max_bytes=sys.maxsize, readonly=readonly, mmap_size=mmap_size if readonly else 0)
+
+    def get_meta(self, key: str) -> Optional[str]:
+        row = self._conn.execute("select value from meta where key=?", (key,)).fetchone()
+        return row[0] if row is not None else None
+
+    def set_meta(self, key: str, value: str) -> None:
+        self._conn.execute("insert or replace into meta (key, value) values (?, ?)", (key, value))
+
+    def ping(self) -> Optional[dict]:
+        """returns the /ping response of the server the bundle was built from"""
+        ping = self.get_meta("ping")
+        return json.loads(ping) if ping is not None else None
+
+    def add_seq(self, ac: str, seq: str, start_i: int = 0, end_i: Optional[int] = None, whole: bool = False) -> None:
+        """
+        stores seq as ac[start_i:end_i]; end_i may exceed start_i + len(seq) if the span was cut short
+        by the end of ac. whole means that seq is all of ac.
+        """
+        end_i = start_i + len(seq) if end_i is None else end_i
+        self._conn.execute(
+            "insert or replace into seqs (ac, start_i, end_i, whole, seq) values (?, ?, ?, ?, ?)",
+            (ac, start_i, end_i, int(whole), seq),
+        )
+
+    def get_seq(self, ac: str, start_i: Optional[int] = None, end_i: Optional[int] = None) -> Optional[str]:
+        """returns ac[start_i:end_i] as get_seq does, or None if the bundle holds no span that covers it"""
+        start_i = start_i or 0
+        row = self._conn.execute(
+            "select start_i, seq from seqs where ac=? and start_i<=? and (whole or (? is not null and end_i>=?))"
+            " order by whole desc limit 1",
+            (ac, start_i, end_i, end_i),
+        ).fetchone()
+        if row is None:
+            return None
+        offset, seq = row
+        return seq[start_i - offset : end_i - offset if end_i is not None else None]
+
+
+def build(
+    hdp,
+    bundle: Bundle,
+    genes: Sequence[str] = (),
+    tx_acs: Sequence[str] = (),
+    assembly: Optional[str] = None,
+    alt_aln_method: Optional[str] = None,
+    flank: Optional[int] = DEFAULT_FLANK,
+    threads: int = 4,
+) -> List[Tuple[str, str, str]]:
+    """
+    crawls the api behind hdp, a UTAREST client whose persistent_cache is bundle, into bundle:
+    everything prefetch() fetches for genes and tx_acs (on the reference sequences of assembly, if
+    given), assembly's map, the sequences of the transcripts, and their alignments' spans of reference
+    sequence, widened by flank bases on each side. flank=None skips sequences.
+    returns the crawled (tx_ac, alt_ac, alt_aln_method) alignments.
+    """
+    bundle.set_meta("ping", json.dumps(hdp.pingresponse))
+    alt_acs = None
+    if assembly is not None:
+        alt_acs = set(hdp.get_assembly_map(assembly))
+    alignments = hdp.prefetch(genes=genes, tx_acs=tx_acs, alt_aln_method=alt_aln_method, alt_acs=alt_acs)
+    _logger.info(
+        "Crawled {} alignments of {} genes and {} transcripts".format(len(alignments), len(genes), len(tx_acs))
+    )
+    if flank is None:
+        return alignments
+
+    spans = _merge_spans(
+        (alt_ac, max(0, e["alt_start_i"] - flank), e["alt_end_i"] + flank)
+        for (tx_ac, alt_ac, method), exons in zip(alignments, hdp.get_tx_exons_many(alignments))
+        if method != "transcript"
+        for e in (exons if isinstance(exons, list) else [])
+    )
+    tx_acs = list(dict.fromkeys(tx_ac for tx_ac, _, _ in alignments))
+    with ThreadPoolExecutor(threads, thread_name_prefix="utarest-bundle") as executor:
+        for tx_ac, seq in zip(tx_acs, executor.map(lambda ac: hdp._fetch_seq(ac, None, None), tx_acs)):
+            if isinstance(seq, str):
+                bundle.add_seq(tx_ac, seq, whole=True)
+        fetched = executor.map(lambda span: hdp._fetch_seq(*span), spans)
+        for (ac, start_i, end_i), seq in zip(spans, fetched):
+            if isinstance(seq, str):
+                bundle.add_seq(ac, seq, start_i, end_i, whole=start_i == 0 and len(seq) < end_i)
+    _logger.info("Stored {} transcript sequences and {} reference spans".format(len(tx_acs), len(spans)))
+    return alignments
+
+
+def _merge_spans(spans: Iterable[Tuple[str, int, int]]) -> List[Tuple[str, int, int]]:
+    """returns the union of (ac, start_i, end_i) spans as disjoint spans, ordered by ac and start"""
+    merged: Dict[str, List[List[int]]] = {}
+    for ac, start_i, end_i in sorted(spans):
+        ac_spans = merged.setdefault(ac, [])
+        if ac_spans and start_i <= ac_spans[-1][1]:
+            ac_spans[-1][1] = max(ac_spans[-1][1], end_i)
+        else:
+            ac_spans.append([start_i, end_i])
+    return [(ac, s, e) for ac, ac_spans in merged.items() for s, e in ac_spans]
+
+
+def _names(values: Sequence[str]) -> List[str]:
+    """returns names given on the command line, reading @file arguments as one name per line"""
+    names = []
+    for value in values:
+        if value.startswith("@"):
+            with open(value[1:]) as f:
+                names.extend(line.strip() for line in f if line.strip() and not line.startswith("#"))
+        else:
+            names.append(value)
+    return names
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    from hgvs_dataproviders_rest.restclient import UTAREST
+
+    ap = argparse.ArgumentParser(description="builds an offline data bundle from the hgvs dataprovider REST api")
+    ap.add_argument("path", help="bundle file to create or extend")
+    ap.add_argument("--url", default=os.environ.get("UTAREST_URL"), help="api url (default: $UTAREST_URL)")
+    ap.add_argument("--genes", nargs="+", default=[], help="HGNC gene names, or @file with one per line")
+    ap.add_argument("--tx-acs", nargs="+", default=[], help="transcript accessions, or @file with one per line")
+    ap.add_argument("--assembly", help="keep only alignments on this assembly (e.g., GRCh38), and its map")
+    ap.add_argument("--alt-aln-method", help="keep only alignments made by this method (e.g., splign)")
+    ap.add_argument("--flank", type=int, default=DEFAULT_FLANK, help="reference bases kept around alignments")
+    ap.add_argument("--no-seqs", action="store_true", help="do not store sequences")
+    ap.add_argument("--threads", type=int, default=4, help="concurrent sequence requests")
+    args = ap.parse_args(argv)
+    if not args.url:
+        ap.error("--url or UTAREST_URL is required")
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    bundle = Bundle(args.path)
+    hdp = UTAREST(args.url, cache_size=0, persistent_cache=bundle, seq_prefetch=False)
+    t0 = time.monotonic()
+    build(
+        hdp,
+        bundle,
+        genes=_names(args.genes),
+        tx_acs=_names(args.tx_acs),
+        assembly=args.assembly,
+        alt_aln_method=args.alt_aln_method,
+        flank=None if args.no_seqs else args.flank,
+        threads=args.threads,
+    )
+    hdp.close()
+    bundle.close()
+    info = Bundle(args.path, readonly=True).cache_info()
+    _logger.info(
+        "Wrote {} responses ({} bytes) to {} in {:.1f}s".format(
+            info.entries, info.bytes, args.path, time.monotonic() - t0
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
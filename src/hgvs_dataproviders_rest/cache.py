@@ -0,0 +1,328 @@
+"""caches used by the hgvs dataprovider REST client and api
+
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, NamedTuple, Optional
+
+_MISSING = object()
+
+
+class CacheInfo(NamedTuple):
+    hits: int
+    misses: int
+    entries: int
+    bytes: int
+
+
+class LRUCache:
+    """threadsafe in-memory least-recently-used cache
+
+    The cache is bounded both by number of entries and by the total size of the
+    entries, as reported by the caller when each entry is set. Entries optionally
+    expire ttl seconds after they were set. Expired entries are not returned by
+    get(), but remain available to peek() until they are evicted, so that callers
+    can revalidate them, and renew() them if they are still current.
+
+    >>> c = LRUCache(max_entries=2)
+    >>> c.set("a", 1, size=1)
+    >>> c.set("b", 2, size=1)
+    >>> c.get("a")
+    1
+    >>> c.set("c", 3, size=1)
+    >>> c.get("b") is None
+    True
+    >>> c.cache_info()
+    CacheInfo(hits=1, misses=1, entries=2, bytes=2)
+
+    """
+
+    def __init__(self, max_entries: int = 10000, max_bytes: int = 256 * 2**20, ttl: Optional[float] = None):
+        """
+        :param max_entries: maximum number of entries
+        :param max_bytes: maximum total size of entries
+        :param ttl: seconds after which an entry expires, or None for no expiry
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.bytes = 0
+        self._data = OrderedDict()  # key -> (value, size, expires)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            entry = self._data.get(key)
+            return entry is not None and not self._expired(entry)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """returns the value for key and marks it as recently used, or default if absent or expired"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or self._expired(entry):
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def peek(self, key: Hashable, default: Any = None) -> Any:
+        """returns the value for key, even if expired, or default if absent; does not affect statistics or order"""
+        with self._lock:
+            entry = self._data.get(key)
+            return default if entry is None else entry[0]
+
+    def renew(self, key: Hashable) -> None:
+        """restarts the ttl of the entry for key, if present, and marks it as recently used"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                expires = time.monotonic() + self.ttl if self.ttl is not None else None
+                self._data[key] = (entry[0], entry[1], expires)
+                self._data.move_to_end(key)
+
+    def set(self, key: Hashable, value: Any, size: int) -> None:
+        """stores value under key, evicting least recently used entries as needed to stay within bounds"""
+        if size > self.max_bytes or self.max_entries <= 0:
+            return
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            if key in self._data:
+                self._pop(key)
+            self._data[key] = (value, size, expires)
+            self.bytes += size
+            while len(self._data) > self.max_entries or self.bytes > self.max_bytes:
+                self._pop(next(iter(self._data)))
+
+    def clear(self) -> None:
+        """removes all entries and resets statistics"""
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = self.bytes = 0
+
+    def cache_info(self) -> CacheInfo:
+        return CacheInfo(self.hits, self.misses, len(self._data), self.bytes)
+
+    def _expired(self, entry) -> bool:
+        return entry[2] is not None and entry[2] <= time.monotonic()
+
+    def _pop(self, key: Hashable) -> None:
+        _, size, _ = self._data.pop(key)
+        self.bytes -= size
+
+
+class SQLiteCache:
+    """persistent response cache stored in a local SQLite file
+
+    Keys are (namespace, key) pairs of strings; the REST client uses the
+    server's data and schema versions as the namespace, so one file may hold
+    responses for several data releases. Values are response bodies (bytes).
+
+    The file may be shared by several processes on a host. When the total
+    size of stored bodies exceeds max_bytes, the least recently used entries
+    are evicted. Access times are updated at most every touch_interval
+    seconds, so that cache hits rarely need to write.
+
+    In read-only mode, set() is a no-op, which suits a pre-warmed cache file
+    shipped in a container image. If the file itself is not writable (e.g., on
+    a read-only filesystem), it is opened as immutable.
+
+    >>> import os, tempfile
+    >>> tmpdir = tempfile.TemporaryDirectory()
+    >>> c = SQLiteCache(os.path.join(tmpdir.name, "cache.sqlite3"))
+    >>> c.set(("uta_20210129b/1.1", "gene_info/VHL"), b'{"hgnc":"VHL"}', size=14)
+    >>> c.get(("uta_20210129b/1.1", "gene_info/VHL"))
+    b'{"hgnc":"VHL"}'
+    >>> c.get(("uta_20180821/1.1", "gene_info/VHL")) is None
+    True
+    >>> c.close()
+    >>> tmpdir.cleanup()
+
+    """
+
+    _ddl = """
+        create table if not exists responses (
+            namespace text not null,
+            key text not null,
+            value blob not null,
+            size integer not null,
+            atime real not null,
+            primary key (namespace, key)
+        );
+        create index if not exists responses_atime_idx on responses(atime);
+        """
+
+    # check the total size every this many sets
+    _evict_interval = 100
+
+    def __init__(
+        self,
+        path: str,
+        max_bytes: int = 2 * 2**30,
+        readonly: bool = False,
+        touch_interval: float = 3600,
+        mmap_size: int = 0,
+    ):
+        """
+        :param path: path of the SQLite file; created if it does not exist (unless readonly)
+        :param max_bytes: maximum total size of stored bodies
+        :param readonly: open the file read-only and ignore set()
+        :param touch_interval: minimum seconds between access time updates of an entry
+        :param mmap_size: maximum number of bytes of the file that SQLite reads through a memory map
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.readonly = readonly
+        self.touch_interval = touch_interval
+        self.mmap_size = mmap_size
+        self.hits = 0
+        self.misses = 0
+        self._n_sets = 0
+        self._local = threading.local()
+        if not readonly:
+            self._conn.executescript(self._ddl)
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            if self.readonly:
+                immutable = "&immutable=1" if not os.access(self.path, os.W_OK) else ""
+                conn = sqlite3.connect("file:{}?mode=ro{}".format(self.path, immutable), uri=True)
+            else:
+                conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+                conn.execute("pragma journal_mode=wal")
+                conn.execute("pragma synchronous=normal")
+            if self.mmap_size:
+                conn.execute("pragma mmap_size={:d}".format(self.mmap_size))
+            self._local.conn = conn
+        return conn
+
+    def get(self, key, default: Any = None) -> Any:
+        """returns the value for key, or default if absent"""
+        row = self._conn.execute("select value, atime from responses where namespace=? and key=?", key).fetchone()
+        if row is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        now = time.time()
+        if not self.readonly and now - row[1] > self.touch_interval:
+            self._conn.execute("update responses set atime=? where namespace=? and key=?", (now, *key))
+        return row[0]
+
+    def set(self, key, value: bytes, size: int) -> None:
+        """stores value under key, evicting least recently used entries if the file exceeds max_bytes"""
+        if self.readonly or size > self.max_bytes:
+            return
+        self._conn.execute(
+            "insert or replace into responses (namespace, key, value, size, atime) values (?, ?, ?, ?, ?)",
+            (*key, value, size, time.time()),
+        )
+        self._n_sets += 1
+        if self._n_sets % self._evict_interval == 1:
+            self.evict()
+
+    def evict(self) -> None:
+        """removes least recently used entries until the total size is within 90% of max_bytes"""
+        conn = self._conn
+        total = conn.execute("select coalesce(sum(size), 0) from responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        excess = total - int(self.max_bytes * 0.9)
+        victims = []
+        for namespace, key, size in conn.execute("select namespace, key, size from responses order by atime"):
+            victims.append((namespace, key))
+            excess -= size
+            if excess <= 0:
+                break
+        conn.executemany("delete from responses where namespace=? and key=?", victims)
+
+    def cache_info(self) -> CacheInfo:
+        entries, size = self._conn.execute("select count(*), coalesce(sum(size), 0) from responses").fetchone()
+        return CacheInfo(self.hits, self.misses, entries, size)
+
+    def close(self) -> None:
+        """closes this thread's connection to the file, first folding the write-ahead log into the file"""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            if not self.readonly:
+                conn.execute("pragma wal_checkpoint(truncate)")
+            conn.close()
+            self._local.conn = None
+
+
+class VersionedCache:
+    """cache of JSON-compatible query results that is flushed when the data version changes
+
+    Results are kept in a local LRUCache and, optionally, in a shared Redis
+    instance (or anything with Redis' get and set methods), so that several
+    processes can share results. Redis keys include the data version, and
+    Redis entries expire after redis_ttl seconds.
+
+    get() and set() may make requests to Redis, and so block; get_local()
+    reads only the local cache, and does not.
+
+    >>> c = VersionedCache(LRUCache())
+    >>> c.set("uta_20180821", "gene_info/VHL", {"hgnc": "VHL"})
+    >>> c.get("uta_20180821", "gene_info/VHL")
+    {'hgnc': 'VHL'}
+    >>> c.get("uta_20210129b", "gene_info/VHL") is None
+    True
+    >>> len(c.local)
+    0
+
+    """
+
+    def __init__(self, local: LRUCache, redis=None, redis_ttl: Optional[float] = 7 * 24 * 3600):
+        self.local = local
+        self.redis = redis
+        self.redis_ttl = redis_ttl
+        self.version = None
+        self._lock = threading.Lock()
+
+    def get_local(self, version: str, key: str, default: Any = None) -> Any:
+        """returns the result for key in the given data version from the local cache, or default"""
+        self._check_version(version)
+        return self.local.get(key, default)
+
+    def get(self, version: str, key: str, default: Any = None) -> Any:
+        """returns the result for key in the given data version, from the local cache or Redis, or default"""
+        value = self.get_local(version, key, _MISSING)
+        if value is not _MISSING:
+            return value
+        if self.redis is not None:
+            body = self.redis.get(self._redis_key(version, key))
+            if body is not None:
+                value = json.loads(body)
+                self.local.set(key, value, size=len(body))
+                return value
+        return default
+
+    def set(self, version: str, key: str, value: Any) -> None:
+        """stores the result for key in the given data version"""
+        self._check_version(version)
+        body = json.dumps(value, separators=(",", ":"))
+        self.local.set(key, value, size=len(body))
+        if self.redis is not None:
+            self.redis.set(self._redis_key(version, key), body, ex=self.redis_ttl)
+
+    def _check_version(self, version: str) -> None:
+        if version != self.version:
+            with self._lock:
+                if version != self.version:
+                    self.local.clear()
+                    self.version = version
+
+    @staticmethod
+    def _redis_key(version: str, key: str) -> str:
+        return "utarest:{}:{}".format(version, key)
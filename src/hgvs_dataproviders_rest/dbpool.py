@@ -0,0 +1,257 @@
+"""pooled UTA database connections for the hgvs dataprovider REST api
+
+hgvs.dataproviders.uta can use a psycopg2 ThreadedConnectionPool, but that pool
+raises an error rather than waiting when all connections are in use, does not
+check connections before handing them out, and is sized by hgvs' global
+config. This module provides a pool that waits, health-checks and replaces
+broken connections, and counts its usage.
+
+"""
+
+import contextlib
+import inspect
+import logging
+import os
+import threading
+import time
+
+import hgvs
+import psycopg2
+import psycopg2.extensions
+import psycopg2.extras
+import psycopg2.pool
+from hgvs.dataproviders.uta import UTA_postgresql, _get_uta_db_url, _parse_url
+
+_logger = logging.getLogger(__name__)
+
+
+class UTAConnectionPool(psycopg2.pool.ThreadedConnectionPool):
+    """ThreadedConnectionPool that waits for a free connection, replaces unhealthy connections,
+    and counts its usage
+
+    minconn connections are opened at startup, and more are opened on demand, up
+    to maxconn. Unlike ThreadedConnectionPool, which closes returned connections
+    once minconn are idle, returned connections are kept open for reuse.
+    Connections idle for longer than health_check_interval seconds are checked
+    with a trivial query before they are handed out.
+    """
+
+    def __init__(
+        self, minconn: int, maxconn: int, *args, timeout: float = 30, health_check_interval: float = 60, **kwargs
+    ):
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self.n_created = 0
+        self.n_checkouts = 0
+        self.n_waits = 0
+        self.wait_seconds = 0.0
+        self.n_discarded = 0
+        self._available = threading.BoundedSemaphore(maxconn)
+        self._last_used = {}  # id(conn) -> monotonic time of last putconn
+        super().__init__(minconn, maxconn, *args, **kwargs)
+        # psycopg2 keeps at most self.minconn idle connections
+        self.initconn = self.minconn
+        self.minconn = self.maxconn
+
+    def getconn(self, key=None):
+        t0 = time.monotonic()
+        if not self._available.acquire(blocking=False):
+            self.n_waits += 1
+            if not self._available.acquire(timeout=self.timeout):
+                raise psycopg2.pool.PoolError("timed out waiting {}s for a connection".format(self.timeout))
+        self.wait_seconds += time.monotonic() - t0
+        try:
+            while True:
+                conn = super().getconn(key)
+                if self._healthy(conn):
+                    break
+                _logger.warning("Discarding unhealthy pool connection")
+                self.n_discarded += 1
+                super().putconn(conn, key, close=True)
+        except Exception:
+            self._available.release()
+            raise
+        self.n_checkouts += 1
+        return conn
+
+    def putconn(self, conn, key=None, close=False):
+        self._last_used[id(conn)] = time.monotonic()
+        try:
+            super().putconn(conn, key, close=close or conn.closed)
+            if conn.closed:
+                del self._last_used[id(conn)]
+        finally:
+            self._available.release()
+
+    def stats(self) -> dict:
+        """returns pool sizes and usage counters"""
+        return {
+            "min": self.initconn,
+            "max": self.maxconn,
+            "in_use": len(self._used),
+            "idle": len(self._pool),
+            "created": self.n_created,
+            "checkouts": self.n_checkouts,
+            "waits": self.n_waits,
+            "wait_seconds": self.wait_seconds,
+            "discarded": self.n_discarded,
+        }
+
+    def _connect(self, key=None):
+        self.n_created += 1
+        conn = super()._connect(key)
+        self._last_used[id(conn)] = time.monotonic()
+        return conn
+
+    def _healthy(self, conn) -> bool:
+        # connections are returned idle; one left in a transaction could not be switched to autocommit
+        if conn.closed or conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            return False
+        if time.monotonic() - self._last_used.get(id(conn), 0) > self.health_check_interval:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("select 1")
+                if not conn.autocommit:
+                    # end the transaction that the check began
+                    conn.rollback()
+            except psycopg2.Error:
+                return False
+        return True
+
+
+class PooledUTA(UTA_postgresql):
+    """UTA_postgresql backed by a UTAConnectionPool; queries that fail because the connection
+    was lost are retried once on a fresh connection"""
+
+    def __init__(
+        self, url, pool_min: int, pool_max: int, pool_timeout: float = 30, application_name=None, mode=None, cache=None
+    ):
+        self.pool_min = pool_min
+        self.pool_max = pool_max
+        self.pool_timeout = pool_timeout
+        super().__init__(url, pooling=True, application_name=application_name, mode=mode, cache=cache)
+
+    # alignments_for_region without its region filter
+    _alignments_for_ac_sql = """
+        select tx_ac,alt_ac,alt_strand,alt_aln_method,min(start_i) as start_i,max(end_i) as end_i
+        from exon_set ES
+        join exon E on ES.exon_set_id=E.exon_set_id
+        where alt_ac=%s
+        group by tx_ac,alt_ac,alt_strand,alt_aln_method
+        """
+
+    def pool_stats(self) -> dict:
+        return self._pool.stats()
+
+    def get_all_gene_info(self):
+        """returns the rows get_gene_info returns, for all genes"""
+        return self._fetchall("select * from gene")
+
+    def get_acs_for_protein_md5(self, md5):
+        """returns get_acs_for_protein_seq(seq) for the sequence whose MD5 digest (see bioutils.digests.seq_md5)
+        is md5"""
+        return [r["ac"] for r in self._fetchall(self._queries["acs_for_protein_md5"], [md5])] + ["MD5_" + md5]
+
+    def get_alignments_for_ac(self, alt_ac, alt_aln_method=None):
+        """returns all alignments on alt_ac, with the same columns as get_alignments_for_region"""
+        alignments = self._fetchall(self._alignments_for_ac_sql, [alt_ac])
+        if alt_aln_method is not None:
+            alignments = [a for a in alignments if a["alt_aln_method"] == alt_aln_method]
+        return alignments
+
+    def iter_alignments_for_ac(self, alt_ac, alt_aln_method=None, batch_size: int = 2000):
+        """
+        yields all alignments on alt_ac, in order of start, as lists of at most batch_size dicts with the
+        same columns as get_alignments_for_region. rows are read with a server-side cursor, so memory use
+        does not grow with the number of alignments; the pooled connection is held until the generator is
+        exhausted or closed.
+        """
+        conn = self._pool.getconn()
+        close = False
+        try:
+            conn.autocommit = True
+            if conn not in self._conns_seen:
+                with conn.cursor() as cur:
+                    self._set_search_path(cur)
+                self._conns_seen.add(conn)
+            # server-side (named) cursors exist only within a transaction
+            conn.autocommit = False
+            with conn.cursor(name="utarest_alignments", cursor_factory=psycopg2.extras.DictCursor) as cur:
+                cur.execute(self._alignments_for_ac_sql + " order by start_i", [alt_ac])
+                while True:
+                    rows = cur.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    batch = [dict(r) for r in rows if alt_aln_method is None or r["alt_aln_method"] == alt_aln_method]
+                    if batch:
+                        yield batch
+        except psycopg2.OperationalError:
+            close = True
+            raise
+        finally:
+            if not close and not conn.closed:
+                conn.rollback()
+                conn.autocommit = True
+            self._pool.putconn(conn, close=close)
+
+    def _connect(self):
+        if self.application_name is None:
+            st = inspect.stack()
+            self.application_name = os.path.basename(st[-1][1])
+        conn_args = dict(
+            host=self.url.hostname,
+            port=self.url.port,
+            database=self.url.database,
+            user=self.url.username,
+            password=self.url.password,
+            application_name=self.application_name + "/" + hgvs.__version__,
+        )
+        _logger.info("Using UTAConnectionPool (min={}, max={})".format(self.pool_min, self.pool_max))
+        self._pool = UTAConnectionPool(self.pool_min, self.pool_max, timeout=self.pool_timeout, **conn_args)
+        self._ensure_schema_exists()
+        # remap sqlite's ? placeholders to psycopg2's %s
+        self._queries = {k: v.replace("?", "%s") for k, v in self._queries.items()}
+
+    @contextlib.contextmanager
+    def _get_cursor(self, n_retries=1):
+        """returns a context manager for a cursor on a pooled connection; broken connections are discarded"""
+        conn = self._pool.getconn()
+        close = False
+        try:
+            conn.autocommit = True
+            cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+            if conn not in self._conns_seen:
+                self._set_search_path(cur)
+                self._conns_seen.add(conn)
+            yield cur
+            cur.close()
+        except psycopg2.OperationalError:
+            close = True
+            raise
+        finally:
+            self._pool.putconn(conn, close=close)
+
+    def _fetchone(self, sql, *args):
+        return self._with_retry(super()._fetchone, sql, *args)
+
+    def _fetchall(self, sql, *args):
+        return self._with_retry(super()._fetchall, sql, *args)
+
+    def _with_retry(self, fetch, sql, *args):
+        try:
+            return fetch(sql, *args)
+        except psycopg2.OperationalError:
+            _logger.warning("Lost connection to {url}; retrying on a new connection".format(url=self.url))
+            return fetch(sql, *args)
+
+
+def connect(db_url=None, pool_min: int = 1, pool_max: int = 10, pool_timeout: float = 30, application_name=None):
+    """connects to UTA with a connection pool; db_url defaults as in hgvs.dataproviders.uta.connect()"""
+    if db_url is None:
+        db_url = _get_uta_db_url()
+    url = _parse_url(db_url)
+    if url.scheme != "postgresql":
+        raise RuntimeError("{url.scheme} in {url} is not currently supported".format(url=url))
+    return PooledUTA(
+        url, pool_min=pool_min, pool_max=pool_max, pool_timeout=pool_timeout, application_name=application_name
+    )
@@ -0,0 +1,135 @@
+"""response formats negotiated between the hgvs dataprovider REST api and client
+
+JSON is the default. Clients may ask, with an Accept header, for:
+
+* application/msgpack: MessagePack, if the msgpack package is installed
+* application/vnd.utarest.columnar+json: JSON in which a list of rows with the
+  same keys (e.g., from /tx_exons) is sent as its keys once plus a list of
+  value lists, rather than repeating every key in every row
+
+Columnar responses are wrapped, so that they can be decoded unambiguously:
+row lists as {"columns": [...], "rows": [[...], ...]}, and all other values
+as {"value": ...}.
+
+JSON is encoded and decoded with orjson if it is installed, and with the
+json module otherwise; both give the same values.
+
+>>> rows = [{"tx_ac": "NM_1", "ord": 0}, {"tx_ac": "NM_1", "ord": 1}]
+>>> to_columnar(rows)
+{'columns': ['tx_ac', 'ord'], 'rows': [['NM_1', 0], ['NM_1', 1]]}
+>>> from_columnar(to_columnar(rows)) == rows
+True
+>>> negotiate("application/vnd.utarest.columnar+json, application/json;q=0.5")
+'application/vnd.utarest.columnar+json'
+>>> negotiate("*/*")
+'application/json'
+
+"""
+
+import json
+from typing import Any, Optional
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+COLUMNAR_JSON = "application/vnd.utarest.columnar+json"
+
+# newline-delimited JSON, one row per line; sent only by routes that stream rows (e.g., /alignments), not negotiated
+NDJSON = "application/x-ndjson"
+
+# media types that can be encoded here, in order of preference when a client accepts several equally
+MEDIA_TYPES = [t for t in (MSGPACK, COLUMNAR_JSON, JSON) if t != MSGPACK or msgpack is not None]
+
+# other names for the same media types
+_ALIASES = {"application/x-msgpack": MSGPACK}
+
+
+def negotiate(accept: Optional[str]) -> str:
+    """returns the media type to send for an Accept header: the supported type with the highest
+    quality, or JSON if the client does not ask for a supported type"""
+    best, best_q = JSON, 0.0
+    for item in (accept or "").split(","):
+        media_type, *params = [p.strip() for p in item.split(";")]
+        media_type = _ALIASES.get(media_type.lower(), media_type.lower())
+        if media_type not in MEDIA_TYPES:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if q > best_q or (q == best_q and MEDIA_TYPES.index(media_type) < MEDIA_TYPES.index(best)):
+            best, best_q = media_type, q
+    return best
+
+
+def accept_header(media_type: str) -> str:
+    """returns an Accept header that prefers media_type and falls back to JSON"""
+    if media_type == JSON:
+        return JSON
+    return "{}, {};q=0.5".format(media_type, JSON)
+
+
+def to_columnar(value: Any) -> dict:
+    """returns the columnar form of a JSON-compatible value"""
+    if isinstance(value, list) and value and all(isinstance(r, dict) for r in value):
+        columns = list(value[0])
+        if all(len(r) == len(columns) and all(c in r for c in columns) for r in value):
+            return {"columns": columns, "rows": [[r[c] for c in columns] for r in value]}
+    return {"value": value}
+
+
+def from_columnar(body: dict) -> Any:
+    """returns the value of a columnar body"""
+    if "columns" in body:
+        columns = body["columns"]
+        return [dict(zip(columns, row)) for row in body["rows"]]
+    return body["value"]
+
+
+def encode(value: Any, media_type: str) -> bytes:
+    """encodes a JSON-compatible value as media_type"""
+    if media_type == MSGPACK:
+        return msgpack.packb(value)
+    if media_type == COLUMNAR_JSON:
+        value = to_columnar(value)
+    return dumps(value)
+
+
+def decode(body: bytes, media_type: Optional[str]) -> Any:
+    """decodes a response body; media_type may be a Content-Type header, and is JSON if unrecognized"""
+    media_type = (media_type or JSON).split(";")[0].strip().lower()
+    media_type = _ALIASES.get(media_type, media_type)
+    if media_type == MSGPACK:
+        if msgpack is None:
+            raise ImportError("Received a MessagePack response, but the msgpack package is not installed")
+        return msgpack.unpackb(body)
+    if media_type == COLUMNAR_JSON:
+        return from_columnar(loads(body))
+    return loads(body)
+
+
+def dumps(value: Any) -> bytes:
+    """encodes a JSON-compatible value as compact UTF-8 JSON"""
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def loads(body: bytes) -> Any:
+    """decodes a JSON body"""
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
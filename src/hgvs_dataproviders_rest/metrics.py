@@ -0,0 +1,121 @@
+"""Prometheus metrics of the hgvs dataprovider REST api
+
+If prometheus_client is installed, the api records, by route template
+(e.g., "/tx_info/{tx_ac}/{alt_ac}"):
+
+* utarest_request_duration_seconds: latency of requests, by route and method
+* utarest_requests_in_flight: requests being handled
+* utarest_request_errors_total: responses with status 400 or above (and
+  unhandled exceptions, as 500), by route and status code
+* utarest_db_duration_seconds: time spent in UTA lookups
+* utarest_seq_duration_seconds: time spent in sequence lookups
+* utarest_serialize_duration_seconds: time spent encoding response bodies,
+  by route and media type
+
+and serves them at /metrics. Lookups are timed on the worker threads that
+run them, so time spent waiting for a thread or connection is excluded.
+
+Each process keeps its own metrics. When serving with several worker
+processes (see README), point PROMETHEUS_MULTIPROC_DIR at an empty
+directory, so that /metrics reports the metrics of all workers.
+
+"""
+
+import functools
+import os
+import time
+from typing import Callable, Optional, Tuple
+
+try:
+    import prometheus_client
+    from prometheus_client import (
+        CollectorRegistry,
+        Counter,
+        Gauge,
+        Histogram,
+        exposition,
+        multiprocess,
+    )
+except ImportError:  # pragma: no cover
+    prometheus_client = None
+
+# lookups and encoding take from tens of microseconds (cached gene info) to seconds (whole chromosomes)
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Metrics:
+    """the Prometheus metrics of the api; requires prometheus_client"""
+
+    def __init__(self, registry: Optional["CollectorRegistry"] = None):
+        """
+        :param registry: registry in which the metrics are registered; defaults to prometheus_client's
+        """
+        if prometheus_client is None:
+            raise ImportError("Metrics require the prometheus_client package")
+        registry = registry or prometheus_client.REGISTRY
+        self.registry = registry
+        self.request_seconds = Histogram(
+            "utarest_request_duration_seconds",
+            "Latency of requests",
+            ["route", "method"],
+            buckets=BUCKETS,
+            registry=registry,
+        )
+        self.in_flight = Gauge(
+            "utarest_requests_in_flight",
+            "Requests being handled",
+            ["route"],
+            multiprocess_mode="livesum",
+            registry=registry,
+        )
+        self.errors = Counter(
+            "utarest_request_errors",
+            "Responses with status 400 or above, and unhandled exceptions",
+            ["route", "status_code"],
+            registry=registry,
+        )
+        self.db_seconds = Histogram(
+            "utarest_db_duration_seconds", "Time spent in UTA lookups", ["route"], buckets=BUCKETS, registry=registry
+        )
+        self.seq_seconds = Histogram(
+            "utarest_seq_duration_seconds",
+            "Time spent in sequence lookups",
+            ["route"],
+            buckets=BUCKETS,
+            registry=registry,
+        )
+        self.serialize_seconds = Histogram(
+            "utarest_serialize_duration_seconds",
+            "Time spent encoding response bodies",
+            ["route", "media_type"],
+            buckets=BUCKETS,
+            registry=registry,
+        )
+
+    @staticmethod
+    def timed(histogram, func: Callable) -> Callable:
+        """returns a function that calls func and observes its duration in histogram (a labelled child)"""
+
+        @functools.wraps(func)
+        def wrapper(*args):
+            t0 = time.perf_counter()
+            try:
+                return func(*args)
+            finally:
+                histogram.observe(time.perf_counter() - t0)
+
+        return wrapper
+
+    def exposition(self, accept: Optional[str] = None) -> Tuple[bytes, str]:
+        """returns the metrics in the text format chosen by the Accept header, and its content type"""
+        registry = self.registry
+        if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        encoder, content_type = exposition.choose_encoder(accept or "")
+        return encoder(registry), content_type
+
+
+def make_metrics() -> Optional[Metrics]:
+    """returns the api's metrics, or None if prometheus_client is not installed"""
+    return Metrics() if prometheus_client is not None else None
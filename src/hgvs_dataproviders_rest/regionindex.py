@@ -0,0 +1,61 @@
+"""in-memory index of the alignments on a reference sequence, for region queries
+
+UTA's alignments_for_region (and tx_for_region, which calls it) returns the
+alignments that span a region: those whose extent, from the start of their
+first exon to the end of their last, starts before the region starts and
+ends at or after the region ends. A RegionIndex answers the same queries
+for one reference sequence locally, from all of its alignments.
+
+Alignments are sorted by start. An alignment that spans a region starts
+before the region, and, since it is at most as long as the longest
+alignment, no earlier than that length before the region ends; so only
+that window of the sorted alignments is scanned.
+
+>>> idx = RegionIndex([
+...     {"tx_ac": "NM_1", "alt_ac": "NC_1", "alt_strand": 1, "alt_aln_method": "splign", "start_i": 100, "end_i": 900},
+...     {"tx_ac": "NM_2", "alt_ac": "NC_1", "alt_strand": -1, "alt_aln_method": "splign", "start_i": 400, "end_i": 600},
+... ])
+>>> [r["tx_ac"] for r in idx.alignments_for_region(450, 550)]
+['NM_1', 'NM_2']
+>>> [r["tx_ac"] for r in idx.alignments_for_region(50, 550)]
+[]
+
+"""
+
+from bisect import bisect_left, bisect_right
+from typing import Iterable, List, Optional
+
+
+class RegionIndex:
+    """alignments on one reference sequence, indexed by start"""
+
+    def __init__(self, alignments: Iterable[dict] = ()):
+        """
+        :param alignments: rows as returned by alignments_for_region, with at least alt_aln_method,
+            start_i, and end_i
+        """
+        self._rows = sorted(alignments, key=lambda r: r["start_i"])
+        self._starts = [r["start_i"] for r in self._rows]
+        self._max_length = max((r["end_i"] - r["start_i"] for r in self._rows), default=0)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def add(self, alignment: dict) -> None:
+        """adds an alignment; adding alignments in order of start, as streamed by /alignments, is cheapest"""
+        i = len(self._rows)
+        if self._starts and alignment["start_i"] < self._starts[-1]:
+            i = bisect_right(self._starts, alignment["start_i"])
+        self._rows.insert(i, alignment)
+        self._starts.insert(i, alignment["start_i"])
+        self._max_length = max(self._max_length, alignment["end_i"] - alignment["start_i"])
+
+    def alignments_for_region(self, start_i: int, end_i: int, alt_aln_method: Optional[str] = None) -> List[dict]:
+        """returns the alignments that span start_i..end_i, as UTA's alignments_for_region does, in order of start"""
+        lo = bisect_left(self._starts, end_i - self._max_length)
+        hi = bisect_left(self._starts, start_i)
+        return [
+            r
+            for r in self._rows[lo:hi]
+            if end_i <= r["end_i"] and (alt_aln_method is None or r["alt_aln_method"] == alt_aln_method)
+        ]
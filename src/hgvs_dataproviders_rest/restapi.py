@@ -1,59 +1,564 @@
-from typing import List, Optional, Union
-
-from fastapi import FastAPI, HTTPException
-from hgvs.dataproviders.uta import UTABase, connect
+import asyncio
+import contextlib
+import functools
+import gc
+import hashlib
+import os
+import re
+import time
+from contextvars import ContextVar
+from typing import (
+    Annotated,
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
+
+import anyio
+from bioutils.assemblies import get_assembly_names
+from fastapi import Body, FastAPI, Header, HTTPException, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
+from hgvs.dataproviders.uta import UTABase
 from hgvs.exceptions import HGVSDataNotAvailableError, HGVSError
+from pydantic import BaseModel
+
+from hgvs_dataproviders_rest.cache import LRUCache, VersionedCache
+from hgvs_dataproviders_rest.dbpool import PooledUTA, connect
+from hgvs_dataproviders_rest.formats import JSON, NDJSON, encode, negotiate
+from hgvs_dataproviders_rest.metrics import make_metrics
+from hgvs_dataproviders_rest.singleflight import AsyncSingleFlight
+
+try:
+    import redis
+except ImportError:  # pragma: no cover
+    redis = None
+
+# maximum number of keys accepted by a single /batch request
+MAX_BATCH_SIZE = int(os.environ.get("UTAREST_MAX_BATCH_SIZE", "1000"))
+
+# set UTAREST_PRELOAD=1 to load assembly maps and gene info into the result cache at import (see preload)
+PRELOAD = os.environ.get("UTAREST_PRELOAD", "0").lower() in ("1", "true", "yes")
+
+# UTA connection pool size, and seconds to wait for a free connection
+POOL_MIN = int(os.environ.get("UTAREST_POOL_MIN", "1"))
+POOL_MAX = int(os.environ.get("UTAREST_POOL_MAX", "10"))
+POOL_TIMEOUT = float(os.environ.get("UTAREST_POOL_TIMEOUT", "30"))
+
+# UTA (psycopg2) and sequence lookups block, so they run on worker threads rather than
+# on the event loop. Each kind of lookup has its own bound on concurrent threads, so
+# that slow sequence fetches cannot hold up cheap UTA lookups such as /gene_info.
+DB_CONCURRENCY = int(os.environ.get("UTAREST_DB_CONCURRENCY", str(POOL_MAX)))
+SEQ_CONCURRENCY = int(os.environ.get("UTAREST_SEQ_CONCURRENCY", "4"))
+db_limiter = anyio.CapacityLimiter(DB_CONCURRENCY)
+seq_limiter = anyio.CapacityLimiter(SEQ_CONCURRENCY)
+
+# UTA data are immutable within a data version, so results of transcript and gene lookups
+# are cached, bounded by number of entries and by size. Set UTAREST_REDIS_URL to also
+# share results between processes through Redis.
+RESULT_CACHE_SIZE = int(os.environ.get("UTAREST_RESULT_CACHE_SIZE", "100000"))
+RESULT_CACHE_BYTES = int(os.environ.get("UTAREST_RESULT_CACHE_BYTES", str(256 * 2**20)))
+REDIS_URL = os.environ.get("UTAREST_REDIS_URL")
+
+# GET responses carry a strong ETag derived from the data and schema versions and the request,
+# and may be cached by clients and proxies for CACHE_MAX_AGE seconds. Requests whose
+# If-None-Match matches are answered 304 Not Modified without a lookup.
+CACHE_MAX_AGE = int(os.environ.get("UTAREST_CACHE_MAX_AGE", "86400"))
+UNCACHEABLE_PATHS = {"/ping", "/pool_stats", "/cache_stats", "/metrics"}
+
+# responses of at least GZIP_MIN_SIZE bytes are gzip-compressed for clients that accept it
+GZIP_MIN_SIZE = int(os.environ.get("UTAREST_GZIP_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.environ.get("UTAREST_GZIP_LEVEL", "6"))
+
+# sequences requested as text/plain are streamed in chunks of this many bases
+SEQ_CHUNK_SIZE = 2**20
+
+# /acs_for_protein_md5 takes the hex MD5 digest of a normalized protein sequence
+MD5_RE = re.compile("[0-9a-fA-F]{32}")
+
+
+def make_result_cache() -> VersionedCache:
+    shared = None
+    if REDIS_URL:
+        if redis is None:
+            raise ImportError("UTAREST_REDIS_URL is set, but the redis package is not installed")
+        shared = redis.Redis.from_url(REDIS_URL)
+    return VersionedCache(LRUCache(RESULT_CACHE_SIZE, RESULT_CACHE_BYTES), redis=shared)
+
+
+# the response format negotiated for the current request (see formats)
+response_media_type: ContextVar[str] = ContextVar("response_media_type", default=JSON)
+# the route template (e.g., "/gene_info/{gene}") of the current request, by which metrics are labelled
+current_route: ContextVar[str] = ContextVar("current_route", default="")
+# Prometheus metrics, if prometheus_client is installed (see metrics)
+metrics = make_metrics()
+
+
+class NegotiatedResponse(JSONResponse):
+    """response encoded as the media type negotiated for the current request; JSON by default"""
+
+    def render(self, content: Any) -> bytes:
+        self.media_type = response_media_type.get()
+        if metrics is None:
+            return encode(content, self.media_type)
+        with metrics.serialize_seconds.labels(current_route.get(), self.media_type).time():
+            return encode(content, self.media_type)
+
+
+def open_conn() -> PooledUTA:
+    return connect(pool_min=POOL_MIN, pool_max=POOL_MAX, pool_timeout=POOL_TIMEOUT, application_name="utarest")
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    """
+    opens the UTA connection pool, and looks up its versions (see metadata), when a worker starts, and
+    closes it when it stops. connections are opened in each worker, after it has been forked, so that
+    workers never share a connection.
+    """
+    global conn, _metadata
+    if conn is None:
+        conn = await anyio.to_thread.run_sync(open_conn)
+    await metadata()
+    yield
+    conn.close()
+    conn = None
+    _metadata = None
+
+
+app = FastAPI(default_response_class=NegotiatedResponse, lifespan=lifespan)
+app.add_middleware(GZipMiddleware, minimum_size=GZIP_MIN_SIZE, compresslevel=GZIP_LEVEL)
+# opened by lifespan
+conn: Optional[PooledUTA] = None
+result_cache = make_result_cache()
+# identical lookups in flight at the same time are run once (see run_db, run_seq, cached_db)
+flights = AsyncSingleFlight()
+_MISSING = object()
+_metadata: Optional[dict] = None
+
+
+async def metadata() -> dict:
+    """
+    returns the data_version, schema_version, and sequence_source of the UTA connection. they are looked
+    up once, when the worker starts (see lifespan), so that /ping and ETags need no database query.
+    """
+    global _metadata
+    if _metadata is None:
+        _metadata = {
+            "data_version": conn.data_version(),
+            "schema_version": await run_db(conn.schema_version),
+            "sequence_source": UTABase.sequence_source(),
+        }
+    return _metadata
+
+
+async def versions() -> str:
+    """returns the "data_version/schema_version" of the UTA connection"""
+    m = await metadata()
+    return "{}/{}".format(m["data_version"], m["schema_version"])
+
+
+def make_etag(version: str, request: Request) -> str:
+    """returns a strong ETag for the response to request in the given data version;
+    responses negotiated from different Accept headers, or with and without gzip, get different ETags"""
+    query = "&".join(sorted("{}={}".format(k, v) for k, v in request.query_params.multi_items()))
+    accept = request.headers.get("accept", "")
+    gzip = "gzip" in request.headers.get("accept-encoding", "")
+    digest = hashlib.sha1("{}{}?{}\n{}\n{}".format(version, request.url.path, query, accept, gzip).encode()).hexdigest()
+    return '"{}"'.format(digest)
+
+
+def etag_matches(etag: str, if_none_match: str) -> bool:
+    """returns True if etag matches any entity tag in an If-None-Match header (weak comparison);
+    "*" is not matched here, since it matches only if the request has a representation (see conditional_get)"""
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if (tag[2:] if tag.startswith("W/") else tag) == etag:
+            return True
+    return False
+
+
+@app.middleware("http")
+async def negotiate_format(request: Request, call_next) -> Response:
+    """chooses the response format from the Accept header; error responses are always JSON"""
+    response_media_type.set(negotiate(request.headers.get("accept")))
+    return await call_next(request)
+
+
+@app.middleware("http")
+async def conditional_get(request: Request, call_next) -> Response:
+    """adds ETag and Cache-Control headers to successful GET responses, and answers matching
+    If-None-Match requests with 304 Not Modified. "If-None-Match: *" is matched only once the route
+    has answered 200 or 206, so that requests for missing data still get their 404"""
+    if request.method != "GET" or request.url.path in UNCACHEABLE_PATHS:
+        return await call_next(request)
+    etag = make_etag(await versions(), request)
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "public, max-age={}".format(CACHE_MAX_AGE),
+        "Vary": "Accept, Accept-Encoding",
+    }
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None and etag_matches(etag, if_none_match):
+        return Response(status_code=304, headers=headers)
+    response = await call_next(request)
+    if response.status_code in (200, 206):
+        if if_none_match is not None and if_none_match.strip() == "*":
+            return Response(status_code=304, headers=headers)
+        response.headers.update(headers)
+    return response
+
+
+def route_template(scope: dict) -> str:
+    """returns the path template of the route whose path matches a request's, or "" if none does"""
+    path = scope["path"]
+    for route in app.router.routes:
+        if route.path_regex.match(path):
+            return route.path
+    return ""
+
+
+@app.middleware("http")
+async def instrument(request: Request, call_next) -> Response:
+    """records the latency of each request, requests in flight, and errors, by route, if metrics are enabled.
+    added last, it sees every response, including those of the other middleware (e.g., 304s)"""
+    if metrics is None:
+        return await call_next(request)
+    route = route_template(request.scope)
+    current_route.set(route)
+    t0 = time.perf_counter()
+    with metrics.in_flight.labels(route).track_inprogress():
+        try:
+            response = await call_next(request)
+        except Exception:
+            metrics.errors.labels(route, "500").inc()
+            raise
+        finally:
+            metrics.request_seconds.labels(route, request.method).observe(time.perf_counter() - t0)
+    if response.status_code >= 400:
+        metrics.errors.labels(route, str(response.status_code)).inc()
+    return response
+
+
+def db_timed(func: Callable) -> Callable:
+    """returns func, timed as a UTA lookup of the current route if metrics are enabled"""
+    return func if metrics is None else metrics.timed(metrics.db_seconds.labels(current_route.get()), func)
+
+
+def seq_timed(func: Callable) -> Callable:
+    """returns func, timed as a sequence lookup of the current route if metrics are enabled"""
+    return func if metrics is None else metrics.timed(metrics.seq_seconds.labels(current_route.get()), func)
+
+
+async def run_db(func: Callable, *args) -> Any:
+    """runs a blocking UTA lookup on a worker thread; concurrent identical lookups share one run"""
+    lookup = functools.partial(anyio.to_thread.run_sync, db_timed(func), *args, limiter=db_limiter)
+    return await flights.do((func, args), lookup)
+
+
+async def run_seq(func: Callable, *args) -> Any:
+    """runs a blocking sequence lookup on a worker thread; concurrent identical lookups share one run"""
+    lookup = functools.partial(anyio.to_thread.run_sync, seq_timed(func), *args, limiter=seq_limiter)
+    return await flights.do((func, args), lookup)
+
+
+async def cached_db(endpoint: str, func: Callable, convert: Callable, *args) -> Any:
+    """
+    returns convert(func(*args)) for a UTA lookup, from the result cache if possible.
+    only the local result cache is read on the event loop. otherwise, a worker thread looks the result
+    up in Redis (if configured), or runs the lookup and conversion (which returns a JSON-compatible
+    value) and caches the result for the current data version. errors are not cached. concurrent
+    requests for the same uncached result share one lookup.
+    """
+    version = conn.data_version()
+    key = "/".join([endpoint, *map(str, args)])
+    value = result_cache.get_local(version, key, _MISSING)
+    if value is _MISSING:
+        timed = db_timed(func)
+
+        def fetch() -> Any:
+            value = result_cache.get(version, key, _MISSING)
+            if value is _MISSING:
+                value = convert(timed(*args))
+                result_cache.set(version, key, value)
+            return value
+
+        async def lookup() -> Any:
+            return await anyio.to_thread.run_sync(fetch, limiter=db_limiter)
+
+        value = await flights.do((version, key), lookup)
+    return value
+
 
-app = FastAPI()
-conn = connect()
+# column values of these types are JSON-compatible as they are; others (e.g., datetimes) are converted
+_JSON_SCALARS = (str, int, float, bool, type(None))
+
+
+def json_row(columns: List[str], values) -> dict:
+    """returns a JSON-compatible dict of a row's values, by column name"""
+    return {c: v if isinstance(v, _JSON_SCALARS) else jsonable_encoder(v) for c, v in zip(columns, values)}
+
+
+def dicts(rows: Optional[list]) -> Optional[List[dict]]:
+    """
+    converts DictRows (or dicts) to JSON-compatible dicts. the column names are read once, from the first
+    row, and zipped with the values of each row, which is much faster than copying each DictRow with dict()
+    and then passing the dicts through jsonable_encoder.
+    """
+    if not rows:
+        return rows
+    columns = list(rows[0].keys())
+    return [json_row(columns, r.values() if isinstance(r, dict) else r) for r in rows]
+
+
+def one_dict(row) -> Optional[dict]:
+    """converts a DictRow (or dict) to a JSON-compatible dict"""
+    return row if row is None else dicts([row])[0]
+
+
+def identity(value: Any) -> Any:
+    return value
 
 
 def http_404(hgvs_exception=None):
     raise HTTPException(status_code=404, detail="Not found" if not hgvs_exception else str(hgvs_exception))
 
 
+class TxKey(BaseModel):
+    tx_ac: str
+    alt_ac: str
+    alt_aln_method: str
+
+
+class SeqKey(BaseModel):
+    ac: str
+    start_i: Optional[int] = None
+    end_i: Optional[int] = None
+
+
+class BatchResult(BaseModel):
+    status_code: int
+    body: Any
+
+
+async def batch_results(results: List[Awaitable]) -> List[dict]:
+    """awaits single-key routes concurrently, returning their results, as BatchResult dicts, in order"""
+    return await asyncio.gather(*(batch_result(r) for r in results))
+
+
+async def batch_result(result: Awaitable) -> dict:
+    """
+    awaits one single-key route and returns its result with a status code, as a BatchResult dict.
+    HTTP errors (e.g., 404) are returned as per-key results, with the same body the single-key route returns.
+    """
+    try:
+        return {"status_code": 200, "body": await result}
+    except HTTPException as e:
+        return {"status_code": e.status_code, "body": {"detail": e.detail}}
+
+
+def parse_range(range_header: str) -> Optional[Tuple[Optional[int], Optional[int]]]:
+    """
+    parses a single HTTP byte range ("bytes=first-last", "bytes=first-", or "bytes=-suffix") into
+    (first, end) with an exclusive end; first is None for a suffix range. returns None for
+    unsupported or malformed ranges (e.g., multiple ranges), which are ignored as RFC 9110 allows.
+    """
+    unit, _, spec = range_header.partition("=")
+    if unit.strip() != "bytes" or "," in spec:
+        return None
+    first, sep, last = spec.strip().partition("-")
+    try:
+        if not sep or (not first and not last):
+            return None
+        if not first:
+            return (None, int(last))
+        if int(last or first) < int(first):
+            return None
+        return (int(first), int(last) + 1 if last else None)
+    except ValueError:
+        return None
+
+
+def stream_text(text: str, status_code: int = 200, headers: Optional[dict] = None) -> StreamingResponse:
+    """returns a text/plain response that sends text in chunks of SEQ_CHUNK_SIZE characters"""
+
+    def chunks() -> Iterator[bytes]:
+        for i in range(0, len(text), SEQ_CHUNK_SIZE):
+            yield text[i : i + SEQ_CHUNK_SIZE].encode("ascii")
+
+    headers = {"Content-Length": str(len(text)), "Accept-Ranges": "bytes", **(headers or {})}
+    return StreamingResponse(chunks(), status_code=status_code, media_type="text/plain", headers=headers)
+
+
+async def next_batch(batches: Iterator[List[dict]]) -> Optional[List[dict]]:
+    """reads the next batch of rows from the (blocking) iterator on a worker thread, or None at its end"""
+    return await anyio.to_thread.run_sync(db_timed(next), batches, None, limiter=db_limiter)
+
+
+async def close_batches(batches: Iterator[List[dict]]) -> None:
+    """closes the iterator on a worker thread, also when the calling task is cancelled (e.g., because the
+    client disconnected), so that the database connection it holds is returned to the pool"""
+    with anyio.CancelScope(shield=True):
+        await anyio.to_thread.run_sync(batches.close, limiter=db_limiter)
+
+
+async def ndjson_stream(batches: Iterator[List[dict]], first: Optional[List[dict]]) -> AsyncIterator[bytes]:
+    """encodes batches of rows as NDJSON, from first (already read from batches) on, and closes the iterator
+    once the stream ends, fails, or is cancelled"""
+    try:
+        batch = first
+        while batch is not None:
+            yield b"".join(encode(row, JSON) + b"\n" for row in dicts(batch))
+            batch = await next_batch(batches)
+    finally:
+        await close_batches(batches)
+
+
+def check_md5(md5: str) -> None:
+    if not MD5_RE.fullmatch(md5):
+        raise HTTPException(status_code=422, detail=f"{md5} is not an MD5 digest")
+
+
+def check_batch_size(keys: list) -> None:
+    if len(keys) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"Batch of {len(keys)} keys exceeds limit of {MAX_BATCH_SIZE}")
+
+
+def negotiated_route(method: str, path: str, **options) -> Callable:
+    """
+    registers a route that returns its JSON-compatible result as a NegotiatedResponse itself, so that
+    FastAPI neither validates the result against the route's return annotation nor re-encodes it; the
+    annotation still documents the route. responses returned by the route (e.g., streamed sequences) are
+    sent as they are. the route function is returned unchanged, so that batch routes can call it.
+    """
+
+    def decorator(route: Callable) -> Callable:
+        @functools.wraps(route)
+        async def endpoint(*args, **kwargs) -> Response:
+            result = await route(*args, **kwargs)
+            return result if isinstance(result, Response) else NegotiatedResponse(result)
+
+        app.add_api_route(path, endpoint, methods=[method], **options)
+        return route
+
+    return decorator
+
+
 @app.get("/ping")
 async def ping() -> dict:
-    """returns the data_version, schema_version, and sequence_source from uta."""
-    d = {}
-    d["data_version"] = conn.data_version()
-    d["schema_version"] = conn.schema_version()
-    d["sequence_source"] = UTABase.sequence_source()
-    return d
+    """returns the data_version, schema_version, and sequence_source from uta, as looked up at startup."""
+    return await metadata()
+
+
+@app.get("/pool_stats")
+async def pool_stats() -> dict:
+    """returns the size and usage counters of the UTA connection pool"""
+    return conn.pool_stats()
+
+
+@app.get("/cache_stats")
+async def cache_stats() -> dict:
+    """returns the hits, misses, and size of the local result cache, and counts of lookups that
+    were shared with an identical lookup in flight"""
+    return {**result_cache.local.cache_info()._asdict(), "lookups": flights.calls, "coalesced": flights.shared}
+
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics(accept: Annotated[Optional[str], Header()] = None) -> Response:
+    """returns the Prometheus metrics of the api (see metrics); 404 if prometheus_client is not installed"""
+    if metrics is None:
+        raise HTTPException(status_code=404, detail="Metrics require the prometheus_client package")
+    body, content_type = metrics.exposition(accept)
+    return Response(body, media_type=content_type)
 
 
-@app.get("/seq/{ac}")
-async def seq(ac: str, start_i: Optional[int] = None, end_i: Optional[int] = None) -> str:
+@negotiated_route("GET", "/seq/{ac}")
+async def seq(
+    ac: str,
+    start_i: Optional[int] = None,
+    end_i: Optional[int] = None,
+    accept: Annotated[Optional[str], Header()] = None,
+    range_: Annotated[Optional[str], Header(alias="range")] = None,
+) -> str:
     """
     calls get_seq from utarest.py
     raises an error if the accession number is not found in the database.
+
+    the sequence is returned as a JSON string by default. if the client accepts text/plain, it is
+    streamed as plain text instead, and a single byte range of the (sliced) sequence may be requested
+    with a Range header; the complete length of a partial response is reported as unknown ("*").
     """
+    if accept is None or "text/plain" not in accept:
+        try:
+            return await run_seq(conn.get_seq, ac, start_i, end_i)
+        except HGVSDataNotAvailableError as e:
+            http_404(e)
+
+    byte_range = parse_range(range_) if range_ is not None else None
+    if byte_range is None or byte_range[0] is None:
+        try:
+            text = await run_seq(conn.get_seq, ac, start_i, end_i)
+        except HGVSDataNotAvailableError as e:
+            http_404(e)
+        if byte_range is None:
+            return stream_text(text)
+        if not text or byte_range[1] == 0:
+            raise HTTPException(status_code=416, detail="Range not satisfiable", headers={"Content-Range": "bytes */*"})
+        first = max(len(text) - byte_range[1], 0)
+        return stream_text(text[first:], 206, {"Content-Range": f"bytes {first}-{len(text) - 1}/{len(text)}"})
+
+    # translate the range into sequence coordinates, so that only the range is fetched
+    first, end = byte_range
+    offset = start_i or 0
+    seq_end = offset + end if end is not None else end_i
+    if end_i is not None and seq_end is not None:
+        seq_end = min(seq_end, end_i)
     try:
-        return conn.get_seq(ac, start_i, end_i)
+        text = await run_seq(conn.get_seq, ac, offset + first, seq_end)
     except HGVSDataNotAvailableError as e:
         http_404(e)
+    if not text:
+        raise HTTPException(status_code=416, detail="Range not satisfiable", headers={"Content-Range": "bytes */*"})
+    return stream_text(text, 206, {"Content-Range": f"bytes {first}-{first + len(text) - 1}/*"})
 
 
-@app.get("/acs_for_protein_seq/{seq}")
+@negotiated_route("GET", "/acs_for_protein_seq/{seq}")
 async def acs_for_protein_seq(seq: str) -> List:
     """
     calls get_acs_for_protein_seq from utarest.py
     raises an error if the sequence is not found in the database.
     """
     try:
-        return conn.get_acs_for_protein_seq(seq)
+        return await run_db(conn.get_acs_for_protein_seq, seq)
     except RuntimeError as e:
         http_404(e)
 
 
-@app.get("/gene_info/{gene}")
+@negotiated_route("GET", "/acs_for_protein_md5/{md5}")
+async def acs_for_protein_md5(md5: str) -> List:
+    """
+    returns the protein accessions for the sequence with the given MD5 digest (of the normalized
+    sequence, as bioutils.digests.seq_md5 computes it), as acs_for_protein_seq does for the sequence.
+    keeps long sequences out of URLs.
+    """
+    check_md5(md5)
+    return await cached_db("acs_for_protein_md5", conn.get_acs_for_protein_md5, identity, md5.lower())
+
+
+@negotiated_route("GET", "/gene_info/{gene}")
 async def gene_info(gene: str) -> Union[dict, None]:
     """calls get_gene_info from utarest.py."""
-    gene = conn.get_gene_info(gene)
-    return gene if gene is None else dict(gene)
+    return await cached_db("gene_info", conn.get_gene_info, one_dict, gene)
 
 
-@app.get("/tx_exons/{tx_ac}/{alt_ac}")
+@negotiated_route("GET", "/tx_exons/{tx_ac}/{alt_ac}")
 async def tx_exons(tx_ac: str, alt_ac: str, alt_aln_method: str) -> List:
     """
     calls get_tx_exons from utarest.py
@@ -61,51 +566,55 @@ async def tx_exons(tx_ac: str, alt_ac: str, alt_aln_method: str) -> List:
     otherwise returns information as a list of dictionaries.
     """
     try:
-        rows = conn.get_tx_exons(tx_ac, alt_ac, alt_aln_method)
-        if not rows:
-            return rows
-        # Convert DictRow to dict to preserve dictionary-like behavior
-        t_exons = []
-        for r in rows:
-            t_exons.append(dict(r))
-        return t_exons
+        return await cached_db("tx_exons", conn.get_tx_exons, dicts, tx_ac, alt_ac, alt_aln_method)
     except HGVSDataNotAvailableError as e:
         http_404(e)
 
 
-@app.get("/tx_for_gene/{gene}")
+@negotiated_route("GET", "/tx_for_gene/{gene}")
 async def tx_for_gene(gene: str) -> Union[List, None]:
     """calls get_tx_for_gene from utarest.py"""
-    rows = conn.get_tx_for_gene(gene)
-    if not rows:
-        return rows
-    # Convert DictRow to dict to preserve dictionary-like behavior
-    transcripts = []
-    for r in rows:
-        transcripts.append(dict(r))
-    return transcripts
+    return await cached_db("tx_for_gene", conn.get_tx_for_gene, dicts, gene)
 
 
-@app.get("/tx_for_region/{alt_ac}")
+@negotiated_route("GET", "/tx_for_region/{alt_ac}")
 async def tx_for_region(alt_ac: str, alt_aln_method: str, start_i: int, end_i: int) -> Union[List, None]:
     """calls get_tx_for_region from utarest.py"""
-    rows = conn.get_tx_for_region(alt_ac, alt_aln_method, start_i, end_i)
-    if not rows:
-        return rows
-    # Convert DictRow to dict to preserve dictionary-like behavior
-    transcripts = []
-    for r in rows:
-        transcripts.append(dict(r))
-    return transcripts
+    return dicts(await run_db(conn.get_tx_for_region, alt_ac, alt_aln_method, start_i, end_i))
 
 
-@app.get("/alignments_for_region/{alt_ac}", status_code=200)
+@negotiated_route("GET", "/alignments_for_region/{alt_ac}", status_code=200)
 async def alignments_for_region(alt_ac: str, start_i: int, end_i: int, alt_aln_method: Optional[str] = None) -> List:
     """calls get_alignments_for_region from utarest.py"""
-    return conn.get_alignments_for_region(alt_ac, start_i, end_i, alt_aln_method)
+    return dicts(await run_db(conn.get_alignments_for_region, alt_ac, start_i, end_i, alt_aln_method))
 
 
-@app.get("/tx_identity_info/{tx_ac}")
+@negotiated_route("GET", "/alignments/{alt_ac}")
+async def alignments(
+    alt_ac: str, alt_aln_method: Optional[str] = None, accept: Annotated[Optional[str], Header()] = None
+) -> List:
+    """
+    returns all alignments on alt_ac, as alignments_for_region returns them, so that clients can
+    answer region queries for alt_ac locally.
+    with Accept: application/x-ndjson, the alignments are streamed in order of start, one JSON object
+    per line, as they are read from the database with a server-side cursor.
+    """
+    try:
+        if accept is not None and NDJSON in accept:
+            batches = conn.iter_alignments_for_ac(alt_ac, alt_aln_method)
+            try:
+                # read before the response starts, so that errors of the lookup are answered with a status
+                first = await next_batch(batches)
+            except BaseException:
+                await close_batches(batches)
+                raise
+            return StreamingResponse(ndjson_stream(batches, first), media_type=NDJSON)
+        return dicts(await run_db(conn.get_alignments_for_ac, alt_ac, alt_aln_method))
+    except HGVSDataNotAvailableError as e:
+        http_404(e)
+
+
+@negotiated_route("GET", "/tx_identity_info/{tx_ac}")
 async def tx_identity_info(tx_ac: str) -> dict:
     """
     calls get_tx_identity_info from utarest.py
@@ -113,12 +622,12 @@ async def tx_identity_info(tx_ac: str) -> dict:
     otherwise returns information as a dictionary.
     """
     try:
-        return dict(conn.get_tx_identity_info(tx_ac))
+        return await cached_db("tx_identity_info", conn.get_tx_identity_info, one_dict, tx_ac)
     except HGVSDataNotAvailableError as e:
         http_404(e)
 
 
-@app.get("/tx_info/{tx_ac}/{alt_ac}")
+@negotiated_route("GET", "/tx_info/{tx_ac}/{alt_ac}")
 async def tx_info(tx_ac: str, alt_ac: str, alt_aln_method: str) -> dict:
     """
     calls get_tx_info from utarest.py
@@ -126,52 +635,116 @@ async def tx_info(tx_ac: str, alt_ac: str, alt_aln_method: str) -> dict:
     otherwise returns information as a dictionary.
     """
     try:
-        return dict(conn.get_tx_info(tx_ac, alt_ac, alt_aln_method))
+        return await cached_db("tx_info", conn.get_tx_info, one_dict, tx_ac, alt_ac, alt_aln_method)
     except HGVSDataNotAvailableError as e:
         http_404(e)
     except HGVSError as e:
         http_404(e)
 
 
-@app.get("/tx_mapping_options/{tx_ac}")
+@negotiated_route("GET", "/tx_mapping_options/{tx_ac}")
 async def tx_mapping_options(tx_ac: str) -> Union[List, None]:
     """calls get_tx_mapping_options from utarest.py."""
-    rows = conn.get_tx_mapping_options(tx_ac)
-    if not rows:
-        return rows
-    # Convert DictRow to dict to preserve dictionary-like behavior
-    mapping_options = []
-    for r in rows:
-        mapping_options.append(dict(r))
-    return mapping_options
+    return await cached_db("tx_mapping_options", conn.get_tx_mapping_options, dicts, tx_ac)
 
 
-@app.get("/similar_transcripts/{tx_ac}")
+@negotiated_route("GET", "/similar_transcripts/{tx_ac}")
 async def similar_transcripts(tx_ac: str) -> Union[List, None]:
     """calls get_similar_transcripts from utarest.py."""
-    rows = conn.get_similar_transcripts(tx_ac)
-    if not rows:
-        return rows
-    # Convert DictRow to dict to preserve dictionary-like behavior
-    transcripts = []
-    for r in rows:
-        transcripts.append(dict(r))
-    return transcripts
+    return await cached_db("similar_transcripts", conn.get_similar_transcripts, dicts, tx_ac)
 
 
-@app.get("/pro_ac_for_tx_ac/{tx_ac}")
+@negotiated_route("GET", "/pro_ac_for_tx_ac/{tx_ac}")
 async def pro_ac_for_tx_ac(tx_ac: str) -> Union[str, None]:
     """calls get_pro_ac_for_tx_ac from utarest.py"""
-    return conn.get_pro_ac_for_tx_ac(tx_ac)
+    return await cached_db("pro_ac_for_tx_ac", conn.get_pro_ac_for_tx_ac, identity, tx_ac)
 
 
-@app.get("/assembly_map/{assembly_name}")
+@negotiated_route("GET", "/assembly_map/{assembly_name}")
 async def assembly_map(assembly_name: str) -> dict:
     """
     calls get_assembly_map from utarest.py
     raises an error if not given an exisiting assembly map name.
     """
     try:
-        return conn.get_assembly_map(assembly_name)
+        return await cached_db("assembly_map", conn.get_assembly_map, identity, assembly_name)
     except Exception as e:
         http_404(e)
+
+
+############################################################################
+# Batch routes: one request for many keys, answered in request order.
+# Each result carries the status code and body of the single-key route.
+
+
+@negotiated_route("POST", "/batch/acs_for_protein_md5")
+async def batch_acs_for_protein_md5(md5s: List[str] = Body(...)) -> List[BatchResult]:
+    """calls acs_for_protein_md5 for each digest"""
+    check_batch_size(md5s)
+    return await batch_results([acs_for_protein_md5(md5) for md5 in md5s])
+
+
+@negotiated_route("POST", "/batch/seq")
+async def batch_seq(keys: List[SeqKey] = Body(...)) -> List[BatchResult]:
+    """calls seq for each key"""
+    check_batch_size(keys)
+    return await batch_results([seq(k.ac, k.start_i, k.end_i) for k in keys])
+
+
+@negotiated_route("POST", "/batch/tx_exons")
+async def batch_tx_exons(keys: List[TxKey] = Body(...)) -> List[BatchResult]:
+    """calls tx_exons for each key"""
+    check_batch_size(keys)
+    return await batch_results([tx_exons(k.tx_ac, k.alt_ac, k.alt_aln_method) for k in keys])
+
+
+@negotiated_route("POST", "/batch/tx_for_gene")
+async def batch_tx_for_gene(genes: List[str] = Body(...)) -> List[BatchResult]:
+    """calls tx_for_gene for each gene"""
+    check_batch_size(genes)
+    return await batch_results([tx_for_gene(gene) for gene in genes])
+
+
+@negotiated_route("POST", "/batch/tx_identity_info")
+async def batch_tx_identity_info(tx_acs: List[str] = Body(...)) -> List[BatchResult]:
+    """calls tx_identity_info for each transcript accession"""
+    check_batch_size(tx_acs)
+    return await batch_results([tx_identity_info(tx_ac) for tx_ac in tx_acs])
+
+
+@negotiated_route("POST", "/batch/tx_info")
+async def batch_tx_info(keys: List[TxKey] = Body(...)) -> List[BatchResult]:
+    """calls tx_info for each key"""
+    check_batch_size(keys)
+    return await batch_results([tx_info(k.tx_ac, k.alt_ac, k.alt_aln_method) for k in keys])
+
+
+@negotiated_route("POST", "/batch/tx_mapping_options")
+async def batch_tx_mapping_options(tx_acs: List[str] = Body(...)) -> List[BatchResult]:
+    """calls tx_mapping_options for each transcript accession"""
+    check_batch_size(tx_acs)
+    return await batch_results([tx_mapping_options(tx_ac) for tx_ac in tx_acs])
+
+
+def preload() -> None:
+    """
+    loads read-only data that many requests need (the assembly maps, and gene info for all genes) into
+    the result cache, through a connection that is closed again. run in a server's master process
+    before it forks its workers (e.g., by gunicorn --preload), the loaded data are shared by the
+    workers copy-on-write.
+    """
+    preload_conn = open_conn()
+    try:
+        version = preload_conn.data_version()
+        for name in get_assembly_names():
+            result_cache.set(version, "assembly_map/" + name, preload_conn.get_assembly_map(name))
+        for row in preload_conn.get_all_gene_info():
+            result_cache.set(version, "gene_info/" + row["hgnc"], one_dict(row))
+    finally:
+        preload_conn.close()
+    # keep the garbage collector of each worker from writing to (and so copying) the preloaded objects
+    gc.freeze()
+
+
+if PRELOAD:
+    preload()
@@ -5,28 +5,411 @@
 
 """
 
+import json
+import logging
 import os
-from typing import List, Optional, Union
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Collection, Dict, List, Optional, Sequence, Tuple, Union
+from urllib.parse import urlencode
 
 import requests
+from bioutils.digests import seq_md5
 from hgvs.dataproviders.interface import Interface
 from hgvs.dataproviders.seqfetcher import SeqFetcher
+from requests.adapters import HTTPAdapter
+from urllib3.util.request import ACCEPT_ENCODING
+from urllib3.util.retry import Retry
+
+from hgvs_dataproviders_rest import formats
+from hgvs_dataproviders_rest.bundle import Bundle
+from hgvs_dataproviders_rest.cache import CacheInfo, LRUCache, SQLiteCache
+from hgvs_dataproviders_rest.regionindex import RegionIndex
+from hgvs_dataproviders_rest.seqproxy import SequenceProxy
+from hgvs_dataproviders_rest.singleflight import SingleFlight
+from hgvs_dataproviders_rest.tracing import annotate, traced
+
+# seconds to wait for a response, by endpoint; endpoints not listed use DEFAULT_TIMEOUT
+DEFAULT_TIMEOUT = 5
+DEFAULT_TIMEOUTS = {"seq": 120, "batch": 120, "alignments": 120}
+
+# maximum number of keys sent in one /batch request
+DEFAULT_BATCH_SIZE = 500
+
+# responses that are retried, with backoff, as are failed connections
+RETRY_STATUSES = (502, 503, 504)
+
+# responses from /alignments of servers that cannot list alignments (or have none on the sequence); other
+# errors are raised rather than remembered as a missing region index
+NO_REGION_INDEX_STATUSES = (404, 405)
+
+# sequences are requested as plain text and read in chunks of this many bytes
+SEQ_CHUNK_SIZE = 2**20
+
+_MISSING = object()
+# key of the ping response in the persistent cache, outside the versioned namespaces of responses
+_PING_KEY = ("", "ping")
+
+_logger = logging.getLogger(__name__)
 
 
 def connect():
-    # Eventually replace this fake default url :)
-    url = os.environ.get("UTAREST_URL", "https://api.biocommons.org/utarest/0")
-    return UTAREST(url)
+    """returns a UTAREST client for UTAREST_URL
 
+    If UTAREST_CACHE_PATH is set, responses are also cached persistently in
+    that SQLite file; set UTAREST_CACHE_READONLY=1 to use a pre-warmed file
+    without writing to it.
 
-class UTAREST(Interface):
+    If UTAREST_BUNDLE is set, the client answers queries offline from that
+    bundle file (see hgvs_dataproviders_rest.bundle) instead.
+
+    If UTAREST_PING_TTL is set, the server's versions are fetched again after
+    that many seconds (see UTAREST.ping).
+    """
+    # Eventually replace this fake default url :)
+    url = os.environ.get("UTAREST_URL", "https://api.biocommons.org/utarest/0")
+    if os.environ.get("UTAREST_BUNDLE"):
+        return UTAREST(url, bundle=Bundle(os.environ["UTAREST_BUNDLE"], readonly=True))
+    return UTAREST(url, persistent_cache=_persistent_cache_from_env(), ping_ttl=_ping_ttl_from_env())
+
+
+def _persistent_cache_from_env() -> Optional[SQLiteCache]:
+    """returns the persistent cache configured by UTAREST_CACHE_PATH and UTAREST_CACHE_READONLY, if any"""
+    if not os.environ.get("UTAREST_CACHE_PATH"):
+        return None
+    readonly = os.environ.get("UTAREST_CACHE_READONLY", "0").lower() in ("1", "true", "yes")
+    return SQLiteCache(os.environ["UTAREST_CACHE_PATH"], readonly=readonly)
+
+
+def _ping_ttl_from_env() -> Optional[float]:
+    """returns the ping_ttl configured by UTAREST_PING_TTL, if any"""
+    ttl = os.environ.get("UTAREST_PING_TTL")
+    return float(ttl) if ttl else None
+
+
+def _slice_size(params: Optional[dict]) -> Optional[int]:
+    """returns the most characters that a sequence slice requested with params can have, if end_i is given"""
+    if not params or params.get("end_i") is None:
+        return None
+    return max(int(params["end_i"]) - int(params.get("start_i") or 0), 0)
+
+
+def _read_text(resp: requests.Response, size: Optional[int] = None) -> str:
+    """
+    reads a streamed text response into a preallocated buffer. the buffer is sized from the Content-Length
+    of an uncompressed response, and otherwise from size, the most that the decoded response can have
+    (e.g., the length of a requested slice; see _slice_size), if given.
+    """
+    length = resp.headers.get("Content-Length") if "Content-Encoding" not in resp.headers else None
+    if length is not None:
+        size = int(length)
+    if size is None:
+        return b"".join(resp.iter_content(SEQ_CHUNK_SIZE)).decode(resp.encoding or "ascii")
+    buf = bytearray(size)
+    n = 0
+    with memoryview(buf) as view:
+        for chunk in resp.iter_content(SEQ_CHUNK_SIZE):
+            if n + len(chunk) > size:
+                raise requests.exceptions.ContentDecodingError(f"Response is longer than {size} bytes")
+            view[n : n + len(chunk)] = chunk
+            n += len(chunk)
+    if length is not None and n < size:
+        raise requests.exceptions.ChunkedEncodingError(f"Response ended after {n} of {size} bytes")
+    # a slice may end short of the requested end, at the end of the sequence
+    del buf[n:]
+    return buf.decode(resp.encoding or "ascii")
+
+
+def _decode(resp: requests.Response, size: Optional[int] = None) -> Tuple[object, Optional[bytes], int]:
+    """
+    returns the value of a response body, decoded according to its Content-Type, with the body itself
+    if it is JSON (else None), and the size of the body. text/plain bodies are read as a stream (see
+    _read_text for size).
+    """
+    content_type = resp.headers.get("Content-Type", "")
+    if content_type.startswith("text/plain"):
+        value = _read_text(resp, size)
+        return value, None, len(value)
+    value = formats.decode(resp.content, content_type)
+    body = resp.content if content_type.startswith(formats.JSON) or not content_type else None
+    return value, body, len(resp.content)
+
+
+def _rows(result) -> list:
+    """returns the rows of a bulk query result, or no rows if the query failed"""
+    return result if isinstance(result, list) else []
+
+
+def _make_adapter(pool_size: int, max_retries: int, backoff_factor: float) -> HTTPAdapter:
+    """returns a keep-alive connection pool that retries failed connections and gateway errors with backoff"""
+    retries = Retry(
+        total=max_retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=RETRY_STATUSES,
+        # batch POSTs are read-only, so they are as safe to retry as GETs
+        allowed_methods=frozenset(["GET", "POST"]),
+        raise_on_status=False,
+    )
+    return HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retries)
+
+
+class ResponseCacheMixin:
+    """
+    in-memory and persistent response caching shared by the REST clients.
+    requires response_cache (an LRUCache or None), persistent_cache (a SQLiteCache or None), ping_ttl,
+    and pingresponse attributes.
+    """
+
+    def response_cache_info(self) -> Optional[CacheInfo]:
+        """returns hits, misses, and size of the in-memory response cache, or None if it is disabled"""
+        return self.response_cache.cache_info() if self.response_cache is not None else None
+
+    def _cache_get(self, key: tuple):
+        """returns the cached value for key from memory, then disk, or _MISSING"""
+        value = self._memory_get(key)
+        if value is _MISSING and self.persistent_cache is not None:
+            value = self._disk_get(key)
+        return value
+
+    def _memory_get(self, key: tuple):
+        """returns the value for key from the in-memory cache, or _MISSING"""
+        if self.response_cache is not None:
+            entry = self.response_cache.get(key)
+            if entry is not None:
+                return entry[0]
+        return _MISSING
+
+    def _disk_get(self, key: tuple):
+        """returns the value for key from the persistent cache, also caching it in memory, or _MISSING"""
+        body = self.persistent_cache.get(key)
+        if body is None:
+            return _MISSING
+        value = json.loads(body)
+        if self.response_cache is not None:
+            self.response_cache.set(key, (value, None), size=len(body))
+        return value
+
+    def _cache_set(
+        self, key: tuple, value, body: Optional[bytes] = None, etag: Optional[str] = None, size: Optional[int] = None
+    ) -> None:
+        """
+        caches value in memory (with its ETag, if any) and on disk. body is the json encoding of value, and
+        size the size of the response it came from; if not given, they are computed from value as needed.
+        """
+        body = self._memory_set(key, value, body, etag, size)
+        if self.persistent_cache is not None:
+            self.persistent_cache.set(key, body, size=len(body))
+
+    def _memory_set(
+        self, key: tuple, value, body: Optional[bytes] = None, etag: Optional[str] = None, size: Optional[int] = None
+    ) -> Optional[bytes]:
+        """caches value in memory, as _cache_set does; returns body, encoded from value if the disk needs it"""
+        if body is None and (size is None or self.persistent_cache is not None):
+            body = json.dumps(value, separators=(",", ":")).encode()
+        if size is None:
+            size = len(body)
+        if self.response_cache is not None:
+            self.response_cache.set(key, (value, etag), size=size)
+        return body
+
+    def _stored_ping(self) -> Optional[Tuple[dict, float]]:
+        """
+        returns the ping response stored in the persistent cache and its remaining time to live, or None
+        if there is none younger than ping_ttl (ping responses are stored only if ping_ttl is set)
+        """
+        if self.persistent_cache is None or self.ping_ttl is None:
+            return None
+        body = self.persistent_cache.get(_PING_KEY)
+        if body is None:
+            return None
+        stored = json.loads(body)
+        ttl = self.ping_ttl - (time.time() - stored["time"])
+        return (stored["ping"], ttl) if ttl > 0 else None
+
+    def _store_ping(self, ping: dict) -> None:
+        if self.persistent_cache is not None and self.ping_ttl is not None:
+            body = json.dumps({"time": time.time(), "ping": ping}).encode()
+            self.persistent_cache.set(_PING_KEY, body, size=len(body))
+
+    def _cache_key(self, endpoint: str, *path: str, params: Optional[dict] = None) -> tuple:
+        """returns the (namespace, request) cache key for a query, e.g., ("uta_20210129b/1.1", "gene_info/VHL")"""
+        namespace = "{}/{}".format(self.pingresponse["data_version"], self.pingresponse["schema_version"])
+        request = "/".join([endpoint, *path])
+        params = sorted((k, v) for k, v in (params or {}).items() if v is not None)
+        if params:
+            request += "?" + urlencode(params)
+        return (namespace, request)
+
+
+class UTAREST(ResponseCacheMixin, Interface):
     required_version = "1.0"
 
-    def __init__(self, server_url, mode=None, cache=None):
+    def __init__(
+        self,
+        server_url,
+        mode=None,
+        cache=None,
+        pool_size: int = 10,
+        max_retries: int = 3,
+        backoff_factor: float = 0.5,
+        timeouts: Optional[Dict[str, float]] = None,
+        cache_size: int = 10000,
+        cache_bytes: int = 256 * 2**20,
+        cache_ttl: Optional[float] = None,
+        persistent_cache: Optional[SQLiteCache] = None,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        lazy_seq: bool = False,
+        seq_block_size: int = 16384,
+        seq_cache_blocks: int = 1024,
+        seq_prefetch: bool = True,
+        response_format: Optional[str] = None,
+        bundle: Optional[Bundle] = None,
+        region_index: bool = False,
+        ping_ttl: Optional[float] = None,
+    ):
+        """
+        :param server_url: base url of the hgvs dataprovider REST api
+        :param mode: hgvs cache mode, passed to Interface
+        :param cache: hgvs cache file name, passed to Interface
+        :param pool_size: maximum number of keep-alive connections kept open to the server
+        :param max_retries: number of retries for failed connections and 502/503/504 responses
+        :param backoff_factor: retry backoff factor; retries sleep backoff_factor * 2**(retry - 1) seconds
+        :param timeouts: per-endpoint timeouts in seconds (e.g., {"seq": 300}), merged over DEFAULT_TIMEOUTS
+        :param cache_size: maximum number of responses held in the in-memory response cache; 0 disables it
+        :param cache_bytes: maximum total size, in bytes of response body, of the in-memory response cache
+        :param cache_ttl: seconds after which cached responses expire, or None for no expiry
+        :param persistent_cache: optional on-disk cache consulted after the in-memory cache
+        :param batch_size: maximum number of keys sent in one request by the get_*_many methods
+        :param lazy_seq: if True, get_seq returns a SequenceProxy for whole sequences, and serves slices
+            from the proxy's blocks (see seq_proxy)
+        :param seq_block_size: bases per block fetched by sequence proxies
+        :param seq_cache_blocks: maximum number of sequence blocks cached, shared by all sequence proxies
+        :param seq_prefetch: prefetch the next block in the background when a proxy is read in order
+        :param response_format: media type to ask the server for (see formats); defaults to MessagePack if
+            msgpack is installed, else columnar JSON. Servers that do not support it answer in JSON.
+        :param bundle: offline bundle (see hgvs_dataproviders_rest.bundle) from which all queries are
+            answered, without requests to server_url; queries missing from the bundle are answered as
+            the server answers queries for missing data, with {"detail": ...}
+        :param region_index: if True, get_tx_for_region and get_alignments_for_region load all alignments
+            on a reference sequence with one (streamed) request on first use, and answer region queries
+            for it from a RegionIndex
+        :param ping_ttl: seconds after which the server's versions are fetched again (see ping), or None to
+            keep the first response. If set, the response is also kept in persistent_cache, so that new
+            clients sharing the cache need not ping the server within ping_ttl.
+        """
         self.server = server_url
         self.seqfetcher = SeqFetcher()
-        self.pingresponse = requests.get(server_url + "/ping", timeout=5).json()
+        self.timeouts = dict(DEFAULT_TIMEOUTS, **(timeouts or {}))
+        # One adapter (and therefore one urllib3 connection pool) is shared by all threads.
+        # requests.Session itself is not guaranteed to be threadsafe, so each thread gets
+        # its own lightweight session that mounts the shared adapter.
+        self._adapter = _make_adapter(pool_size, max_retries, backoff_factor)
+        self._local = threading.local()
+        self.response_cache = LRUCache(cache_size, cache_bytes, cache_ttl) if cache_size > 0 else None
+        self.persistent_cache = bundle if bundle is not None else persistent_cache
+        self.bundle = bundle
+        self.region_index = region_index
+        self._region_indexes: Dict[str, Optional[RegionIndex]] = {}
+        self.batch_size = batch_size
+        self.flights = SingleFlight()
+        if response_format is None:
+            response_format = formats.MEDIA_TYPES[0]
+        self.accept = formats.accept_header(response_format)
+        self.lazy_seq = lazy_seq
+        self.seq_block_size = seq_block_size
+        self.seq_blocks = LRUCache(seq_cache_blocks, seq_cache_blocks * seq_block_size)
+        self._prefetcher = ThreadPoolExecutor(2, thread_name_prefix="utarest-prefetch") if seq_prefetch else None
+        self.ping_ttl = ping_ttl
+        self._ping: Optional[Tuple[dict, Optional[float]]] = None  # (response, time.monotonic() of expiry)
+        if mode is not None:
+            # hgvs's learn/run/verify modes record schema_version(), so it cannot be deferred
+            self.ping()
+        self._constructing = True
         super(UTAREST, self).__init__(mode, cache)
+        self._constructing = False
+        self.schema_version.cache_clear()
+        if mode is None:
+            # Interface memoizes the versions and queries for the life of the client. the versions are read
+            # from the (TTL-checked) ping instead, and each memoized query checks the ping first, so that
+            # the memos are cleared (see _refresh_ping) as soon as a new data release is seen
+            del self.data_version, self.schema_version
+            for name, memo in self._memos():
+                setattr(self, name, self._checking_ping(memo))
+
+    @property
+    def pingresponse(self) -> dict:
+        return self.ping()
+
+    def ping(self) -> dict:
+        """
+        returns the server's data_version, schema_version, and sequence_source.
+
+        The server is not pinged when the client is made, but on first use (including the schema version
+        check that Interface would make on construction), and again once the response is older than
+        ping_ttl. If the server cannot be reached then, the previous response is kept for another ping_ttl.
+        """
+        ping = self._ping
+        if ping is not None and (self.ping_ttl is None or time.monotonic() < ping[1]):
+            return ping[0]
+        return self.flights.do(_PING_KEY, self._refresh_ping)
+
+    def _refresh_ping(self) -> dict:
+        ttl = self.ping_ttl
+        stored = self._stored_ping() if self._ping is None and self.bundle is None else None
+        if self.bundle is not None:
+            ping = self._bundle_ping()
+        elif stored is not None:
+            ping, ttl = stored
+        else:
+            url = "/".join([self.server, "ping"])
+            try:
+                resp = self._session.get(url, timeout=self.timeouts.get("ping", DEFAULT_TIMEOUT))
+                resp.raise_for_status()
+                ping = resp.json()
+            except requests.RequestException as e:
+                if self._ping is None:
+                    raise
+                _logger.warning("Could not ping {}; keeping versions from the previous ping: {}".format(url, e))
+                ping = self._ping[0]
+            else:
+                self._store_ping(ping)
+        self._check_schema_version(ping["schema_version"])
+        changed = self._ping is not None and ping != self._ping[0]
+        self._ping = (ping, time.monotonic() + ttl if ttl is not None else None)
+        if changed:
+            # forget what was learned from the previous release
+            for _, memo in self._memos():
+                memo.cache_clear()
+            self._region_indexes = {}
+        return ping
+
+    def _memos(self) -> List[Tuple[str, Callable]]:
+        """returns the (name, lru_cache wrapper) of the versions and queries that Interface memoizes"""
+        return [(name, value) for name, value in vars(self).items() if hasattr(value, "cache_clear")]
+
+    def _checking_ping(self, memo: Callable) -> Callable:
+        """returns memo, called after ping(), so that a new data release seen by the ping clears memo first"""
+
+        def query(*args, **kwargs):
+            self.ping()
+            return memo(*args, **kwargs)
+
+        query.__wrapped__ = memo.__wrapped__
+        query.cache_clear = memo.cache_clear
+        query.cache_info = memo.cache_info
+        return query
+
+    def _check_schema_version(self, schema_version: str) -> None:
+        """raises RuntimeError, as Interface does, if the server's schema is incompatible with required_version"""
+        rv = [int(v) for v in self.required_version.split(".")] + [0]
+        av = [int(v) for v in schema_version.split(".")] + [0]
+        if av[0] != rv[0] or av[1] < rv[1]:
+            raise RuntimeError(
+                "Incompatible versions: {k} requires schema version {rv}, but {url} provides version {av}".format(
+                    k=type(self).__name__, rv=self.required_version, url=self.server, av=schema_version
+                )
+            )
 
     def __str__(self):
         return (
@@ -40,6 +423,163 @@ class UTAREST(Interface):
             sf=self.sequence_source(),
         )
 
+    def close(self) -> None:
+        """closes all pooled connections to the server"""
+        if self._prefetcher is not None:
+            self._prefetcher.shutdown(wait=True)
+        self._adapter.close()
+
+    @property
+    def _session(self) -> requests.Session:
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            # gzip and deflate, plus br and zstd if urllib3 can decode them (brotli, zstandard installed)
+            session.headers["Accept-Encoding"] = ACCEPT_ENCODING
+            session.mount("http://", self._adapter)
+            session.mount("https://", self._adapter)
+            self._local.session = session
+        return session
+
+    def _get(self, endpoint: str, *path: str, params: Optional[dict] = None, accept: Optional[str] = None):
+        """
+        issues a GET for {server}/{endpoint}/{path...} over the pooled session and returns the decoded json.
+        parameters whose value is None are omitted from the query string.
+
+        The response is requested in the client's response_format, unless accept is given, and is
+        decoded according to its Content-Type; text/plain responses are streamed and returned as str.
+
+        Successful responses are cached in memory and, if configured, on disk.
+        Both caches are namespaced by the server's data and schema versions, so
+        that rows from one data release are never served for another. When an
+        in-memory entry has expired (see cache_ttl), it is revalidated with its
+        ETag, so that an unchanged response is not downloaded again.
+
+        Identical queries made concurrently by several threads share one request.
+        """
+        url = "/".join([self.server, endpoint, *path])
+        if params:
+            params = {k: v for k, v in params.items() if v is not None}
+        timeout = self.timeouts.get(endpoint, DEFAULT_TIMEOUT)
+        key = self._cache_key(endpoint, *path, params=params)
+        value = self._cache_get(key)
+        annotate(cache="miss" if value is _MISSING else "hit")
+        if value is not _MISSING:
+            return value
+        if self.bundle is not None:
+            return self._not_in_bundle(key[1])
+        return self.flights.do(key, self._fetch, key, url, params, accept or self.accept, timeout)
+
+    def _fetch(self, key: tuple, url: str, params: Optional[dict], accept: str, timeout: float):
+        """issues a GET for a query missing from the caches, revalidating a stale entry, and caches the response"""
+        headers = {"Accept": accept}
+        stale = self.response_cache.peek(key) if self.response_cache is not None else None
+        if stale is not None and stale[1] is not None:
+            headers["If-None-Match"] = stale[1]
+        with self._session.get(url, params=params, headers=headers, timeout=timeout, stream=True) as resp:
+            if resp.status_code == 304:
+                self.response_cache.renew(key)
+                return stale[0]
+            value, body, size = _decode(resp, _slice_size(params))
+            if resp.status_code == 200:
+                self._cache_set(key, value, body, etag=resp.headers.get("ETag"), size=size)
+        return value
+
+    def _fetch_seq(self, ac: str, start_i: Optional[int], end_i: Optional[int]) -> Union[str, dict]:
+        """fetches a slice of a sequence as plain text (or reads it from the bundle), bypassing the response
+        cache; returns the error body (a dict) if the server does not return a sequence"""
+        if self.bundle is not None:
+            seq = self.bundle.get_seq(ac, start_i, end_i)
+            return seq if seq is not None else self._not_in_bundle("seq/{}[{}:{}]".format(ac, start_i, end_i))
+        url = "/".join([self.server, "seq", ac])
+        params = {"start_i": start_i, "end_i": end_i}
+        headers = {"Accept": "text/plain, application/json"}
+        timeout = self.timeouts.get("seq", DEFAULT_TIMEOUT)
+        with self._session.get(url, params=params, headers=headers, timeout=timeout, stream=True) as resp:
+            return _decode(resp, _slice_size(params))[0]
+
+    def _get_many(self, endpoint: str, queries: Sequence[Tuple[tuple, dict]], keys: Sequence) -> List:
+        """
+        answers many queries for one endpoint, as if each were passed to _get(endpoint, *path, params=params).
+
+        queries are the (path, params) of each single query, and keys are the corresponding
+        request bodies for POST /batch/{endpoint}. Cached queries are answered from the caches;
+        the remaining are sent in batches of batch_size, and successful results are cached
+        as though they had been fetched singly.
+        """
+        results = [_MISSING] * len(queries)
+        cache_keys = [self._cache_key(endpoint, *path, params=params) for path, params in queries]
+        misses = []
+        for i, cache_key in enumerate(cache_keys):
+            results[i] = self._cache_get(cache_key)
+            if results[i] is _MISSING:
+                misses.append(i)
+        annotate(cache_hits=len(queries) - len(misses), cache_misses=len(misses))
+
+        if self.bundle is not None:
+            for i in misses:
+                results[i] = self._not_in_bundle(cache_keys[i][1])
+            return results
+
+        url = "/".join([self.server, "batch", endpoint])
+        timeout = self.timeouts.get("batch", DEFAULT_TIMEOUT)
+        for start in range(0, len(misses), self.batch_size):
+            chunk = misses[start : start + self.batch_size]
+            headers = {"Accept": self.accept}
+            resp = self._session.post(url, json=[keys[i] for i in chunk], headers=headers, timeout=timeout)
+            resp.raise_for_status()
+            for i, result in zip(chunk, _decode(resp)[0]):
+                results[i] = result["body"]
+                if result["status_code"] == 200:
+                    self._cache_set(cache_keys[i], result["body"])
+        return results
+
+    def _region_index(self, alt_ac: str) -> Optional[RegionIndex]:
+        """
+        returns the RegionIndex of alt_ac, loading it with one request on first use, or None if the
+        client does not use region indexes or the server cannot list alignments
+        """
+        if not self.region_index:
+            return None
+        if alt_ac not in self._region_indexes:
+            index = self.flights.do(("alignments", alt_ac), self._load_region_index, alt_ac)
+            self._region_indexes[alt_ac] = index
+        return self._region_indexes[alt_ac]
+
+    def _load_region_index(self, alt_ac: str) -> Optional[RegionIndex]:
+        """
+        builds the RegionIndex of alt_ac from all alignments on it, adding them as they are streamed
+        (as NDJSON) if the server can stream them; returns None if the server cannot list alignments, and
+        raises requests.HTTPError for other errors
+        """
+        if self.bundle is not None:
+            rows = self._get("alignments", alt_ac)
+            return RegionIndex(rows) if isinstance(rows, list) else None
+        url = "/".join([self.server, "alignments", alt_ac])
+        headers = {"Accept": "{}, {};q=0.5".format(formats.NDJSON, formats.JSON)}
+        timeout = self.timeouts.get("alignments", DEFAULT_TIMEOUT)
+        with self._session.get(url, headers=headers, timeout=timeout, stream=True) as resp:
+            if resp.status_code in NO_REGION_INDEX_STATUSES:
+                return None
+            resp.raise_for_status()
+            if resp.headers.get("Content-Type", "").startswith(formats.NDJSON):
+                index = RegionIndex()
+                for line in resp.iter_lines(SEQ_CHUNK_SIZE):
+                    if line:
+                        index.add(json.loads(line))
+                return index
+            rows = _decode(resp)[0]
+            return RegionIndex(rows) if isinstance(rows, list) else None
+
+    def _bundle_ping(self) -> dict:
+        ping = self.bundle.ping()
+        if ping is None:
+            raise ValueError("{} is not a utarest bundle".format(self.bundle.path))
+        return ping
+
+    def _not_in_bundle(self, request: str) -> dict:
+        return {"detail": "No {} in offline bundle {}".format(request, self.bundle.path)}
+
     ############################################################################
     # Queries
 
@@ -47,50 +587,62 @@ class UTAREST(Interface):
         return self.pingresponse["data_version"]
 
     def schema_version(self) -> str:
+        if self._constructing and self._ping is None:
+            # Interface.__init__ checks schema_version(); ping() checks it instead, on first use
+            return self.required_version
         return self.pingresponse["schema_version"]
 
     def sequence_source(self) -> str:
         return self.pingresponse["sequence_source"]
 
-    def optional_parameters(self, names: list, params: list) -> str:
-        """
-        TODO: You may actually be able to do this using the params argument in requests.get()
-
-        returns a string representation of query parameters that can be appended to a url
-        example: optional_parameters(["start_i", "end_i", "align_method"], [0, 1, "splign"]))
-        returns: ?start_i=0&end_i=1&align_method=splign
-        """
-        if not len(names) == len(params):
-            raise Exception("Ensure there is a matching value for each parameter name.")
-        retval = "?"
-        params_added = False
-        for (param, name) in zip(params, names):
-            if param:
-                if params_added:
-                    retval += "&"
-                retval += ("{name}={param}").format(name=name, param=param)
-                params_added = True
-        return retval
-
+    @traced
     def get_seq(self, ac: str, start_i: Optional[int] = None, end_i: Optional[int] = None) -> str:
         """
         returns a sequence for a given accession.
         can return a portion of a sequence when start and end indices are specified.
+        the sequence is streamed as plain text, so that long sequences are not decoded from json.
+
+        if the client was created with lazy_seq=True, a whole sequence is returned as a SequenceProxy,
+        and slices are read from the proxy's blocks.
+        """
+        if self.bundle is not None:
+            return self._fetch_seq(ac, start_i, end_i)
+        if self.lazy_seq:
+            proxy = self.seq_proxy(ac)
+            return proxy if start_i is None and end_i is None else proxy[start_i or 0 : end_i]
+        return self._get("seq", ac, params={"start_i": start_i, "end_i": end_i}, accept="text/plain, application/json")
+
+    def seq_proxy(self, ac: str) -> SequenceProxy:
         """
-        url = ("{serv}/seq/{ac}").format(serv=self.server, ac=ac)
-        url += self.optional_parameters(["start_i", "end_i"], [start_i, end_i])
-        return requests.get(url, timeout=120).json()
+        returns a lazy, sliceable proxy for the sequence of ac. slices are fetched in blocks of
+        seq_block_size bases, which are cached (up to seq_cache_blocks, for all proxies) and, when
+        read in order, prefetched; memory use is therefore bounded regardless of sequence length.
+        """
+        return SequenceProxy(ac, self._fetch_seq, self.seq_blocks, self.seq_block_size, self._prefetcher)
 
+    @traced
     def get_acs_for_protein_seq(self, seq: str) -> List:
         """
         returns a list of protein accessions for a given sequence.  The
         list is guaranteed to contain at least one element with the
         MD5-based accession (MD5_01234abc...def56789) at the end of the
         list.
-        """
-        url = ("{serv}/acs_for_protein_seq/{seq}").format(serv=self.server, seq=seq)
-        return requests.get(url, timeout=5).json()
 
+        the sequence is looked up by its MD5 digest, computed here, rather than sent in the URL;
+        responses are therefore cached by digest.
+        """
+        try:
+            md5 = seq_md5(seq)
+        except RuntimeError as e:
+            # answered as the server answers sequences that it cannot digest
+            return {"detail": str(e)}
+        acs = self._get("acs_for_protein_md5", md5)
+        if isinstance(acs, dict):
+            # servers without the digest route
+            return self._get("acs_for_protein_seq", seq)
+        return acs
+
+    @traced
     def get_gene_info(self, gene: str) -> Union[dict, None]:
         """
         returns basic information about the gene.
@@ -109,9 +661,9 @@ class UTAREST(Interface):
         }
 
         """
-        url = ("{serv}/gene_info/{gene}").format(serv=self.server, gene=gene)
-        return requests.get(url, timeout=5).json()
+        return self._get("gene_info", gene)
 
+    @traced
     def get_tx_exons(self, tx_ac: str, alt_ac: str, alt_aln_method: str) -> List[dict]:
         """
         return transcript exon info for supplied accession (tx_ac, alt_ac, alt_aln_method), or None if not found
@@ -158,11 +710,9 @@ class UTAREST(Interface):
         'NM_199425.2'
 
         """
-        url = ("{serv}/tx_exons/{tx_ac}/{alt_ac}?alt_aln_method={alt_aln_method}").format(
-            serv=self.server, tx_ac=tx_ac, alt_ac=alt_ac, alt_aln_method=alt_aln_method
-        )
-        return requests.get(url, timeout=5).json()
+        return self._get("tx_exons", tx_ac, alt_ac, params={"alt_aln_method": alt_aln_method})
 
+    @traced
     def get_tx_for_gene(self, gene: str) -> Union[List[dict], None]:
         """
         return transcript info records for supplied gene, in order of decreasing length
@@ -170,9 +720,9 @@ class UTAREST(Interface):
         :param gene: HGNC gene name
         :type gene: str
         """
-        url = ("{serv}/tx_for_gene/{gene}").format(serv=self.server, gene=gene)
-        return requests.get(url, timeout=5).json()
+        return self._get("tx_for_gene", gene)
 
+    @traced
     def get_tx_for_region(self, alt_ac: str, alt_aln_method: str, start_i: int, end_i: int) -> Union[List[dict], None]:
         """
         return transcripts that overlap given region
@@ -182,11 +732,13 @@ class UTAREST(Interface):
         :param int start_i: 5' bound of region
         :param int end_i: 3' bound of region
         """
-        url = ("{serv}/tx_for_region/{alt_ac}?alt_aln_method={alt_aln_method}&start_i={start_i}&end_i={end_i}").format(
-            serv=self.server, alt_ac=alt_ac, alt_aln_method=alt_aln_method, start_i=start_i, end_i=end_i
-        )
-        return requests.get(url, timeout=5).json()
+        index = self._region_index(alt_ac)
+        if index is not None:
+            return index.alignments_for_region(start_i, end_i, alt_aln_method)
+        params = {"alt_aln_method": alt_aln_method, "start_i": start_i, "end_i": end_i}
+        return self._get("tx_for_region", alt_ac, params=params)
 
+    @traced
     def get_alignments_for_region(
         self, alt_ac: str, start_i: int, end_i: int, alt_aln_method: Optional[str] = None
     ) -> List:
@@ -198,12 +750,13 @@ class UTAREST(Interface):
         :param int end_i: 3' bound of region
         :param str alt_aln_method: OPTIONAL alignment method (e.g., splign)
         """
-        url = ("{serv}/alignments_for_region/{alt_ac}?start_i={start_i}&end_i={end_i}").format(
-            serv=self.server, alt_ac=alt_ac, start_i=start_i, end_i=end_i
-        )
-        self.optional_parameters(["alt_aln_method"], [alt_aln_method])
-        return requests.get(url, timeout=5).json()
+        index = self._region_index(alt_ac)
+        if index is not None:
+            return index.alignments_for_region(start_i, end_i, alt_aln_method)
+        params = {"start_i": start_i, "end_i": end_i, "alt_aln_method": alt_aln_method}
+        return self._get("alignments_for_region", alt_ac, params=params)
 
+    @traced
     def get_tx_identity_info(self, tx_ac: str) -> dict:
         """returns features associated with a single transcript.
 
@@ -222,9 +775,9 @@ class UTAREST(Interface):
         }
 
         """
-        url = ("{serv}/tx_identity_info/{tx_ac}").format(serv=self.server, tx_ac=tx_ac)
-        return requests.get(url, timeout=5).json()
+        return self._get("tx_identity_info", tx_ac)
 
+    @traced
     def get_tx_info(self, tx_ac: str, alt_ac: str, alt_aln_method: str) -> dict:
         """return a single transcript info for supplied accession (tx_ac, alt_ac, alt_aln_method), or None if not found
 
@@ -248,11 +801,9 @@ class UTAREST(Interface):
         }
 
         """
-        url = ("{serv}/tx_info/{tx_ac}/{alt_ac}?alt_aln_method={alt_aln_method}").format(
-            serv=self.server, tx_ac=tx_ac, alt_ac=alt_ac, alt_aln_method=alt_aln_method
-        )
-        return requests.get(url, timeout=5).json()
+        return self._get("tx_info", tx_ac, alt_ac, params={"alt_aln_method": alt_aln_method})
 
+    @traced
     def get_tx_mapping_options(self, tx_ac: str) -> Union[List[dict], None]:
         """Return all transcript alignment sets for a given transcript
         accession (tx_ac); returns empty list if transcript does not
@@ -270,9 +821,9 @@ class UTAREST(Interface):
         }
 
         """
-        url = ("{serv}/tx_mapping_options/{tx_ac}").format(serv=self.server, tx_ac=tx_ac)
-        return requests.get(url, timeout=5).json()
+        return self._get("tx_mapping_options", tx_ac)
 
+    @traced
     def get_similar_transcripts(self, tx_ac: str) -> Union[List[dict], None]:
         """Return a list of transcripts that are similar to the given
         transcript, with relevant similarity criteria.
@@ -313,16 +864,109 @@ class UTAREST(Interface):
         sequence.
 
         """
-        url = ("{serv}/similar_transcripts/{tx_ac}").format(serv=self.server, tx_ac=tx_ac)
-        return requests.get(url, timeout=5).json()
+        return self._get("similar_transcripts", tx_ac)
 
+    @traced
     def get_pro_ac_for_tx_ac(self, tx_ac: str) -> Union[str, None]:
         """Return the (single) associated protein accession for a given transcript
         accession, or None if not found."""
-        url = ("{serv}/pro_ac_for_tx_ac/{tx_ac}").format(serv=self.server, tx_ac=tx_ac)
-        return requests.get(url, timeout=5).json()
+        return self._get("pro_ac_for_tx_ac", tx_ac)
 
+    @traced
     def get_assembly_map(self, assembly_name: str) -> dict:
         """Return a list of accessions for the specified assembly name (e.g., GRCh38.p5)."""
-        url = ("{serv}/assembly_map/{assembly_name}").format(serv=self.server, assembly_name=assembly_name)
-        return requests.get(url, timeout=5).json()
+        return self._get("assembly_map", assembly_name)
+
+    ############################################################################
+    # Bulk queries
+    # Each returns a list with one result per key, in order; a result is what the
+    # corresponding single query returns. The results are cached as though they
+    # had been fetched singly, so these methods can be used to prefetch data.
+
+    @traced
+    def get_acs_for_protein_seq_many(self, seqs: Sequence[str]) -> List:
+        """returns get_acs_for_protein_seq(seq) for each seq, looked up by digest"""
+        results = []
+        md5s = {}
+        for i, seq in enumerate(seqs):
+            try:
+                md5s[i] = seq_md5(seq)
+                results.append(None)
+            except RuntimeError as e:
+                results.append({"detail": str(e)})
+        found = self._get_many("acs_for_protein_md5", [((md5,), {}) for md5 in md5s.values()], list(md5s.values()))
+        for i, acs in zip(md5s, found):
+            results[i] = acs
+        return results
+
+    @traced
+    def get_seq_many(self, keys: Sequence[Tuple[str, Optional[int], Optional[int]]]) -> List:
+        """returns get_seq(ac, start_i, end_i) for each (ac, start_i, end_i) key"""
+        queries = [((ac,), {"start_i": s, "end_i": e}) for ac, s, e in keys]
+        bodies = [{"ac": ac, "start_i": s, "end_i": e} for ac, s, e in keys]
+        return self._get_many("seq", queries, bodies)
+
+    @traced
+    def get_tx_exons_many(self, keys: Sequence[Tuple[str, str, str]]) -> List:
+        """returns get_tx_exons(tx_ac, alt_ac, alt_aln_method) for each (tx_ac, alt_ac, alt_aln_method) key"""
+        queries = [((tx_ac, alt_ac), {"alt_aln_method": m}) for tx_ac, alt_ac, m in keys]
+        bodies = [{"tx_ac": tx_ac, "alt_ac": alt_ac, "alt_aln_method": m} for tx_ac, alt_ac, m in keys]
+        return self._get_many("tx_exons", queries, bodies)
+
+    @traced
+    def get_tx_for_gene_many(self, genes: Sequence[str]) -> List:
+        """returns get_tx_for_gene(gene) for each gene"""
+        return self._get_many("tx_for_gene", [((gene,), {}) for gene in genes], list(genes))
+
+    @traced
+    def get_tx_identity_info_many(self, tx_acs: Sequence[str]) -> List:
+        """returns get_tx_identity_info(tx_ac) for each tx_ac"""
+        return self._get_many("tx_identity_info", [((tx_ac,), {}) for tx_ac in tx_acs], list(tx_acs))
+
+    @traced
+    def get_tx_info_many(self, keys: Sequence[Tuple[str, str, str]]) -> List:
+        """returns get_tx_info(tx_ac, alt_ac, alt_aln_method) for each (tx_ac, alt_ac, alt_aln_method) key"""
+        queries = [((tx_ac, alt_ac), {"alt_aln_method": m}) for tx_ac, alt_ac, m in keys]
+        bodies = [{"tx_ac": tx_ac, "alt_ac": alt_ac, "alt_aln_method": m} for tx_ac, alt_ac, m in keys]
+        return self._get_many("tx_info", queries, bodies)
+
+    @traced
+    def get_tx_mapping_options_many(self, tx_acs: Sequence[str]) -> List:
+        """returns get_tx_mapping_options(tx_ac) for each tx_ac"""
+        return self._get_many("tx_mapping_options", [((tx_ac,), {}) for tx_ac in tx_acs], list(tx_acs))
+
+    def prefetch(
+        self,
+        genes: Sequence[str] = (),
+        tx_acs: Sequence[str] = (),
+        alt_aln_method: Optional[str] = None,
+        alt_acs: Optional[Collection[str]] = None,
+    ) -> List[Tuple[str, str, str]]:
+        """
+        loads the response caches with what is needed to map variants on the transcripts of genes and on
+        tx_acs, so that mapping then needs no requests: tx_for_gene for each gene; tx_mapping_options and
+        tx_identity_info for each of those transcripts; and tx_info and tx_exons for each of their
+        alignments (only those made by alt_aln_method and on the reference sequences alt_acs, if given).
+        Everything is fetched with the bulk queries, and independent bulk queries are sent concurrently.
+
+        returns the (tx_ac, alt_ac, alt_aln_method) alignments that were prefetched. the response cache
+        (see cache_size and cache_bytes) must be large enough to hold the results.
+        """
+        tx_acs = dict.fromkeys(tx_acs)
+        for rows in self.get_tx_for_gene_many(list(dict.fromkeys(genes))):
+            tx_acs.update(dict.fromkeys(r["tx_ac"] for r in _rows(rows)))
+        tx_acs = list(tx_acs)
+        with ThreadPoolExecutor(2, thread_name_prefix="utarest-prefetch") as executor:
+            identity_info = executor.submit(self.get_tx_identity_info_many, tx_acs)
+            alignments = [
+                (r["tx_ac"], r["alt_ac"], r["alt_aln_method"])
+                for rows in self.get_tx_mapping_options_many(tx_acs)
+                for r in _rows(rows)
+                if alt_aln_method is None or r["alt_aln_method"] == alt_aln_method
+                if alt_acs is None or r["alt_ac"] in alt_acs
+            ]
+            tx_info = executor.submit(self.get_tx_info_many, alignments)
+            self.get_tx_exons_many(alignments)
+            identity_info.result()
+            tx_info.result()
+        return alignments
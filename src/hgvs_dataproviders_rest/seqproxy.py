@@ -0,0 +1,173 @@
+"""lazy, sliceable proxies for remote sequences
+
+A SequenceProxy stands in for a sequence string without fetching it. Slices
+are assembled from fixed-size blocks that are fetched on demand and kept in
+an LRUCache shared by all proxies of a client, so memory use is bounded by
+the block cache, however long the sequences are. When blocks are read in
+order, the next block is prefetched in the background.
+
+"""
+
+import threading
+from concurrent.futures import Executor, Future
+from typing import Callable, Dict, Optional, Union
+
+from hgvs.exceptions import HGVSDataNotAvailableError
+
+from hgvs_dataproviders_rest.cache import LRUCache
+
+# fetch(ac, start_i, end_i) returns the sequence of ac in [start_i, end_i), which is
+# shorter than requested (possibly empty) at the end of the sequence
+Fetcher = Callable[[str, int, int], str]
+
+
+class SequenceProxy:
+    """lazy stand-in for the sequence of an accession, fetched in blocks as it is sliced
+
+    Indexing and slicing (with step 1) return str, as for a sequence string;
+    len() and str() are supported but may need several requests: the length is
+    found by a binary search of single-base fetches, unless the last block has
+    already been fetched.
+
+    >>> seq = "ACGT" * 10
+    >>> p = SequenceProxy("NC_1", lambda ac, s, e: seq[s:e], LRUCache(), block_size=8)
+    >>> p[3:13]
+    'TACGTACGTA'
+    >>> p[-2:], len(p)
+    ('GT', 40)
+
+    """
+
+    def __init__(
+        self,
+        ac: str,
+        fetch: Fetcher,
+        blocks: LRUCache,
+        block_size: int = 16384,
+        executor: Optional[Executor] = None,
+    ):
+        """
+        :param ac: accession of the sequence
+        :param fetch: function that fetches a slice of a sequence
+        :param blocks: block cache, keyed by (ac, block_size, block number); may be shared by proxies
+        :param block_size: bases per block
+        :param executor: executor for prefetching the next block on sequential reads, or None for no prefetch
+        """
+        self.ac = ac
+        self.block_size = block_size
+        self._fetch = fetch
+        self._blocks = blocks
+        self._executor = executor
+        self._length = None
+        self._last_block = None
+        self._inflight: Dict[int, Future] = {}
+        self._lock = threading.Lock()
+
+    def __repr__(self) -> str:
+        return "{}({!r}, block_size={})".format(type(self).__name__, self.ac, self.block_size)
+
+    def __str__(self) -> str:
+        return self[:]
+
+    def __len__(self) -> int:
+        if self._length is None:
+            self._length = self._find_length()
+        return self._length
+
+    def __getitem__(self, index: Union[int, slice]) -> str:
+        if isinstance(index, slice):
+            if index.step not in (None, 1):
+                return str(self)[index]
+            start, stop = index.start or 0, index.stop
+            if start < 0 or (stop is not None and stop < 0):
+                start, stop, _ = index.indices(len(self))
+            return self._slice(start, stop)
+        if index < 0:
+            index += len(self)
+        base = self._slice(index, index + 1) if index >= 0 else ""
+        if not base:
+            raise IndexError("sequence index out of range")
+        return base
+
+    def _slice(self, start: int, stop: Optional[int]) -> str:
+        """returns the sequence in [start, stop), or from start to the end if stop is None, from the blocks
+        that cover it"""
+        if stop is not None and stop <= start:
+            return ""
+        first = i = start // self.block_size
+        parts = []
+        while stop is None or i * self.block_size < stop:
+            block = self._block(i)
+            parts.append(block)
+            if len(block) < self.block_size:
+                break
+            i += 1
+        offset = first * self.block_size
+        return "".join(parts)[start - offset : stop - offset if stop is not None else None]
+
+    def _block(self, i: int) -> str:
+        """returns block i, from the cache, an in-flight prefetch, or the server; schedules a prefetch of block i+1
+        if blocks are being read in order"""
+        key = (self.ac, self.block_size, i)
+        block = self._blocks.get(key)
+        if block is None:
+            with self._lock:
+                future = self._inflight.get(i)
+            block = future.result() if future is not None else self._load(i)
+        if self._last_block is not None and i == self._last_block + 1 and len(block) == self.block_size:
+            self._prefetch(i + 1)
+        self._last_block = i
+        return block
+
+    def _load(self, i: int) -> str:
+        """fetches block i and caches it; the sequence length is learned from the first short block"""
+        start = i * self.block_size
+        block = self._fetch(self.ac, start, start + self.block_size)
+        if not isinstance(block, str):
+            raise HGVSDataNotAvailableError(
+                "Failed to fetch {} [{}, {})".format(self.ac, start, start + self.block_size)
+            )
+        if len(block) < self.block_size and (block or i == 0):
+            self._length = start + len(block)
+        self._blocks.set((self.ac, self.block_size, i), block, size=len(block))
+        return block
+
+    def _prefetch(self, i: int) -> None:
+        if self._executor is None or (self.ac, self.block_size, i) in self._blocks:
+            return
+        with self._lock:
+            if i in self._inflight:
+                return
+            try:
+                future = self._executor.submit(self._load, i)
+            except RuntimeError:  # the executor has been shut down
+                return
+            self._inflight[i] = future
+        future.add_done_callback(lambda f: self._forget(i))
+
+    def _forget(self, i: int) -> None:
+        with self._lock:
+            self._inflight.pop(i, None)
+
+    def _find_length(self) -> int:
+        """returns the length of the sequence, by an exponential then binary search for its last base"""
+
+        def has_base(pos: int) -> bool:
+            base = self._fetch(self.ac, pos, pos + 1)
+            if not isinstance(base, str):
+                raise HGVSDataNotAvailableError("Failed to fetch {}".format(self.ac))
+            return len(base) == 1
+
+        if not has_base(0):
+            return 0
+        lo, hi = 0, self.block_size
+        while has_base(hi):
+            lo, hi = hi, hi * 2
+        # invariant: base lo exists, base hi does not
+        while hi - lo > 1:
+            mid = (lo + hi) // 2
+            if has_base(mid):
+                lo = mid
+            else:
+                hi = mid
+        return hi
@@ -0,0 +1,80 @@
+"""request coalescing ("single flight") for the hgvs dataprovider REST client and api
+
+When several callers ask for the same key at the same time, only the first
+(the leader) does the work; the others wait for and share its result, or
+its exception. Once the call completes, the key is forgotten, so later
+calls start afresh; caching results is left to the caches.
+
+>>> flights = SingleFlight()
+>>> flights.do("gene_info/VHL", lambda: {"hgnc": "VHL"})
+{'hgnc': 'VHL'}
+
+"""
+
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    """coalesces concurrent calls with the same key across threads"""
+
+    def __init__(self):
+        self.calls = 0
+        self.shared = 0
+        self._inflight: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, func: Callable, *args) -> Any:
+        """returns func(*args), or the result of an identical call already in flight"""
+        with self._lock:
+            self.calls += 1
+            future = self._inflight.get(key)
+            if future is not None:
+                self.shared += 1
+            else:
+                leader = self._inflight[key] = Future()
+        if future is not None:
+            return future.result()
+        try:
+            value = func(*args)
+        except BaseException as e:
+            leader.set_exception(e)
+            raise
+        else:
+            leader.set_result(value)
+            return value
+        finally:
+            with self._lock:
+                del self._inflight[key]
+
+
+class AsyncSingleFlight:
+    """coalesces concurrent calls with the same key on an event loop
+
+    The work runs in its own task, so a caller that is cancelled (e.g., because
+    its client disconnected) does not cancel the work for the other callers.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.shared = 0
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+
+    async def do(self, key: Hashable, func: Callable[..., Awaitable], *args) -> Any:
+        """returns await func(*args), or the result of an identical call already in flight"""
+        self.calls += 1
+        task = self._inflight.get(key)
+        if task is not None:
+            self.shared += 1
+        else:
+            task = self._inflight[key] = asyncio.ensure_future(func(*args))
+            task.add_done_callback(lambda t: self._done(key, t))
+        return await asyncio.shield(task)
+
+    def _done(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()  # retrieved here, in case every caller was cancelled
@@ -0,0 +1,70 @@
+"""OpenTelemetry tracing of the hgvs dataprovider REST clients' queries
+
+If opentelemetry-api is installed, each get_* call of UTAREST and
+AsyncUTAREST runs in a span named after it (e.g., "utarest.get_tx_info"),
+with attributes:
+
+* utarest.args: the query's arguments, as strings cut to MAX_ARG_LENGTH
+  characters; or, for get_*_many, utarest.keys: the number of keys
+* utarest.cache: "hit" or "miss", for queries answered through the
+  response cache; or, for get_*_many, utarest.cache_hits and
+  utarest.cache_misses
+
+Spans are recorded only if the application configures an OpenTelemetry
+SDK; otherwise the API's no-op tracer costs about a microsecond per call.
+Calls answered by hgvs's own lru_cache, in front of the get_* methods, are
+not traced.
+
+"""
+
+import functools
+import inspect
+from typing import Callable, Sequence
+
+try:
+    from opentelemetry import trace
+except ImportError:  # pragma: no cover
+    trace = None
+
+# arguments recorded on spans are cut to this many characters (e.g., protein sequences)
+MAX_ARG_LENGTH = 64
+
+_tracer = trace.get_tracer(__name__) if trace is not None else None
+
+
+def traced(method: Callable) -> Callable:
+    """decorates a get_* method (or coroutine method) to run in a span, if opentelemetry is installed"""
+    if _tracer is None:
+        return method
+    name = "utarest." + method.__name__
+
+    if inspect.iscoroutinefunction(method):
+
+        @functools.wraps(method)
+        async def async_wrapper(self, *args, **kwargs):
+            with _tracer.start_as_current_span(name, attributes=_attributes(args)):
+                return await method(self, *args, **kwargs)
+
+        return async_wrapper
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with _tracer.start_as_current_span(name, attributes=_attributes(args)):
+            return method(self, *args, **kwargs)
+
+    return wrapper
+
+
+def annotate(**attributes) -> None:
+    """sets attributes, prefixed with "utarest.", on the current span if it is recorded"""
+    if trace is None:
+        return
+    span = trace.get_current_span()
+    if span.is_recording():
+        span.set_attributes({"utarest." + k: v for k, v in attributes.items()})
+
+
+def _attributes(args: Sequence) -> dict:
+    if args and isinstance(args[0], (list, tuple)):
+        return {"utarest.keys": len(args[0])}
+    return {"utarest.args": [str(arg)[:MAX_ARG_LENGTH] for arg in args]}
@@ -0,0 +1,99 @@
+import gzip
+import io
+import json
+from urllib.parse import parse_qsl, urlsplit
+
+import requests
+import urllib3
+
+# the /ping response of the server the cassettes were recorded against
+PING = {"data_version": "uta_20180821", "schema_version": "1.1", "sequence_source": "seqfetcher"}
+
+# the /tx_info/NM_199425.2/NC_000020.10?alt_aln_method=splign response of that server
+TX_INFO = {
+    "hgnc": "VSX1",
+    "cds_start_i": 283,
+    "cds_end_i": 1003,
+    "tx_ac": "NM_199425.2",
+    "alt_ac": "NC_000020.10",
+    "alt_aln_method": "splign",
+}
+
+
+def reply(value, status_code=200, headers=None, content_type="application/json"):
+    """returns a response for StubAdapter: value is sent as is if it is str or bytes, else encoded as JSON"""
+    if isinstance(value, str):
+        body = value.encode()
+    elif isinstance(value, bytes):
+        body = value
+    else:
+        body = json.dumps(value, separators=(",", ":")).encode()
+    return status_code, body, dict({"Content-Type": content_type}, **(headers or {}))
+
+
+def query(request) -> dict:
+    """returns the query parameters of a request"""
+    return dict(parse_qsl(urlsplit(request.url).query))
+
+
+def batch(results):
+    """
+    returns a route for POST /batch/{endpoint}, answering each key with its result in results[endpoint],
+    where keys that are dicts are looked up as the tuple of their values; missing keys are answered 404
+    """
+
+    def route(request):
+        endpoint = urlsplit(request.url).path.rsplit("/", 1)[1]
+        answers = []
+        for key in json.loads(request.body):
+            key = tuple(key.values()) if isinstance(key, dict) else key
+            if key in results[endpoint]:
+                answers.append({"status_code": 200, "body": results[endpoint][key]})
+            else:
+                answers.append({"status_code": 404, "body": {"detail": f"No {endpoint} for {key}"}})
+        return reply(answers)
+
+    return route
+
+
+class StubAdapter(requests.adapters.BaseAdapter):
+    """
+    a transport adapter that answers requests without a server, for mounting in a client's session
+    (set client._adapter before its first request). routes map a path (e.g., "/ping") to a response,
+    as returned by reply(), or to a function of the request that returns one; other paths are answered
+    404. the requests sent are recorded in requests.
+    """
+
+    def __init__(self, routes=None, gzip_min_size=None):
+        super().__init__()
+        self.routes = dict(routes or {})
+        self.gzip_min_size = gzip_min_size
+        self.requests = []
+
+    def send(self, request, **kwargs):
+        self.requests.append(request)
+        route = self.routes.get(urlsplit(request.url).path)
+        if route is None:
+            status_code, body, headers = reply({"detail": "Not Found"}, 404)
+        else:
+            status_code, body, headers = route(request) if callable(route) else route
+        resp = requests.Response()
+        if self.gzip_min_size is not None and len(body) >= self.gzip_min_size:
+            # compressed as the api compresses large bodies, for requests to decode
+            body = gzip.compress(body)
+            headers = dict(headers, **{"Content-Encoding": "gzip"})
+        resp.status_code = status_code
+        resp.headers.update(headers)
+        resp.headers.setdefault("Content-Length", str(len(body)))
+        resp.raw = urllib3.HTTPResponse(io.BytesIO(body), headers=headers, status=status_code, preload_content=False)
+        resp.url = request.url
+        resp.request = request
+        resp.encoding = requests.utils.get_encoding_from_headers(resp.headers)
+        return resp
+
+    def close(self):
+        pass
+
+    def paths(self) -> list:
+        """returns the paths requested, in order"""
+        return [urlsplit(r.url).path for r in self.requests]
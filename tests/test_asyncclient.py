@@ -0,0 +1,113 @@
+import asyncio
+import json
+import threading
+
+import pytest
+from stub_support import PING, TX_INFO
+
+from hgvs_dataproviders_rest.asyncclient import AsyncUTAREST
+from hgvs_dataproviders_rest.cache import SQLiteCache
+
+httpx = pytest.importorskip("httpx")
+
+
+def handler(request):
+    """answers /ping, /tx_info, and /batch/tx_info for VSX1's alignment to NC_000020.10, as the api would"""
+    if request.url.path == "/ping":
+        return httpx.Response(200, json=PING)
+    key = ("NM_199425.2", "NC_000020.10", "splign")
+    if request.url.path == "/tx_info/NM_199425.2/NC_000020.10":
+        return httpx.Response(200, json=TX_INFO)
+    if request.url.path == "/batch/tx_info":
+        answers = []
+        for body in json.loads(request.content):
+            if tuple(body.values()) == key:
+                answers.append({"status_code": 200, "body": TX_INFO})
+            else:
+                answers.append({"status_code": 404, "body": {"detail": f"No tx_info for {tuple(body.values())}"}})
+        return httpx.Response(200, json=answers)
+    return httpx.Response(404, json={"detail": "Not Found"})
+
+
+def test_async_client():
+    """The async client returns what the sync client returns, and caches results of bulk queries."""
+    hdp = AsyncUTAREST("http://uta.test", max_concurrency=2)
+    hdp._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+    async def run():
+        async with hdp:
+            assert (await hdp.data_version()) == "uta_20180821"
+            keys = [("NM_199425.2", "NC_000020.10", "splign"), ("NM_199425.2", "fake", "splign")]
+            many = await hdp.get_tx_info_many(keys)
+            assert many[0]["hgnc"] == "VSX1"
+            assert "No tx_info for" in many[1]["detail"]
+            single = await hdp.map(hdp.get_tx_info, [keys[0]] * 5)
+            assert single == [many[0]] * 5
+            assert hdp.response_cache_info().hits == 5
+
+    asyncio.run(run())
+
+
+def test_async_client_built_outside_loop():
+    """A client built before its event loop starts creates its lock and semaphore in that loop."""
+    calls = []
+
+    async def handler(request):
+        calls.append(request.url.path)
+        await asyncio.sleep(0.01)
+        return httpx.Response(200, json={"data_version": "uta_stub", "schema_version": "1.1"})
+
+    hdp = AsyncUTAREST("http://uta.test", max_concurrency=1)
+    hdp._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+    async def run():
+        async with hdp:
+            versions = await asyncio.gather(hdp.data_version(), hdp.data_version(), hdp.schema_version())
+            assert versions == ["uta_stub", "uta_stub", "1.1"]
+
+    asyncio.run(run())
+    assert calls == ["/ping"]
+
+
+class ThreadRecordingCache(SQLiteCache):
+    """a SQLiteCache that records the threads it is called on"""
+
+    def __init__(self, *args, **kwargs):
+        self.threads = []
+        super().__init__(*args, **kwargs)
+
+    def get(self, key, default=None):
+        self.threads.append(threading.get_ident())
+        return super().get(key, default)
+
+    def set(self, key, value, size):
+        self.threads.append(threading.get_ident())
+        super().set(key, value, size)
+
+
+def test_persistent_cache_off_loop(tmp_path):
+    """The persistent cache is read and written on worker threads, not on the event loop's thread."""
+    cache = ThreadRecordingCache(str(tmp_path / "c.sqlite3"))
+    keys = [("NM_199425.2", "NC_000020.10", "splign"), ("NM_199425.2", "fake", "splign")]
+
+    async def run(hdp):
+        async with hdp:
+            many = await hdp.get_tx_info_many(keys)
+            single = await hdp.get_tx_info(*keys[0])
+            return many, single, threading.get_ident()
+
+    hdp = AsyncUTAREST("http://uta.test", cache_size=0, persistent_cache=cache, ping_ttl=60)
+    hdp._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    many, single, loop_thread = asyncio.run(run(hdp))
+    assert many[0] == single == TX_INFO
+    assert cache.threads and loop_thread not in cache.threads
+
+    # a new client answers from the file: ping and tx_info without requests
+    requests = []
+    hdp = AsyncUTAREST("http://uta.test", cache_size=0, persistent_cache=cache, ping_ttl=60)
+    hdp._client = httpx.AsyncClient(transport=httpx.MockTransport(lambda r: requests.append(r) or handler(r)))
+    cache.threads.clear()
+    many, single, loop_thread = asyncio.run(run(hdp))
+    assert many[0] == single == TX_INFO
+    assert [r.url.path for r in requests] == ["/batch/tx_info"]
+    assert cache.threads and loop_thread not in cache.threads
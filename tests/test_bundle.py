@@ -0,0 +1,47 @@
+from stub_support import PING, StubAdapter, batch, reply
+
+import hgvs_dataproviders_rest.restclient as utarest
+from hgvs_dataproviders_rest.bundle import Bundle, build
+
+
+def test_build_bundle(tmp_path):
+    """A bundle built from the api answers the crawled queries offline."""
+    tx_ac, alt_ac = "NM_199425.2", "NC_000020.10"
+    results = {
+        "tx_identity_info": {tx_ac: {"tx_ac": tx_ac, "alt_ac": tx_ac, "cds_start_i": 283, "hgnc": "VSX1"}},
+        "tx_mapping_options": {
+            tx_ac: [{"tx_ac": tx_ac, "alt_ac": alt_ac, "alt_aln_method": m} for m in ("blat", "splign")]
+        },
+        "tx_info": {(tx_ac, alt_ac, "splign"): {"hgnc": "VSX1", "cds_start_i": 283, "tx_ac": tx_ac}},
+        "tx_exons": {(tx_ac, alt_ac, "splign"): [{"tx_ac": tx_ac, "ord": i} for i in range(3)]},
+    }
+    path = str(tmp_path / "panel.utarest")
+    hdp = utarest.UTAREST("http://uta.test", cache_size=0, persistent_cache=Bundle(path))
+    hdp._adapter = StubAdapter({"/ping": reply(PING), **{"/batch/" + e: batch(results) for e in results}})
+    alignments = build(hdp, hdp.persistent_cache, tx_acs=[tx_ac], alt_aln_method="splign", flank=None)
+    assert alignments == [(tx_ac, alt_ac, "splign")]
+
+    offline = utarest.UTAREST("http://unreachable.invalid", bundle=Bundle(path, readonly=True))
+    assert offline.data_version() == "uta_20180821"
+    assert offline.get_tx_info("NM_199425.2", "NC_000020.10", "splign")["hgnc"] == "VSX1"
+    assert len(offline.get_tx_exons("NM_199425.2", "NC_000020.10", "splign")) == 3
+    assert (
+        "No tx_info/NM_199425.2/NC_000020.11" in offline.get_tx_info("NM_199425.2", "NC_000020.11", "splign")["detail"]
+    )
+
+
+def test_bundle_seqs(tmp_path):
+    """Sequences are read from whole sequences and from the stored spans that cover them."""
+    path = str(tmp_path / "seqs.utarest")
+    bundle = Bundle(path)
+    bundle.set_meta("ping", '{"data_version": "uta_20180821", "schema_version": "1.1", "sequence_source": "x"}')
+    bundle.add_seq("NM_1", "ACGTACGT", whole=True)
+    bundle.add_seq("NC_1", "TTTTGGGG", start_i=1000, end_i=1010)
+    bundle.close()
+
+    hdp = utarest.UTAREST("http://unreachable.invalid", bundle=Bundle(path, readonly=True), lazy_seq=True)
+    assert hdp.get_seq("NM_1") == "ACGTACGT"
+    assert hdp.get_seq("NM_1", 2, 100) == "GTACGT"
+    assert hdp.get_seq("NC_1", 1002, 1006) == "TTGG"
+    assert hdp.get_seq("NC_1", 1004, 1010) == "GGGG"
+    assert "detail" in hdp.get_seq("NC_1", 900, 1004)
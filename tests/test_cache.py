@@ -0,0 +1,51 @@
+import time
+
+from hgvs_dataproviders_rest.cache import LRUCache, SQLiteCache
+
+
+def test_lru_cache_max_bytes():
+    c = LRUCache(max_entries=10, max_bytes=10)
+    c.set("a", "a", size=4)
+    c.set("b", "b", size=4)
+    c.set("c", "c", size=4)
+    assert "a" not in c
+    assert c.get("b") == "b"
+    assert c.bytes == 8
+    c.set("d", "d", size=11)  # larger than the whole cache; not stored
+    assert "d" not in c
+    assert len(c) == 2
+
+
+def test_lru_cache_ttl():
+    c = LRUCache(ttl=0.01)
+    c.set("a", 1, size=1)
+    assert c.get("a") == 1
+    time.sleep(0.02)
+    assert c.get("a") is None
+    assert c.cache_info() == (1, 1, 1, 1)
+    assert c.peek("a") == 1  # expired entries can be revalidated
+    c.renew("a")
+    assert c.get("a") == 1
+
+
+def test_sqlite_cache_eviction(tmp_path):
+    c = SQLiteCache(str(tmp_path / "c.sqlite3"), max_bytes=100)
+    for i in range(20):
+        c.set(("ns", str(i)), b"x" * 10, size=10)
+        time.sleep(0.001)
+    c.evict()
+    info = c.cache_info()
+    assert info.bytes <= 100
+    assert c.get(("ns", "0")) is None
+    assert c.get(("ns", "19")) == b"x" * 10
+
+
+def test_sqlite_cache_readonly(tmp_path):
+    path = str(tmp_path / "c.sqlite3")
+    c = SQLiteCache(path)
+    c.set(("ns", "a"), b"a", size=1)
+    c.close()
+    ro = SQLiteCache(path, readonly=True)
+    ro.set(("ns", "b"), b"b", size=1)
+    assert ro.get(("ns", "a")) == b"a"
+    assert ro.get(("ns", "b")) is None
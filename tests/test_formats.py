@@ -0,0 +1,35 @@
+import pytest
+
+from hgvs_dataproviders_rest import formats
+
+ROWS = [
+    {"tx_ac": "NM_199425.2", "alt_ac": "NC_000020.10", "ord": i, "cigar": "410=", "tx_aseq": None} for i in range(3)
+]
+
+
+@pytest.mark.parametrize("media_type", formats.MEDIA_TYPES)
+def test_round_trip(media_type):
+    """Every format decodes to the value that was encoded."""
+    content_type = media_type + "; charset=utf-8"
+    for value in (ROWS, ROWS[0], ["NP_1", "MD5_x"], "ACGT", None, [], [{"a": 1}, {"b": 2}]):
+        assert formats.decode(formats.encode(value, media_type), content_type) == value
+
+
+def test_columnar_is_smaller():
+    assert len(formats.encode(ROWS, formats.COLUMNAR_JSON)) < len(formats.encode(ROWS, formats.JSON))
+
+
+def test_negotiate():
+    assert formats.negotiate(None) == formats.JSON
+    assert formats.negotiate("application/json") == formats.JSON
+    assert formats.negotiate("text/html, */*") == formats.JSON
+    assert formats.negotiate(formats.accept_header(formats.COLUMNAR_JSON)) == formats.COLUMNAR_JSON
+    assert formats.negotiate("application/vnd.utarest.columnar+json;q=0.1, application/json") == formats.JSON
+
+
+def test_json_without_orjson(monkeypatch):
+    """JSON is encoded the same with and without orjson."""
+    body = formats.encode(ROWS, formats.JSON)
+    monkeypatch.setattr(formats, "orjson", None)
+    assert formats.encode(ROWS, formats.JSON) == body
+    assert formats.decode(body, formats.JSON) == ROWS
@@ -0,0 +1,34 @@
+import random
+
+from hgvs_dataproviders_rest.regionindex import RegionIndex
+
+
+def test_region_index_matches_uta():
+    """Region queries return the alignments that UTA's alignments_for_region returns, also after adds."""
+    rng = random.Random(0)
+    rows = []
+    for i in range(500):
+        start_i = rng.randrange(0, 10**6)
+        rows.append(
+            {
+                "tx_ac": "NM_{}".format(i),
+                "alt_ac": "NC_1",
+                "alt_strand": rng.choice([-1, 1]),
+                "alt_aln_method": rng.choice(["splign", "blat"]),
+                "start_i": start_i,
+                "end_i": start_i + rng.randrange(1, 10**5),
+            }
+        )
+    idx = RegionIndex(rows[:250])
+    for r in rows[250:]:
+        idx.add(r)
+    for _ in range(500):
+        start_i = rng.randrange(0, 10**6)
+        end_i = start_i + rng.randrange(0, 10**4)
+        method = rng.choice([None, "splign"])
+        expected = [
+            r for r in rows if r["start_i"] < start_i and end_i <= r["end_i"] and method in (None, r["alt_aln_method"])
+        ]
+        key = lambda r: r["tx_ac"]  # noqa: E731
+        assert sorted(idx.alignments_for_region(start_i, end_i, method), key=key) == sorted(expected, key=key)
+    assert RegionIndex([]).alignments_for_region(0, 50) == []
@@ -1,10 +1,88 @@
+import asyncio
+import datetime
+import json
+import threading
+from collections import OrderedDict
+from types import SimpleNamespace
+
+import anyio
 import pytest
 import requests
+from fastapi.encoders import jsonable_encoder
+from fastapi.testclient import TestClient
+from hgvs.exceptions import HGVSDataNotAvailableError
+from psycopg2.extras import DictRow
+
+from hgvs_dataproviders_rest import restapi
+from hgvs_dataproviders_rest.cache import LRUCache, VersionedCache
 
 # The server you are using to test:
 base = "http://127.0.0.1:8000"
 
 
+class StubUTA:
+    """answers the api's UTA lookups for one transcript, NM_1 on NC_1, and the sequence of NC_1, without a database"""
+
+    seq = "ACGTTGCA" * 16
+
+    def data_version(self):
+        return "uta_stub"
+
+    def schema_version(self):
+        return "1.1"
+
+    def get_seq(self, ac, start_i=None, end_i=None):
+        if ac != "NC_1":
+            raise HGVSDataNotAvailableError(f"Failed to fetch {ac}")
+        return self.seq[start_i:end_i]
+
+    def get_tx_info(self, tx_ac, alt_ac, alt_aln_method):
+        if tx_ac != "NM_1":
+            raise HGVSDataNotAvailableError(f"No tx_info for {tx_ac}")
+        return {"hgnc": "STUB", "tx_ac": tx_ac, "alt_ac": alt_ac, "alt_aln_method": alt_aln_method}
+
+    def iter_alignments_for_ac(self, alt_ac, alt_aln_method=None):
+        if alt_ac != "NC_1":
+            self.batches = Batches([HGVSDataNotAvailableError(f"No alignments on {alt_ac}")])
+        else:
+            self.batches = Batches(
+                [[{"tx_ac": "NM_1", "alt_ac": alt_ac, "start_i": 10}], [{"tx_ac": "NM_2", "start_i": 20}]]
+            )
+        return self.batches
+
+
+class Batches:
+    """
+    an iterator of batches of rows, like the generator that UTA.iter_alignments_for_ac returns, that records
+    whether it was closed. exceptions among the batches are raised when they are read, and a threading.Event
+    is waited for.
+    """
+
+    def __init__(self, batches):
+        self._batches = iter(batches)
+        self.closed = False
+
+    def __next__(self):
+        batch = next(self._batches)
+        if isinstance(batch, threading.Event):
+            batch.wait(5)
+            batch = next(self._batches)
+        if isinstance(batch, Exception):
+            raise batch
+        return batch
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def client(monkeypatch):
+    """a TestClient of the api, answering from StubUTA"""
+    monkeypatch.setattr(restapi, "conn", StubUTA())
+    monkeypatch.setattr(restapi, "_metadata", None)
+    return TestClient(restapi.app)
+
+
 @pytest.mark.skip(reason="slow")
 def test_codes_seq_e():
     """Exisiting seq."""
@@ -287,3 +365,164 @@ def test_codes_assembly_map_ne():
     """Nonexisting assembly name."""
     url = base + "/assembl/gene_info/BRCA1y_map/GROUCH"
     assert requests.get(url).status_code == 404
+
+
+def test_metrics():
+    """Requests are timed by route template, and the metrics served at /metrics."""
+    pytest.importorskip("prometheus_client")
+    client = TestClient(restapi.app)
+    assert client.get("/cache_stats").status_code == 200
+    text = client.get("/metrics").text
+    assert 'utarest_request_duration_seconds_count{method="GET",route="/cache_stats"}' in text
+    assert 'utarest_serialize_duration_seconds_count{media_type="application/json",route="/cache_stats"}' in text
+
+
+def test_dicts():
+    """DictRows are converted to dicts as jsonable_encoder would convert them, without copying each row first."""
+    cursor = SimpleNamespace(index=OrderedDict([("hgnc", 0), ("added", 1)]), description=[None, None])
+    row = DictRow(cursor)
+    row[:] = ["VHL", datetime.datetime(2014, 2, 4, 21, 39, 32, 571250)]
+    assert (
+        restapi.dicts([row])
+        == jsonable_encoder([dict(row)])
+        == [{"hgnc": "VHL", "added": "2014-02-04T21:39:32.571250"}]
+    )
+    assert restapi.one_dict(row) == restapi.dicts([row])[0]
+    assert restapi.dicts([]) == []
+
+
+def test_batch(client, monkeypatch):
+    """Each key of a batch is answered as its single-key route answers it; batches over the limit are refused."""
+    keys = [
+        {"tx_ac": "NM_1", "alt_ac": "NC_1", "alt_aln_method": "splign"},
+        {"tx_ac": "NM_2", "alt_ac": "NC_1", "alt_aln_method": "splign"},
+    ]
+    r = client.post("/batch/tx_info", json=keys)
+    assert r.status_code == 200
+    assert r.json() == [
+        {"status_code": 200, "body": client.get("/tx_info/NM_1/NC_1", params={"alt_aln_method": "splign"}).json()},
+        {"status_code": 404, "body": {"detail": "No tx_info for NM_2"}},
+    ]
+    monkeypatch.setattr(restapi, "MAX_BATCH_SIZE", 1)
+    r = client.post("/batch/tx_info", json=keys)
+    assert r.status_code == 413
+    assert r.json() == {"detail": "Batch of 2 keys exceeds limit of 1"}
+
+
+class ThreadedRedis(dict):
+    """stands in for Redis, failing if it is called on an event loop"""
+
+    def get(self, key):
+        self._check()
+        return super().get(key)
+
+    def set(self, key, value, ex=None):
+        self._check()
+        self[key] = value
+
+    def _check(self):
+        with pytest.raises(RuntimeError):
+            asyncio.get_running_loop()
+
+
+def test_redis_off_loop(client, monkeypatch):
+    """Results are read from and written to Redis on worker threads, not on the event loop."""
+    redis = ThreadedRedis()
+    monkeypatch.setattr(restapi, "result_cache", VersionedCache(LRUCache(), redis=redis))
+    url = "/tx_info/NM_1/NC_1?alt_aln_method=splign"
+    assert client.get(url).status_code == 200
+    assert list(redis) == ["utarest:uta_stub:tx_info/NM_1/NC_1/splign"]
+    restapi.result_cache.local.clear()
+    assert client.get(url).json()["hgnc"] == "STUB"
+
+
+def test_conditional_get(client):
+    """A response's ETag answers 304 Not Modified; "*" matches only data that exist."""
+    url = "/tx_info/NM_1/NC_1?alt_aln_method=splign"
+    r = client.get(url)
+    assert r.status_code == 200
+    r = client.get(url, headers={"If-None-Match": r.headers["ETag"]})
+    assert r.status_code == 304 and r.content == b""
+    assert client.get(url, headers={"If-None-Match": "*"}).status_code == 304
+    assert client.get(url, headers={"If-None-Match": '"other"'}).status_code == 200
+    r = client.get("/tx_info/NM_2/NC_1?alt_aln_method=splign", headers={"If-None-Match": "*"})
+    assert r.status_code == 404
+
+
+def test_seq_range(client):
+    """A byte range of a sequence (or of a slice of it) is answered 206 with the bases in the range."""
+    seq = StubUTA.seq
+    headers = {"Accept": "text/plain"}
+    r = client.get("/seq/NC_1", headers={**headers, "Range": "bytes=2-5"})
+    assert r.status_code == 206
+    assert r.text == seq[2:6]
+    assert r.headers["Content-Range"] == "bytes 2-5/*"
+    r = client.get("/seq/NC_1", params={"start_i": 10, "end_i": 20}, headers={**headers, "Range": "bytes=2-"})
+    assert (r.status_code, r.text) == (206, seq[12:20])
+    assert r.headers["Content-Range"] == "bytes 2-9/*"
+
+
+def test_seq_suffix_range(client):
+    """A suffix range is answered with the last bases of the sequence, whose length is then known."""
+    seq = StubUTA.seq
+    r = client.get("/seq/NC_1", headers={"Accept": "text/plain", "Range": "bytes=-4"})
+    assert (r.status_code, r.text) == (206, seq[-4:])
+    assert r.headers["Content-Range"] == f"bytes {len(seq) - 4}-{len(seq) - 1}/{len(seq)}"
+
+
+def test_seq_unsatisfiable_range(client):
+    """Ranges past the end of a sequence are answered 416; malformed ranges are ignored."""
+    headers = {"Accept": "text/plain"}
+    for range_ in ("bytes=1000-1010", "bytes=-0"):
+        r = client.get("/seq/NC_1", headers={**headers, "Range": range_})
+        assert r.status_code == 416
+        assert r.headers["Content-Range"] == "bytes */*"
+    r = client.get("/seq/NC_1", headers={**headers, "Range": "bytes=5-2"})
+    assert (r.status_code, r.text) == (200, StubUTA.seq)
+    assert client.get("/seq/NC_2", headers={**headers, "Range": "bytes=0-1"}).status_code == 404
+
+
+def test_alignments_ndjson(client):
+    """Alignments are streamed as NDJSON from the connection's iterator, which is closed afterwards."""
+    r = client.get("/alignments/NC_1", headers={"Accept": "application/x-ndjson"})
+    assert r.status_code == 200
+    assert r.headers["Content-Type"].startswith("application/x-ndjson")
+    assert [json.loads(line)["tx_ac"] for line in r.text.splitlines()] == ["NM_1", "NM_2"]
+    assert restapi.conn.batches.closed
+    r = client.get("/alignments/NC_2", headers={"Accept": "application/x-ndjson"})
+    assert r.status_code == 404
+    assert r.json()["detail"] == "No alignments on NC_2"
+    assert restapi.conn.batches.closed
+
+
+def test_alignments_ndjson_closed_on_error(client, monkeypatch):
+    """The connection's iterator is closed if reading a batch from it fails."""
+    batches = Batches([[{"start_i": 10}], RuntimeError("connection lost")])
+    monkeypatch.setattr(restapi.conn, "iter_alignments_for_ac", lambda alt_ac, alt_aln_method=None: batches)
+    with pytest.raises(RuntimeError):
+        client.get("/alignments/NC_1", headers={"Accept": "application/x-ndjson"})
+    assert batches.closed
+
+
+def test_ndjson_stream_cancelled():
+    """The iterator is closed when the stream is cancelled partway, as it is when the client disconnects."""
+    reading = threading.Event()
+    batches = Batches([[{"start_i": 20}], reading, [{"start_i": 30}], [{"start_i": 40}]])
+    chunks = []
+
+    async def consume():
+        async for chunk in restapi.ndjson_stream(batches, [{"start_i": 10}]):
+            chunks.append(chunk)
+
+    async def run():
+        async with anyio.create_task_group() as tg:
+            tg.start_soon(consume)
+            while len(chunks) < 2:
+                await anyio.sleep(0.01)
+            # the stream is now reading the third batch on a worker thread
+            tg.cancel_scope.cancel()
+            reading.set()
+
+    asyncio.run(run())
+    assert chunks[:2] == [b'{"start_i":10}\n', b'{"start_i":20}\n'] and len(chunks) < 4
+    assert batches.closed
@@ -0,0 +1,279 @@
+import json
+import os
+import threading
+
+import pytest
+import requests
+from stub_support import PING, TX_INFO, StubAdapter, batch, query, reply
+
+import hgvs_dataproviders_rest.restclient as utarest
+from hgvs_dataproviders_rest.cache import SQLiteCache
+
+os.environ["UTAREST_URL"] = "http://127.0.0.1:8000"  # Used in utarest.connect()
+
+
+def test_session_per_thread():
+    """Each thread gets its own session, all sharing one connection pool."""
+    hdp = utarest.connect()
+    sessions = []
+    t = threading.Thread(target=lambda: sessions.append(hdp._session))
+    t.start()
+    t.join()
+    assert sessions[0] is not hdp._session
+    assert sessions[0].get_adapter(hdp.server) is hdp._session.get_adapter(hdp.server)
+    assert hdp._session is hdp._session
+
+
+@pytest.mark.vcr
+def test_tx_info_e():
+    """Queries go through the pooled session."""
+    hdp = utarest.connect()
+    r = hdp.get_tx_info("NM_199425.2", "NC_000020.10", "splign")
+    assert r["hgnc"] == "VSX1"
+
+
+def test_response_cache():
+    """Repeated queries are answered from the response cache."""
+    hdp = utarest.UTAREST("http://uta.test")
+    hdp._adapter = StubAdapter({"/ping": reply(PING), "/tx_info/NM_199425.2/NC_000020.10": reply(TX_INFO)})
+    # bypass the hgvs lru_cache wrapper to exercise the response cache
+    get_tx_info = hdp.get_tx_info.__wrapped__
+    r1 = get_tx_info("NM_199425.2", "NC_000020.10", "splign")
+    r2 = get_tx_info("NM_199425.2", "NC_000020.10", "splign")
+    assert r1 == r2 == TX_INFO
+    info = hdp.response_cache_info()
+    assert (info.hits, info.misses, info.entries) == (1, 1, 1)
+    assert hdp._adapter.paths() == ["/ping", "/tx_info/NM_199425.2/NC_000020.10"]
+
+
+def test_revalidation():
+    """Expired entries are revalidated with their ETag, and kept if the server answers 304."""
+    tx_info = {"hgnc": "VSX1", "tx_ac": "NM_199425.2", "alt_ac": "NC_000020.10", "alt_aln_method": "splign"}
+
+    def answer(request):
+        if request.headers.get("If-None-Match") == '"v1"':
+            return reply(b"", 304, {"ETag": '"v1"'})
+        return reply(tx_info, headers={"ETag": '"v1"'})
+
+    hdp = utarest.UTAREST("http://uta.test", cache_ttl=0)
+    hdp._adapter = StubAdapter({"/ping": reply(PING), "/tx_info/NM_199425.2/NC_000020.10": answer})
+    get_tx_info = hdp.get_tx_info.__wrapped__
+    r1 = get_tx_info("NM_199425.2", "NC_000020.10", "splign")
+    r2 = get_tx_info("NM_199425.2", "NC_000020.10", "splign")
+    assert r1 == r2 == tx_info
+    first, second = [r for r in hdp._adapter.requests if "/tx_info/" in r.url]
+    assert "If-None-Match" not in first.headers
+    assert second.headers["If-None-Match"] == '"v1"'
+
+
+def test_persistent_cache(tmp_path):
+    """A warm persistent cache file answers queries for a new client, also when opened read-only."""
+    path = str(tmp_path / "utarest.sqlite3")
+    routes = {"/ping": reply(PING), "/tx_info/NM_199425.2/NC_000020.10": reply(TX_INFO)}
+    hdp = utarest.UTAREST("http://uta.test", persistent_cache=SQLiteCache(path))
+    hdp._adapter = StubAdapter(routes)
+    r1 = hdp.get_tx_info("NM_199425.2", "NC_000020.10", "splign")
+    hdp = utarest.UTAREST("http://uta.test", persistent_cache=SQLiteCache(path, readonly=True))
+    hdp._adapter = StubAdapter(routes)
+    r2 = hdp.get_tx_info("NM_199425.2", "NC_000020.10", "splign")
+    assert r1 == r2 == TX_INFO
+    assert hdp.persistent_cache.hits == 1
+    assert hdp._adapter.paths() == ["/ping"]
+
+
+@pytest.mark.parametrize("gzip_min_size", [None, 0])
+def test_get_seq_text(gzip_min_size):
+    """Sequences are streamed as plain text, also when compressed, and slices may end at the end of a sequence."""
+    seq = "CTAACCCTAA" * 10
+
+    def answer(request):
+        params = query(request)
+        return reply(seq[int(params["start_i"]) : int(params["end_i"])], content_type="text/plain; charset=utf-8")
+
+    hdp = utarest.UTAREST("http://uta.test")
+    hdp._adapter = StubAdapter({"/ping": reply(PING), "/seq/NC_000007.13": answer}, gzip_min_size=gzip_min_size)
+    assert hdp.get_seq("NC_000007.13", 10, 60) == seq[10:60]
+    assert hdp.get_seq("NC_000007.13", 90, 120) == seq[90:]
+    assert hdp._adapter.requests[-1].headers["Accept"] == "text/plain, application/json"
+
+
+def test_get_tx_info_many():
+    """Bulk queries return per-key results and fill the cache for single queries."""
+    results = {"tx_info": {("NM_199425.2", "NC_000020.10", "splign"): TX_INFO}}
+    hdp = utarest.UTAREST("http://uta.test")
+    hdp._adapter = StubAdapter({"/ping": reply(PING), "/batch/tx_info": batch(results)})
+    r = hdp.get_tx_info_many([("NM_199425.2", "NC_000020.10", "splign"), ("NM_199425.2", "fake", "splign")])
+    assert r[0]["hgnc"] == "VSX1"
+    assert "No tx_info for" in r[1]["detail"]
+    assert hdp.get_tx_info("NM_199425.2", "NC_000020.10", "splign") == r[0]
+    assert hdp._adapter.paths() == ["/ping", "/batch/tx_info"]
+
+
+def test_prefetch():
+    """Prefetching fills the cache with bulk queries, so that single queries make no requests."""
+    tx_ac, alt_ac = "NM_199425.2", "NC_000020.10"
+    results = {
+        "tx_identity_info": {tx_ac: {"tx_ac": tx_ac, "alt_ac": tx_ac, "cds_start_i": 283, "hgnc": "VSX1"}},
+        "tx_mapping_options": {
+            tx_ac: [{"tx_ac": tx_ac, "alt_ac": alt_ac, "alt_aln_method": m} for m in ("blat", "splign")]
+        },
+        "tx_info": {(tx_ac, alt_ac, "splign"): {"hgnc": "VSX1", "cds_start_i": 283, "tx_ac": tx_ac}},
+        "tx_exons": {(tx_ac, alt_ac, "splign"): [{"tx_ac": tx_ac, "ord": i} for i in range(3)]},
+    }
+
+    hdp = utarest.UTAREST("http://uta.test")
+    hdp._adapter = StubAdapter({"/ping": reply(PING), **{"/batch/" + e: batch(results) for e in results}})
+    alignments = hdp.prefetch(tx_acs=[tx_ac], alt_aln_method="splign")
+    assert alignments == [(tx_ac, alt_ac, "splign")]
+    assert sorted(hdp._adapter.paths()) == ["/batch/" + e for e in sorted(results)] + ["/ping"]
+    assert hdp.get_tx_identity_info(tx_ac)["hgnc"] == "VSX1"
+    assert len(hdp.get_tx_mapping_options(tx_ac)) == 2
+    assert hdp.get_tx_info(tx_ac, alt_ac, "splign")["cds_start_i"] == 283
+    assert len(hdp.get_tx_exons(tx_ac, alt_ac, "splign")) == 3
+    # answered from the cache
+    assert len(hdp._adapter.requests) == 5
+
+
+def test_region_index():
+    """With region_index, region queries on a reference sequence are answered locally after one streamed request."""
+    alignment = {
+        "tx_ac": "NM_199425.2",
+        "alt_ac": "NC_000020.10",
+        "alt_strand": -1,
+        "alt_aln_method": "splign",
+        "start_i": 25059178,
+        "end_i": 25063015,
+    }
+    ndjson = reply(json.dumps(alignment) + "\n", content_type="application/x-ndjson")
+    hdp = utarest.UTAREST("http://uta.test", region_index=True)
+    hdp._adapter = StubAdapter({"/ping": reply(PING), "/alignments/NC_000020.10": ndjson})
+    r = hdp.get_tx_for_region("NC_000020.10", "splign", 25060000, 25060100)
+    assert [t["tx_ac"] for t in r] == ["NM_199425.2"]
+    assert hdp.get_alignments_for_region("NC_000020.10", 25059000, 25060100) == []
+    assert hdp.get_tx_for_region("NC_000020.10", "blat", 25060000, 25060100) == []
+    assert hdp._adapter.paths() == ["/ping", "/alignments/NC_000020.10"]
+    assert hdp._adapter.requests[1].headers["Accept"].startswith("application/x-ndjson")
+
+
+@pytest.mark.parametrize("status_code", [404, 405])
+def test_region_index_unsupported(status_code):
+    """Servers that cannot list alignments are remembered as having no region index."""
+    hdp = utarest.UTAREST("http://uta.test", region_index=True)
+    hdp._adapter = StubAdapter({"/alignments/NC_1": reply({"detail": "Not Found"}, status_code)})
+    assert hdp._region_index("NC_1") is None
+    assert hdp._region_indexes == {"NC_1": None}
+
+
+def test_region_index_error():
+    """Other errors listing alignments are raised, and the region index is loaded again on next use."""
+    hdp = utarest.UTAREST("http://uta.test", region_index=True)
+    hdp._adapter = StubAdapter({"/alignments/NC_1": reply({"detail": "Internal Server Error"}, 500)})
+    with pytest.raises(requests.HTTPError):
+        hdp._region_index("NC_1")
+    assert hdp._region_indexes == {}
+
+
+def test_acs_for_protein_seq_digest():
+    """Protein sequences are looked up by their MD5 digest, singly and in bulk."""
+    digest = "cfed2207f5a85c361e441ab4088ea98f"  # of MRAKWRKKRMRRLKRKRRKMRQRSK
+    known = {digest: ["NP_001030344.1", "NP_066927.1"]}
+
+    def acs(md5):
+        return known.get(md5, []) + ["MD5_" + md5]
+
+    hdp = utarest.UTAREST("http://uta.test")
+    hdp._adapter = StubAdapter(
+        {
+            "/ping": reply(PING),
+            "/acs_for_protein_md5/" + digest: reply(acs(digest)),
+            "/batch/acs_for_protein_md5": lambda request: reply(
+                [{"status_code": 200, "body": acs(md5)} for md5 in json.loads(request.body)]
+            ),
+        }
+    )
+    r = hdp.get_acs_for_protein_seq("MRAKWRKKRMRRLKRKRRKMRQRSK")
+    assert r == ["NP_001030344.1", "NP_066927.1", "MD5_" + digest]
+    r = hdp.get_acs_for_protein_seq_many(["MRAKWRKKRMRRLKRKRRKMRQRSK", "123", "fake"])
+    assert r[0][-1] == "MD5_" + digest
+    assert "Normalized sequence contains non-alphabetic characters" in r[1]["detail"]
+    assert r[2] == ["MD5_7805ea2e3b92c8d2640b68df01591127"]
+    # the cached digest and the invalid sequence are not sent
+    assert json.loads(hdp._adapter.requests[-1].body) == ["7805ea2e3b92c8d2640b68df01591127"]
+
+
+def test_tracing():
+    """Queries run in spans that record whether the response cache answered them."""
+    sdk_trace = pytest.importorskip("opentelemetry.sdk.trace")
+    from opentelemetry import trace
+    from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+    from opentelemetry.sdk.trace.export.in_memory_span_exporter import (
+        InMemorySpanExporter,
+    )
+
+    exporter = InMemorySpanExporter()
+    provider = sdk_trace.TracerProvider()
+    provider.add_span_processor(SimpleSpanProcessor(exporter))
+    trace.set_tracer_provider(provider)
+    hdp = utarest.UTAREST("http://uta.test")
+    hdp._adapter = StubAdapter({"/ping": reply(PING), "/tx_info/NM_199425.2/NC_000020.10": reply(TX_INFO)})
+    get_tx_info = hdp.get_tx_info.__wrapped__
+    get_tx_info("NM_199425.2", "NC_000020.10", "splign")
+    get_tx_info("NM_199425.2", "NC_000020.10", "splign")
+    spans = exporter.get_finished_spans()
+    assert [s.name for s in spans] == ["utarest.get_tx_info"] * 2
+    assert spans[0].attributes["utarest.args"] == ("NM_199425.2", "NC_000020.10", "splign")
+    assert [s.attributes["utarest.cache"] for s in spans] == ["miss", "hit"]
+
+
+def test_lazy_ping(tmp_path):
+    """The server is pinged on first use, not on construction; clients sharing a cache reuse its ping."""
+    cache = SQLiteCache(str(tmp_path / "cache.sqlite"))
+    hdp = utarest.UTAREST("http://uta.test", persistent_cache=cache, ping_ttl=3600)
+    hdp._adapter = StubAdapter({"/ping": reply(PING)})
+    assert hdp._adapter.requests == []
+    assert hdp.schema_version() == "1.1"
+    assert hdp._adapter.paths() == ["/ping"]
+    hdp = utarest.UTAREST("http://uta.test", persistent_cache=cache, ping_ttl=3600)
+    hdp._adapter = StubAdapter({"/ping": reply(PING)})
+    assert hdp.data_version() == "uta_20180821"
+    assert hdp._adapter.requests == []
+
+
+def test_ping_ttl(monkeypatch):
+    """Once ping_ttl has passed, the server is pinged again for its versions."""
+    now = [0.0]
+    monkeypatch.setattr(utarest.time, "monotonic", lambda: now[0])
+    hdp = utarest.UTAREST("http://uta.test", ping_ttl=60)
+    hdp._adapter = StubAdapter({"/ping": reply({"data_version": "uta_1", "schema_version": "1.1"})})
+    assert hdp.data_version() == "uta_1"
+    hdp._adapter.routes["/ping"] = reply({"data_version": "uta_2", "schema_version": "1.1"})
+    now[0] = 59.0
+    assert hdp.data_version() == "uta_1"
+    now[0] = 61.0
+    assert hdp.data_version() == "uta_2"
+    assert hdp.schema_version() == "1.1"
+    assert hdp._adapter.paths() == ["/ping", "/ping"]
+
+
+def test_new_release(monkeypatch):
+    """Queries made once ping_ttl has passed answer from a new data release, not from memos of the previous one."""
+    now = [0.0]
+    monkeypatch.setattr(utarest.time, "monotonic", lambda: now[0])
+    release = ["uta_1"]
+    hdp = utarest.UTAREST("http://uta.test", ping_ttl=60, region_index=True)
+    hdp._adapter = StubAdapter(
+        {
+            "/ping": lambda request: reply({"data_version": release[0], "schema_version": "1.1"}),
+            "/gene_info/VHL": lambda request: reply({"hgnc": "VHL", "release": release[0]}),
+            "/alignments/NC_1": lambda request: reply([{"tx_ac": release[0], "start_i": 0, "end_i": 10}]),
+        }
+    )
+    assert hdp.get_gene_info("VHL")["release"] == "uta_1"
+    assert hdp._region_index("NC_1") is not None
+    release[0] = "uta_2"
+    now[0] = 59.0
+    assert hdp.get_gene_info("VHL")["release"] == "uta_1"
+    now[0] = 61.0
+    assert hdp.get_gene_info("VHL")["release"] == "uta_2"
+    assert hdp.data_version() == "uta_2"
+    assert hdp._region_indexes == {}
@@ -0,0 +1,66 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from hgvs.exceptions import HGVSDataNotAvailableError
+
+from hgvs_dataproviders_rest.cache import LRUCache
+from hgvs_dataproviders_rest.seqproxy import SequenceProxy
+
+SEQ = "ACGTTGCA" * 1000
+
+
+class Fetcher:
+    """fetches slices of SEQ and records the requested ranges"""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, ac, start_i, end_i):
+        self.calls.append((start_i, end_i))
+        return SEQ[start_i:end_i] if ac == "NC_1" else {"detail": "Failed to fetch " + ac}
+
+
+def test_seq_proxy_slices():
+    """Slices and indices behave as for a str, and only the covering blocks are fetched."""
+    fetch = Fetcher()
+    p = SequenceProxy("NC_1", fetch, LRUCache(), block_size=100)
+    assert p[150:260] == SEQ[150:260]
+    assert fetch.calls == [(100, 200), (200, 300)]
+    assert p[7] == SEQ[7]
+    assert len(p) == len(SEQ)
+    assert p[-5:] == SEQ[-5:]
+    assert p[7990:] == SEQ[7990:]
+    assert p[::1000] == SEQ[::1000]
+    assert str(p) == SEQ
+    with pytest.raises(IndexError):
+        p[len(SEQ)]
+
+
+def test_seq_proxy_block_cache():
+    """Blocks are cached up to the cache bounds, so memory stays flat."""
+    fetch = Fetcher()
+    blocks = LRUCache(max_entries=4)
+    p = SequenceProxy("NC_1", fetch, blocks, block_size=100)
+    for i in range(0, len(SEQ), 50):
+        assert p[i : i + 50] == SEQ[i : i + 50]
+    assert len(fetch.calls) == len(SEQ) // 100
+    assert len(blocks) == 4
+    p[7950:8000]
+    assert len(fetch.calls) == len(SEQ) // 100
+
+
+def test_seq_proxy_prefetch():
+    """Reading blocks in order prefetches the next block."""
+    fetch = Fetcher()
+    with ThreadPoolExecutor(1) as executor:
+        p = SequenceProxy("NC_1", fetch, LRUCache(), block_size=100, executor=executor)
+        p[0:200]
+    assert (200, 300) in fetch.calls
+    assert p[200:300] == SEQ[200:300]
+    assert len(fetch.calls) == 3
+
+
+def test_seq_proxy_not_found():
+    p = SequenceProxy("fake", Fetcher(), LRUCache(), block_size=100)
+    with pytest.raises(HGVSDataNotAvailableError):
+        p[0:10]
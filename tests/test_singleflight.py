@@ -0,0 +1,63 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from hgvs_dataproviders_rest.singleflight import AsyncSingleFlight, SingleFlight
+
+
+def test_single_flight_threads():
+    """Concurrent identical calls share one call and its result; errors are shared too."""
+    flights = SingleFlight()
+    calls = []
+
+    def lookup(key):
+        calls.append(key)
+        time.sleep(0.2)
+        if key == "fake":
+            raise KeyError(key)
+        return {"key": key}
+
+    results, errors = [], []
+
+    def worker(key):
+        try:
+            results.append(flights.do(key, lookup, key))
+        except KeyError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(k,)) for k in ["VHL"] * 8 + ["fake"] * 4]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sorted(calls) == ["VHL", "fake"]
+    assert results == [{"key": "VHL"}] * 8
+    assert len(errors) == 4
+    assert (flights.calls, flights.shared) == (12, 10)
+    flights.do("VHL", lookup, "VHL")
+    assert len(calls) == 3
+
+
+def test_single_flight_asyncio():
+    """Concurrent identical coroutines share one call, which survives cancellation of a caller."""
+    flights = AsyncSingleFlight()
+    calls = []
+
+    async def lookup(key):
+        calls.append(key)
+        await asyncio.sleep(0.1)
+        return key.upper()
+
+    async def run():
+        first = asyncio.ensure_future(flights.do("vhl", lookup, "vhl"))
+        await asyncio.sleep(0)
+        rest = [asyncio.ensure_future(flights.do("vhl", lookup, "vhl")) for _ in range(4)]
+        first.cancel()
+        assert await asyncio.gather(*rest) == ["VHL"] * 4
+        with pytest.raises(asyncio.CancelledError):
+            await first
+
+    asyncio.run(run())
+    assert calls == ["vhl"]